@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Any
+from typing import Any, Sequence
 
 
 def parse_storm_datetime(item: Any) -> datetime | None:
@@ -54,3 +54,26 @@ def dss_filename(storm_start: datetime, rank: int, storm_duration: Any) -> str:
     """
     date_str = storm_start.strftime("%Y%m%d")
     return f"{date_str}_{storm_duration}hr_st1_r{rank:03d}.dss"
+
+
+def storm_durations(attrs: dict[str, Any]) -> list[int]:
+    """Storm durations in hours from the ``storm_duration`` attribute.
+
+    One duration (``"72"``) or a comma-separated list (``"24,48,72,96"``);
+    process-storms builds one collection per duration. Sorted, without
+    repeats; 72 when unset.
+    """
+    raw = attrs.get("storm_duration") or "72"
+    return sorted({int(d) for d in raw.split(",")})
+
+
+def storm_key(rank: int, storm_duration: int, durations: Sequence[int]) -> str:
+    """Checkpoint key for a storm.
+
+    A single-duration run keys storms by rank. Every collection of a
+    multi-duration run has its own ranks from 1, so there the duration is
+    part of the key.
+    """
+    if len(durations) == 1:
+        return str(rank)
+    return f"{storm_duration}hr/{rank}"
@@ -0,0 +1,212 @@
+"""Coarse-to-fine storm search with the result of an hourly scan.
+
+``check_every_n_hours`` trades missed peaks (a large step) against scanning
+every hour (24 times the cost of a daily step). With ``adaptive_search:
+"true"`` the cumulative-sum engine returns exactly the top-N of a
+``check_every_n_hours: "1"`` scan (up to stormhub's order among tied means),
+while scoring only a fraction of its windows. ``check_every_n_hours`` becomes the coarse stride ``S``.
+
+The hourly start times are cut into strides of ``S`` consecutive hours
+(aligned to the last one, so no stride reads past the scan's data). For the
+first start ``s`` of each stride the coarse pass scores two windows from the
+same load: the storm window itself, a real candidate, and the window
+``(s, s + S - 1 + duration]``, which holds every window of the stride.
+Precipitation is non-negative, so at every transposition a window's mean is
+at most the covering window's, and that covering score bounds the whole
+stride (``BOUND_SLACK`` absorbs the 2-decimal rounding of both).
+
+The final ranking never looks past its N-th storm, whose mean ``T`` is at
+least the smallest of any N scored windows more than ``2h`` apart (``h`` the
+declustering span; ``cutoff``): each such window is either accepted or blocked
+by a different accepted storm ranked above it. Strides whose bound is below
+that cutoff cannot reach the top-N and are never refined; every other stride
+is scored hourly. The stride holding the latest candidate over the threshold
+is always refined too, because stormhub drops windows ending after it.
+Ranking and item creation then run over ``storm-stats.csv`` as usual.
+
+The covering scores are storm-stats rows of a ``duration + S - 1`` hour
+window; they are kept in ``bounds-<hours>hr.csv`` in the cache dir (or read
+from that duration's own ``storm-stats.csv`` when it is also scanned), so a
+resumed run does not recompute them.
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Iterable, Mapping, Sequence
+
+from actions import cumsum_search, stats_index
+from actions.storm_stream import RANK_BUFFER_HOURS, StormStat
+from worker_pool import SharedPool
+
+log = logging.getLogger(__name__)
+
+# Inches. A window's mean is at most its bound plus one unit of the 2-decimal
+# storm-stats rounding; strides are pruned only below the cutoff by more.
+BOUND_SLACK = 0.015
+
+
+def enabled(payload: Any) -> bool:
+    """True when the payload asks for the coarse-to-fine search."""
+    return payload.attributes.get("adaptive_search", "").lower() == "true"
+
+
+def strides(plan: Sequence[datetime], stride: int) -> list[Sequence[datetime]]:
+    """``plan`` in runs of ``stride`` start times, the first run short."""
+    head = len(plan) % stride
+    runs = [plan[:head]] if head else []
+    return runs + [plan[i : i + stride] for i in range(head, len(plan), stride)]
+
+
+def cutoff(
+    rows: Iterable[StormStat],
+    storm_duration: int,
+    top_n: int,
+    min_precip_threshold: float,
+) -> float:
+    """A mean the final N-th storm is sure to reach, from scored ``rows``.
+
+    Greedily picks the highest windows more than ``2h`` apart that stormhub
+    cannot drop for ending after the latest candidate; with ``top_n`` of
+    them, the last one's mean. Otherwise the threshold.
+    """
+    h = timedelta(hours=storm_duration + RANK_BUFFER_HOURS)
+    over = [row for row in rows if row.mean >= min_precip_threshold]
+    if not over:
+        return min_precip_threshold
+    latest = max(row.storm_date for row in over)
+    picked: list[datetime] = []  # sorted
+    for row in sorted(over, key=lambda r: (-r.mean, r.storm_date)):
+        start = row.storm_date
+        if start + h >= latest:
+            continue
+        i = bisect.bisect_right(picked, start - 2 * h)
+        if i < len(picked) and picked[i] <= start + 2 * h:
+            continue
+        bisect.insort(picked, start)
+        if len(picked) == top_n:
+            return max(row.mean, min_precip_threshold)
+    return min_precip_threshold
+
+
+def _read(path: Path) -> dict[datetime, StormStat]:
+    return stats_index.csv_rows(path) if path.exists() else {}
+
+
+def search(
+    catalog: Any,
+    plan: Sequence[datetime],
+    stats_csvs: Mapping[int, Path],
+    bounds_dir: Path,
+    stride: int,
+    top_n: int,
+    min_precip_threshold: float,
+    pool: SharedPool,
+    workers: int,
+    cube_root: Path | None = None,
+) -> dict[int, list[datetime]]:
+    """Score every start time of the hourly ``plan`` that could change the
+    top-N of each duration in ``stats_csvs``; returns, by duration, the
+    start times now in its ``storm-stats.csv``. ``cube_root`` is passed on
+    to ``cumsum_search.search``."""
+    runs = strides(plan, stride)
+    coarse = [run[0] for run in runs]
+    # The covering window of a duration is the window of a longer one; when
+    # that one is also scanned, its own storm-stats.csv holds the bounds.
+    bound_csvs = {}
+    for d in stats_csvs:
+        hours = d + stride - 1
+        bound_csvs[d] = stats_csvs.get(hours, bounds_dir / f"bounds-{hours}hr.csv")
+    # Start times handed to the engine, scored or not: a window without a
+    # valid transposition never gets a row and must not be retried.
+    tried: dict[int, set[datetime]] = {d: set() for d in stats_csvs}
+
+    targets: dict[int, set[datetime]] = {}
+    csvs: dict[int, Path] = dict(stats_csvs)
+    for d, path in stats_csvs.items():
+        targets.setdefault(d, set()).update(set(coarse) - _read(path).keys())
+    for d, path in bound_csvs.items():
+        key = d + stride - 1
+        targets.setdefault(key, set()).update(set(coarse) - _read(path).keys())
+        csvs.setdefault(key, path)
+    _score(catalog, targets, csvs, pool, workers, cube_root)
+    for d in stats_csvs:
+        tried[d].update(coarse)
+
+    bounds = {d: _read(path) for d, path in bound_csvs.items()}
+    targets = {}
+    for d, path in stats_csvs.items():
+        rows = _read(path)
+        cut = cutoff(rows.values(), d, top_n, min_precip_threshold) - BOUND_SLACK
+        kept = [
+            run for run in runs if run[0] in bounds[d] and bounds[d][run[0]].mean >= cut
+        ]
+        refine = {start for run in kept for start in run}
+        targets[d] = refine - rows.keys() - tried[d]
+        tried[d].update(refine)
+        log.info(
+            "Adaptive %dh search: %d of %d stride(s) can reach the top-N "
+            "(cutoff %.2f in)",
+            d,
+            len(kept),
+            len(runs),
+            cut + BOUND_SLACK,
+        )
+    _score(catalog, targets, stats_csvs, pool, workers, cube_root)
+
+    # The latest candidate over the threshold decides which windows stormhub
+    # drops at the end of the period: score strides back from the end until
+    # it is known.
+    while True:
+        targets = {}
+        for d, path in stats_csvs.items():
+            rows = _read(path)
+            for run in reversed(runs):
+                bound = bounds[d].get(run[0])
+                if bound is None or bound.mean < min_precip_threshold - BOUND_SLACK:
+                    continue
+                missing = set(run) - rows.keys() - tried[d]
+                if missing:
+                    targets[d] = missing
+                    tried[d].update(missing)
+                    break
+                if any(rows[s].mean >= min_precip_threshold for s in run if s in rows):
+                    break
+        if not targets:
+            break
+        _score(catalog, targets, stats_csvs, pool, workers, cube_root)
+
+    scored = {}
+    for d, path in stats_csvs.items():
+        rows = _read(path)
+        scored[d] = [start for start in plan if start in rows]
+        log.info(
+            "Adaptive %dh search: %d of %d hourly windows scored",
+            d,
+            len(scored[d]),
+            len(plan),
+        )
+    return scored
+
+
+def _score(
+    catalog: Any,
+    targets: Mapping[int, set[datetime]],
+    stats_csvs: Mapping[int, Path],
+    pool: SharedPool,
+    workers: int,
+    cube_root: Path | None,
+) -> None:
+    dates = {d: sorted(starts) for d, starts in targets.items() if starts}
+    if dates:
+        cumsum_search.search(
+            catalog,
+            dates,
+            {d: stats_csvs[d] for d in dates},
+            pool,
+            workers,
+            cube_root=cube_root,
+        )
@@ -1,7 +1,8 @@
 """Pre-flight: verify every year in the payload's date range is mirrored.
 
-Before kicking off process-storms (which can take 10+ minutes), HEAD each
-year's ``.zmetadata`` in the AORC cache. If any year is missing, raise
+Before kicking off process-storms (which can take 10+ minutes), read each
+year's ``.zmetadata`` in the AORC cache (through ``aorc_store``, which keeps
+it for prefetch-aorc and the scan). If any year is missing, raise
 with a clear "mirror these years first" message — failing in seconds
 instead of mid-scan with a cryptic xarray/zarr ``KeyError: '.zmetadata'``.
 
@@ -24,6 +25,8 @@ import os
 from typing import Iterable
 from urllib.parse import urlparse
 
+import aorc_store
+
 log = logging.getLogger(__name__)
 
 
@@ -63,47 +66,36 @@ def verify_aorc_cache_years(
             base,
         )
         return []
-    bucket = parsed.netloc
-    prefix = parsed.path.lstrip("/").rstrip("/")
 
     try:
-        import boto3
+        aorc_store.filesystem()
     except ImportError:
-        log.warning("AORC pre-flight: boto3 unavailable — skipping cache check")
+        log.warning("AORC pre-flight: s3fs/stormhub unavailable — skipping cache check")
         return []
 
-    client_kwargs: dict = {"region_name": "us-east-1"}
-    endpoint = os.environ.get("AORC_S3_ENDPOINT")
-    if endpoint:
-        client_kwargs["endpoint_url"] = endpoint
-    key = os.environ.get("AORC_S3_KEY")
-    secret = os.environ.get("AORC_S3_SECRET")
-    if key and secret:
-        client_kwargs["aws_access_key_id"] = key
-        client_kwargs["aws_secret_access_key"] = secret
-
-    s3 = boto3.client("s3", **client_kwargs)
-
     missing: list[int] = []
     for y in years:
-        key_path = f"{prefix}/{y}.zarr/.zmetadata" if prefix else f"{y}.zarr/.zmetadata"
-        try:
-            s3.head_object(Bucket=bucket, Key=key_path)
-        except Exception as e:
-            # Treat any failure (NoSuchKey, AccessDenied, transient 5xx) as
-            # "year not available". The downstream scan will produce the
-            # more specific error if we're wrong about access.
-            log.info(
-                "AORC pre-flight: %s missing from s3://%s/%s (%s)",
-                y,
-                bucket,
-                prefix,
-                type(e).__name__,
-            )
+        # Any failure (NoSuchKey, AccessDenied, transient 5xx) reads as "year
+        # not available"; the downstream scan will produce the more specific
+        # error if we're wrong about access.
+        if aorc_store.consolidated_metadata(y, base) is None:
+            log.info("AORC pre-flight: %s missing from %s", y, base)
             missing.append(y)
     return missing
 
 
+def window_years(
+    starts: Iterable[datetime.datetime], storm_duration_hours: int
+) -> list[int]:
+    """Years whose AORC zarrs the windows starting at ``starts`` read — for
+    a ``specific_dates`` run, instead of every year of the date range."""
+    years: set[int] = set()
+    for start in starts:
+        last = start + datetime.timedelta(hours=storm_duration_hours)
+        years.update(range(start.year, last.year + 1))
+    return sorted(years)
+
+
 def assert_years_available(
     start_date: str, end_date: str | None, storm_duration_hours: int = 0
 ) -> None:
@@ -111,7 +103,11 @@ def assert_years_available(
 
     Logs a clear remediation hint pointing at ``./run.py mirror``.
     """
-    years = required_years(start_date, end_date, storm_duration_hours)
+    assert_years_mirrored(required_years(start_date, end_date, storm_duration_hours))
+
+
+def assert_years_mirrored(years: list[int]) -> None:
+    """Raise RuntimeError if any of ``years`` is unmirrored."""
     if not years:
         return
     missing = verify_aorc_cache_years(years)
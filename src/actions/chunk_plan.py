@@ -0,0 +1,119 @@
+"""Split search windows and DSS storms into tasks along AORC's chunk grid.
+
+A yearly AORC store chunks ``APCP_surface`` (and ``TMP_2maboveground``) in
+runs of hours. Every task reads the whole transposition domain, so only the
+time chunking decides which tasks share data. Splitting the search into
+blocks of ``SEARCH_BLOCK_HOURS`` counted from the first start time, and the
+conversion into one task per storm, put the same chunks in several tasks on
+different workers, each fetching and decompressing them again.
+
+``ChunkGrid`` reads the time chunk length of each year's store from its
+consolidated metadata, and where its time axis starts. With it:
+
+* ``search_blocks`` cuts the storm search at chunk boundaries: a block holds
+  the windows starting in a whole run of chunks (about ``block_hours``), so
+  two blocks share only the ``storm_duration`` hours a window reads past its
+  block's last chunk;
+* ``group_by_chunks`` puts storms whose hours share a chunk into one task,
+  in time order, so one worker converts them back to back from the chunks it
+  just read.
+"""
+
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, Mapping, NamedTuple, Sequence
+
+import aorc_store
+from actions.prefetch_aorc import APCP_VARIABLE
+
+log = logging.getLogger(__name__)
+
+HOUR = timedelta(hours=1)
+
+
+class YearChunks(NamedTuple):
+    """Time chunking of one year's store."""
+
+    origin: datetime  # the store's first hour
+    hours: int  # hours per chunk
+
+
+class ChunkGrid:
+    """Time chunks of the AORC yearly stores, by year."""
+
+    def __init__(self, years: Mapping[int, YearChunks]) -> None:
+        self.years = dict(years)
+
+    def chunk(self, hour: datetime) -> tuple[int, int]:
+        """``(year, chunk index)`` of the chunk holding ``hour``."""
+        origin, hours = self.years[hour.year]
+        return hour.year, max(0, (hour - origin) // HOUR) // hours
+
+    def span(
+        self, first: datetime, last: datetime
+    ) -> tuple[tuple[int, int], tuple[int, int]]:
+        """First and last chunk of the hours ``[first, last]``."""
+        return self.chunk(first), self.chunk(last)
+
+    def run(self, hour: datetime, block_hours: int) -> tuple[int, int]:
+        """The run of whole chunks, about ``block_hours`` long, holding
+        ``hour``."""
+        year, index = self.chunk(hour)
+        per_run = max(1, round(block_hours / self.years[year].hours))
+        return year, index // per_run
+
+
+def load(years: Iterable[int]) -> ChunkGrid | None:
+    """The grid of ``years``' stores; None when one cannot be read."""
+    grid = {}
+    for year in sorted(set(years)):
+        try:
+            metadata = aorc_store.consolidated_metadata(year)
+            if metadata is None:
+                return None
+            dims = metadata[f"{APCP_VARIABLE}/.zattrs"]["_ARRAY_DIMENSIONS"]
+            chunks = metadata[f"{APCP_VARIABLE}/.zarray"]["chunks"]
+            first = aorc_store.open_year(year)["time"].values[0]
+            origin = datetime.fromisoformat(str(first)[:19])
+        except Exception as e:  # offline, or a store laid out differently
+            log.info("No AORC chunk grid for %d (%s)", year, type(e).__name__)
+            return None
+        grid[year] = YearChunks(origin, int(chunks[dims.index("time")]))
+    return ChunkGrid(grid)
+
+
+def search_blocks(
+    dates: Sequence[datetime], grid: ChunkGrid, block_hours: int
+) -> list[list[datetime]]:
+    """Candidate start times grouped by the chunk run their first hour is in."""
+    blocks: list[list[datetime]] = []
+    key = None
+    for date in sorted(dates):
+        run = grid.run(date + HOUR, block_hours)
+        if blocks and run == key:
+            blocks[-1].append(date)
+        else:
+            blocks.append([date])
+            key = run
+    return blocks
+
+
+def group_by_chunks(
+    spans: Sequence[tuple[datetime, datetime]], grid: ChunkGrid, max_size: int
+) -> list[list[int]]:
+    """Indices of ``spans`` (first and last hour read) grouped so spans
+    reading a common chunk share a group, in time order, at most
+    ``max_size`` to a group."""
+    groups: list[list[int]] = []
+    reach = None  # last chunk of the current group
+    for i in sorted(range(len(spans)), key=lambda i: spans[i]):
+        first, last = grid.span(*spans[i])
+        if groups and first <= reach and len(groups[-1]) < max_size:
+            groups[-1].append(i)
+            reach = max(reach, last)
+        else:
+            groups.append([i])
+            reach = last
+    return groups
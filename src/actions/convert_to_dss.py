@@ -2,25 +2,90 @@
 
 from __future__ import annotations
 
+import functools
+import json
 import logging
-import multiprocessing
+import math
 import os
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from datetime import datetime
+import shutil
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Callable, Optional
 
-from actions import dss_filename, parse_storm_datetime, storm_rank
-from worker_sizing import resolve_num_workers
+from actions import (
+    aorc_preflight,
+    chunk_plan,
+    dss_filename,
+    parse_storm_datetime,
+    previous_run,
+    shared_cube,
+    shg_regrid,
+    stats_index,
+    storm_key,
+    storm_rank,
+)
+from checkpoint import Checkpoint
+from worker_pool import SharedPool
 
 log = logging.getLogger(__name__)
 
 # If every storm fails, that's an error. Allow up to this fraction to fail.
 MAX_FAILURE_RATIO = float(os.environ.get("DSS_MAX_FAILURE_RATIO", "0.5"))
-DSS_WORKERS = int(os.environ.get("DSS_WORKERS", "0"))  # 0 = auto (cpu_count)
+DSS_WORKERS = int(os.environ.get("DSS_WORKERS", "0"))  # 0 = whole shared pool
 # HEC SHG output grid resolution for the DSS grids; AORC → SHG 4 km is standard.
 # stormhub 0.5.0's noaa_zarr_to_dss requires this explicitly (no default upstream).
 DSS_OUTPUT_RESOLUTION_KM = int(os.environ.get("DSS_OUTPUT_RESOLUTION_KM", "4"))
+# DSS files are written here (beside their final directory, so the rename is
+# atomic) and only moved into place once HecDss has closed them.
+PARTIAL_DIRNAME = ".partial"
+# Output-dir file mapping each converted storm (duration and start) to its DSS
+# file, so a later run can reuse the file whatever rank the storm gets there,
+# as long as it writes the same catalog, domain and resolution.
+DSS_MANIFEST = "dss-manifest.json"
+# Most storms one task converts back to back when they share AORC chunks.
+DSS_GROUP_MAX = int(os.environ.get("DSS_GROUP_MAX", "8"))
+# Storms of a task are converted from one load of their union time range, as
+# long as it spans at most this many times the longest storm of the batch.
+DSS_BATCH_SPAN = float(os.environ.get("DSS_BATCH_SPAN", "2"))
+
+
+def manifest_key(storm_start: datetime, storm_duration: int) -> str:
+    """A storm's key in ``DSS_MANIFEST``: what its DSS content depends on
+    besides the ``manifest_header``."""
+    return f"{storm_duration}hr/{storm_start:%Y-%m-%dT%H}"
+
+
+def manifest_header(catalog_id: str, transposition_file: str) -> dict[str, Any]:
+    """What every DSS file of a run depends on besides the storm: the catalog
+    (the DSS pathname's B part), the transposition domain the AORC data is
+    clipped to, and the SHG resolution."""
+    return {
+        "catalog_id": catalog_id,
+        "resolution_km": DSS_OUTPUT_RESOLUTION_KM,
+        "geometry": stats_index.geometry_key(transposition_file),
+    }
+
+
+def _build_dss(output_path: str, write: Callable[[str], None]) -> Optional[str]:
+    """Run ``write`` on a partial file and move it to ``output_path``.
+    Returns error message on failure, None on success.
+
+    The file is built under ``PARTIAL_DIRNAME`` and renamed to ``output_path``
+    only when complete, so a killed worker never leaves a truncated DSS file
+    where resume or create-grid-file would mistake it for a finished one.
+    """
+    target = Path(output_path)
+    partial = target.parent / PARTIAL_DIRNAME / target.name
+    partial.parent.mkdir(parents=True, exist_ok=True)
+    # HecDss appends to an existing file; never build on a previous attempt.
+    partial.unlink(missing_ok=True)
+    try:
+        write(str(partial))
+        os.replace(partial, target)
+        return None
+    except Exception as e:
+        partial.unlink(missing_ok=True)
+        return str(e)
 
 
 def _convert_single_storm(
@@ -32,33 +97,189 @@ def _convert_single_storm(
 ) -> Optional[str]:
     """Convert one storm to DSS. Returns error message on failure, None on success.
 
-    Runs in a subprocess via ProcessPoolExecutor, so all args must be picklable.
+    Runs in a worker of the shared pool, so all args must be picklable.
+    """
+    return _convert_storm_batch(
+        [(output_path, transposition_file, catalog_id, storm_start_iso, storm_duration)]
+    )[0]
+
+
+def _load_aorc(transposition_file: str, first: datetime, last: datetime) -> Any:
+    """APCP and TMP for the hours ``[first, last]``, clipped to the
+    transposition domain as ``noaa_zarr_to_dss`` clips them, in memory."""
+    import geopandas as gpd
+    from stormhub.met.zarr_to_dss import (
+        NOAADataVariable,
+        get_aorc_paths,
+        get_s3_zarr_data,
+    )
+
+    return get_s3_zarr_data(
+        get_aorc_paths(first, last),
+        gpd.read_file(transposition_file),
+        first,
+        last,
+        [NOAADataVariable.APCP.value, NOAADataVariable.TMP.value],
+    ).load()
+
+
+def _write_storm(
+    path: str,
+    aorc_data: Any,
+    imap: shg_regrid.IndexMap,
+    catalog_id: str,
+    storm_start: datetime,
+    storm_duration: int,
+) -> None:
+    """Write what ``noaa_zarr_to_dss`` writes for one storm, from
+    ``aorc_data`` already loaded and clipped to the transposition domain."""
+    from stormhub.met.zarr_to_dss import NOAADataVariable, convert_temperature_dataset
+
+    window = slice(
+        storm_start + timedelta(hours=1), storm_start + timedelta(hours=storm_duration)
+    )
+    for variable in (NOAADataVariable.APCP, NOAADataVariable.TMP):
+        data = aorc_data[variable.value].sel(time=window)
+        if variable == NOAADataVariable.TMP:
+            data = convert_temperature_dataset(data)
+        shg_regrid.write_dss(
+            path, data, imap, catalog_id, variable, DSS_OUTPUT_RESOLUTION_KM
+        )
+
+
+def _convert_storm_batch(
+    calls: list[tuple[str, str, str, str, int]], cube: str | None = None
+) -> list:
+    """Convert storms from one load of their union time range; the
+    ``_convert_single_storm`` result of each.
+
+    The AORC years are opened, the transposition read and the domain clipped
+    once, and both variables of the whole range are read into memory — or
+    viewed in the shared ``cube`` (a path) that holds the storms' hours; each
+    storm's DSS file is then written from its slice, regridded to SHG with
+    the cached ``shg_regrid`` index map. If that load fails, the storms are
+    converted one by one, so each still fails on its own.
     """
-    from stormhub.met.zarr_to_dss import noaa_zarr_to_dss, NOAADataVariable
+    from stormhub.met.zarr_to_dss import NOAADataVariable
 
-    storm_start = datetime.fromisoformat(storm_start_iso)
+    transposition_file, catalog_id = calls[0][1:3]
+    starts = [datetime.fromisoformat(call[3]) for call in calls]
+    first = min(starts) + timedelta(hours=1)
+    last = max(s + timedelta(hours=call[4]) for s, call in zip(starts, calls))
     try:
-        noaa_zarr_to_dss(
-            output_dss_path=output_path,
-            aoi_geometry_gpkg_path=transposition_file,
-            aoi_name=catalog_id,
-            storm_start=storm_start,
-            variable_duration_map={
-                NOAADataVariable.APCP: storm_duration,
-                NOAADataVariable.TMP: storm_duration,
-            },
-            output_resolution_km=DSS_OUTPUT_RESOLUTION_KM,
+        if cube is None:
+            aorc_data = _load_aorc(transposition_file, first, last)
+        else:
+            aorc_data = shared_cube.dataset(shared_cube.attach(cube), first, last)
+        # The transposition file is downloaded into the cache dir.
+        imap = shg_regrid.index_map(
+            aorc_data[NOAADataVariable.APCP.value],
+            transposition_file,
+            DSS_OUTPUT_RESOLUTION_KM,
+            Path(transposition_file).parent,
         )
-        return None
     except Exception as e:
-        return str(e)
+        if len(calls) == 1:
+            return [str(e)]
+        log.warning(
+            "Loading AORC %s..%s for %d storms failed (%s); converting them one by one",
+            first,
+            last,
+            len(calls),
+            e,
+        )
+        return [_convert_single_storm(*call) for call in calls]
+    return [
+        _build_dss(
+            out_path,
+            lambda path: _write_storm(
+                path, aorc_data, imap, catalog_id, start, duration
+            ),
+        )
+        for (out_path, *_, duration), start in zip(calls, starts)
+    ]
+
+
+def _batches(
+    calls: list[tuple[str, str, str, str, int]],
+) -> list[list[tuple[str, str, str, str, int]]]:
+    """Time-ordered ``calls`` in runs whose union time range spans at most
+    ``DSS_BATCH_SPAN`` times their longest storm."""
+    runs: list[list[tuple[str, str, str, str, int]]] = []
+    first = longest = None
+    for call in calls:
+        start = datetime.fromisoformat(call[3])
+        if runs:
+            hours = max(longest, call[4])
+            end = start + timedelta(hours=call[4])
+            if end - first <= timedelta(hours=DSS_BATCH_SPAN * hours):
+                runs[-1].append(call)
+                longest = hours
+                continue
+        runs.append([call])
+        first, longest = start, call[4]
+    return runs
+
+
+def _convert_storm_group(
+    calls: list[tuple[str, str, str, str, int]], cube: str | None = None
+) -> list:
+    """Convert storms that read the same AORC chunks, in time order, in one
+    worker, batch by batch; the ``_convert_single_storm`` result of each."""
+    return [
+        error
+        for batch in _batches(calls)
+        for error in _convert_storm_batch(batch, cube)
+    ]
+
+
+def _storm_cube(
+    calls: list[tuple[str, str, str, str, int]], cache_dir: Path
+) -> str | None:
+    """A shared cube of every storm's hours for the workers to attach, or
+    None, leaving each worker to load its own, if it cannot be built."""
+    starts = [datetime.fromisoformat(call[3]) for call in calls]
+    spans = [
+        (start + timedelta(hours=1), start + timedelta(hours=call[4]))
+        for start, call in zip(starts, calls)
+    ]
+    load = functools.partial(_load_aorc, calls[0][1])
+    try:
+        return str(shared_cube.build(cache_dir, spans, load))
+    except Exception as e:
+        log.warning("No shared AORC cube (%s); each worker loads its own hours", e)
+        return None
+
+
+def _chunk_groups(
+    calls: list[tuple[str, str, str, str, int]], workers: int
+) -> list[list[tuple[str, str, str, str, int]]]:
+    """``calls`` grouped by the AORC time chunks their storms read
+    (``chunk_plan``), small enough to keep ``workers`` busy."""
+    starts = [datetime.fromisoformat(call[3]) for call in calls]
+    spans = [
+        (start + timedelta(hours=1), start + timedelta(hours=call[4]))
+        for start, call in zip(starts, calls)
+    ]
+    years = aorc_preflight.window_years(starts, max(call[4] for call in calls))
+    grid = chunk_plan.load(years)
+    if grid is None:
+        # Without the stores' grid, storms whose windows overlap still share
+        # their hours.
+        grid = chunk_plan.ChunkGrid(
+            {year: chunk_plan.YearChunks(datetime(year, 1, 1), 1) for year in years}
+        )
+    size = max(1, min(DSS_GROUP_MAX, math.ceil(len(calls) / workers)))
+    groups = chunk_plan.group_by_chunks(spans, grid, size)
+    return [[calls[i] for i in group] for group in groups]
 
 
 def convert_to_dss(ctx: dict[str, Any], action: Any) -> None:
     payload = ctx["payload"]
     local_root: Path = ctx["local_root"]
-    collection = ctx["collection"]
-    storm_params = ctx["storm_params"]
+    collections = ctx["collections"]
+    checkpoint: Checkpoint = ctx["checkpoint"]
+    pool: SharedPool = ctx["pool"]
 
     attrs = payload.attributes
     catalog_id = attrs["catalog_id"]
@@ -69,81 +290,106 @@ def convert_to_dss(ctx: dict[str, Any], action: Any) -> None:
     transposition_file = str(
         local_root / Path(payload.inputs[0].paths["transposition"]).name
     )
-    storm_duration = storm_params["storm_duration"]
+    durations = list(collections)
 
-    items = list(collection.get_all_items())
+    # Every duration's storms go through one pool run; (duration, position
+    # in its collection, item).
+    items = [
+        (duration, idx, item)
+        for duration, collection in collections.items()
+        for idx, item in enumerate(collection.get_all_items(), 1)
+    ]
     if not items:
         raise RuntimeError("No storm events found in collection — nothing to convert")
 
     log.info("Converting %d storm events to DSS", len(items))
 
     # Build work items, skipping unparseable datetimes
-    work: list[tuple[str, str, str]] = []  # (item_id, output_path, storm_start_iso)
+    # (item_id, checkpoint key, output_path, storm_start_iso, storm_duration)
+    work: list[tuple[str, str, str, str, int]] = []
     skipped: list[str] = []
-    for idx, item in enumerate(items, 1):
+    # (manifest key, checkpoint key, output_path) of every storm
+    outputs: list[tuple[str, str, Path]] = []
+    for n, (storm_duration, idx, item) in enumerate(items, 1):
         storm_start = parse_storm_datetime(item)
         if storm_start is None:
             log.warning("Skipping item %s: could not parse datetime", item.id)
             skipped.append(item.id)
             continue
 
-        filename = dss_filename(storm_start, storm_rank(item, idx), storm_duration)
-        output_path = str(dss_dir / filename)
+        rank = storm_rank(item, idx)
+        output_path = dss_dir / dss_filename(storm_start, rank, storm_duration)
+        key = storm_key(rank, storm_duration, durations)
+        outputs.append((manifest_key(storm_start, storm_duration), key, output_path))
 
-        # Idempotency: skip if DSS file already exists
-        if Path(output_path).exists():
+        # Idempotency: the checkpoint, not the file's mere existence, says
+        # whether this storm finished. A file it doesn't vouch for is redone.
+        if checkpoint.storm_done(key, output_path):
             log.info(
-                "[%d/%d] Skipping %s — %s already exists",
-                idx,
+                "[%d/%d] Skipping %s — %s already converted",
+                n,
                 len(items),
                 item.id,
-                dss_filename,
+                output_path.name,
             )
             continue
 
-        work.append((item.id, output_path, storm_start.isoformat()))
+        work.append(
+            (item.id, key, str(output_path), storm_start.isoformat(), storm_duration)
+        )
 
     failed: list[str] = list(skipped)
 
+    header = manifest_header(catalog_id, transposition_file)
+    if work and ctx.get("pm") is not None:
+        work = _reuse_previous_dss(ctx, work, local_root, header)
+
     if work:
-        # Size the pool from the cgroup memory budget, not os.cpu_count(): inside
-        # a container cpu_count() reports the *host* CPU count, so the old
-        # fallback spawned 8 rio.reproject workers on an 8-core node and blew the
-        # 12000Mi cgroup in seconds (OOMKill, exit 137). resolve_num_workers is
-        # the same memory-aware sizing process-storms already trusts, and it
-        # honors the num_workers payload attr / CC_NUM_WORKERS env. DSS_WORKERS
-        # remains an explicit override for a fatter host.
-        if DSS_WORKERS > 0:
-            workers = DSS_WORKERS
-        else:
-            workers = min(len(work), resolve_num_workers(attrs))
+        # Conversions run on the run's shared pool, sized from the cgroup
+        # memory budget by WorkerMemoryModel — not os.cpu_count(): inside a
+        # container that reports the *host* CPU count, so the old fallback
+        # spawned 8 rio.reproject workers on an 8-core node and blew the
+        # 12000Mi cgroup in seconds (OOMKill, exit 137). DSS_WORKERS can still
+        # lower the concurrency, but no longer raise it past the budget.
+        workers = min(len(work), DSS_WORKERS or pool.max_workers, pool.max_workers)
         log.info("Running %d conversions with %d workers", len(work), workers)
 
-        # Explicit spawn context: the worker's first act is an fsspec/s3fs AORC
-        # read, which deadlocks in a *forked* worker (fork doesn't duplicate
-        # fsspec's async event-loop thread). Don't rely on the global default.
-        with ProcessPoolExecutor(
-            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
-        ) as pool:
-            futures = {
-                pool.submit(
-                    _convert_single_storm,
-                    out_path,
-                    transposition_file,
-                    catalog_id,
-                    start_iso,
-                    storm_duration,
-                ): item_id
-                for item_id, out_path, start_iso in work
-            }
-            for future in as_completed(futures):
-                item_id = futures[future]
-                error = future.result()
-                if error:
-                    log.error("Failed to convert %s: %s", item_id, error)
-                    failed.append(item_id)
-                else:
-                    log.info("  Converted %s", item_id)
+        meta = {out_path: (item_id, key) for item_id, key, out_path, *_ in work}
+        calls = [
+            (out_path, transposition_file, catalog_id, start_iso, storm_duration)
+            for _, _, out_path, start_iso, storm_duration in work
+        ]
+        # The plugin process loads every storm's hours once; the workers
+        # attach them read-only instead of loading their own.
+        cube = None
+        if shared_cube.enabled(payload):
+            pool.hook_reads()
+            cube = _storm_cube(calls, local_root)
+        # Storms sharing AORC chunks go to one worker, in time order.
+        groups = [(group, cube) for group in _chunk_groups(calls, workers)]
+        if len(groups) < len(calls):
+            log.info("Grouped them into %d chunk-aligned task(s)", len(groups))
+        try:
+            for (group, _), errors in pool.run_bounded(
+                _convert_storm_group, groups, workers
+            ):
+                for args, error in zip(group, errors):
+                    out_path = args[0]
+                    item_id, key = meta[out_path]
+                    if error:
+                        log.error("Failed to convert %s: %s", item_id, error)
+                        failed.append(item_id)
+                        checkpoint.mark_storm_failed(key, Path(out_path).name, error)
+                    else:
+                        log.info("  Converted %s", item_id)
+                        checkpoint.mark_storm_done(key, Path(out_path))
+                        ctx["metrics"].add("storms_processed", 1)
+        finally:
+            if cube is not None:
+                shared_cube.remove(cube)
+
+    shutil.rmtree(dss_dir / PARTIAL_DIRNAME, ignore_errors=True)
+    _write_manifest(output_dir / DSS_MANIFEST, header, outputs, checkpoint)
 
     total = len(items)
     n_failed = len(failed)
@@ -160,3 +406,72 @@ def convert_to_dss(ctx: dict[str, Any], action: Any) -> None:
         )
 
     log.info("DSS conversion complete. Output: %s", dss_dir)
+
+
+def _reuse_previous_dss(
+    ctx: dict[str, Any],
+    work: list[tuple[str, str, str, str, int]],
+    local_root: Path,
+    header: dict[str, Any],
+) -> list[tuple[str, str, str, str, int]]:
+    """Download the storms of ``work`` the previous run already converted,
+    under this run's ``dss_filename``; returns the ones left to convert.
+
+    With the same ``manifest_header`` — catalog, transposition domain and
+    resolution — a storm's DSS content depends only on its start and
+    duration, so a file from a run that ranked it differently is the same
+    file renamed. A manifest written for anything else reuses nothing.
+    """
+    manifest_path = local_root / f"previous-{DSS_MANIFEST}"
+    if not previous_run.fetch(ctx["pm"], ctx["payload"], DSS_MANIFEST, manifest_path):
+        return work
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    if any(manifest.get(field) != value for field, value in header.items()):
+        log.info(
+            "Not reusing DSS files from %s: written for another catalog, "
+            "transposition domain or resolution",
+            previous_run.base_path(ctx["payload"]),
+        )
+        return work
+    previous: dict[str, str] = manifest.get("storms", {})
+
+    checkpoint: Checkpoint = ctx["checkpoint"]
+    left = []
+    for entry in work:
+        _, key, out_path, start_iso, storm_duration = entry
+        name = previous.get(
+            manifest_key(datetime.fromisoformat(start_iso), storm_duration)
+        )
+        target = Path(out_path)
+        partial = target.parent / PARTIAL_DIRNAME / target.name
+        if name is None or not previous_run.fetch(
+            ctx["pm"], ctx["payload"], f"data/{name}", partial
+        ):
+            left.append(entry)
+            continue
+        os.replace(partial, target)
+        checkpoint.mark_storm_done(key, target)
+    log.info(
+        "Reused %d DSS file(s) from %s; %d left to convert",
+        len(work) - len(left),
+        previous_run.base_path(ctx["payload"]),
+        len(left),
+    )
+    return left
+
+
+def _write_manifest(
+    path: Path,
+    header: dict[str, Any],
+    outputs: list[tuple[str, str, Path]],
+    checkpoint: Checkpoint,
+) -> None:
+    storms = {
+        mkey: output_path.name
+        for mkey, key, output_path in outputs
+        if checkpoint.storm_done(key, output_path)
+    }
+    manifest = {**header, "storms": storms}
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
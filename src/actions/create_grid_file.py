@@ -177,18 +177,16 @@ def build_grid_file(
 def create_grid_file(ctx: dict[str, Any], action: Any) -> None:
     payload = ctx["payload"]
     local_root: Path = ctx["local_root"]
-    collection = ctx.get("collection")
-    storm_params = ctx.get("storm_params")
+    collections = ctx.get("collections")
 
-    if collection is None or storm_params is None:
+    if not collections:
         raise RuntimeError(
-            "create-grid-file requires ctx['collection'] and ctx['storm_params']; "
+            "create-grid-file requires ctx['collections']; "
             "ensure 'process-storms' ran earlier in the action list"
         )
 
     attrs = payload.attributes
     catalog_id = attrs["catalog_id"]
-    storm_duration = storm_params["storm_duration"]
 
     output_dir = local_root / catalog_id
     dss_dir = output_dir / "data"
@@ -202,7 +200,13 @@ def create_grid_file(ctx: dict[str, Any], action: Any) -> None:
         log.info("Skipping — %s already exists", grid_path)
         return
 
-    items = list(collection.get_all_items())
+    # One grid file lists the storms of every duration's collection; the
+    # duration is part of each record's name.
+    items = [
+        (duration, idx, item)
+        for duration, collection in collections.items()
+        for idx, item in enumerate(collection.get_all_items(), start=1)
+    ]
     if not items:
         raise RuntimeError("No storm items in collection — nothing to grid")
 
@@ -214,7 +218,7 @@ def create_grid_file(ctx: dict[str, Any], action: Any) -> None:
     entries: list[dict[str, Any]] = []
     failed: list[str] = []
 
-    for idx, item in enumerate(items, start=1):
+    for storm_duration, idx, item in items:
         storm_start = parse_storm_datetime(item)
         if storm_start is None:
             log.warning("Skipping item %s: unparseable datetime", item.id)
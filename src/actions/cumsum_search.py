@@ -0,0 +1,545 @@
+"""Storm search that gets every candidate window from one cumulative sum.
+
+stormhub's ``new_collection`` evaluates each candidate start time on its own:
+load the window's hours of the transposition domain, sum them, slide the
+watershed over the sum. Windows ``check_every_n_hours`` apart overlap by all
+but a few hours, so a period-of-record scan reads and sums every hour
+``storm_duration / check_every_n_hours`` times over.
+
+This engine loads the clipped domain once per block of about
+``SEARCH_BLOCK_HOURS`` candidate start times (plus one ``storm_duration`` of
+overlap), cut at AORC time-chunk boundaries (``chunk_plan``), takes a
+cumulative sum over its time axis, and gets every window total in the block
+as a difference of two cumulative sums. Blocks keep memory bounded and run on
+the shared pool. With several storm durations (e.g.
+``storm_duration: "24,48,72,96"``) a block is loaded once, with the longest
+duration's overlap, and every duration's windows come from the same
+cumulative sum.
+
+The scoring mirrors stormhub's ``Transpose.max_transpose`` exactly:
+
+* a window total is ``sum(skipna=True, min_count=1)`` over the hours in
+  ``(start, start + storm_duration]``;
+* the watershed (rasterized ``all_touched`` on the clipped grid) is shifted in
+  steps of ``TRANSPOSE_STEP`` cells, x outer and y inner, and a shift is valid
+  when every watershed cell under it is finite;
+* the first valid shift with the highest float32 ``nanmean`` wins, and its
+  min/mean/max are reported in inches, rounded to 2 places, with the centroid
+  of the watershed polygon (``rasterio.features.shapes`` of the mask)
+  translated by the shift.
+
+stormhub slices the summed grid once per shift, which costs domain cells ×
+watershed cells per window and dominates large domains. Here the watershed is
+rasterized once per worker and grid, and ``shift_means`` scores every shift of
+every window in a block at once from row-wise prefix sums (a summed-area table
+per row): one lookup per run of watershed cells in a row, not one per cell.
+Those means are float64; only the shifts within ``TIE_RTOL`` of a window's
+best, where float32 rounding could reorder them, are summed and averaged
+again the way stormhub does (``best_shift``), as is the winner's statistics.
+
+With a shared cube (``shared_cube``) the plugin process loads each segment
+of the scan once and the blocks attach to it instead of loading their own
+hours.
+
+Rows are appended to each duration's ``storm-stats.csv`` in stormhub's
+format. Ranking and item creation stay with ``new_collection``: process-storms
+hands it only the last candidate start time (see
+``scan_progress.prepare_resume``), so the catalog is the one
+``new_collection`` would have built. The engine runs with ``search_engine:
+"cumsum"`` in the payload; stormhub's per-window search is the default.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import functools
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Iterator, Mapping, NamedTuple, Sequence
+
+import numpy as np
+
+import aorc_store
+from actions import aorc_preflight, chunk_plan, shared_cube
+from actions.prefetch_aorc import APCP_VARIABLE
+from actions.scan_progress import STATS_HEADER
+from actions.storm_stream import StormStat, format_stats_row
+from worker_pool import SharedPool
+
+log = logging.getLogger(__name__)
+
+# Candidate start times per pool task; each task holds SEARCH_BLOCK_HOURS +
+# storm_duration hours of the clipped domain.
+SEARCH_BLOCK_HOURS = int(os.environ.get("SEARCH_BLOCK_HOURS", "168"))
+# Transpose.valid_shifts moves the watershed 4 cells at a time.
+TRANSPOSE_STEP = 4
+# Shifts whose prefix-sum mean is within this fraction of a window's best
+# are re-ranked on stormhub's float32 means (float32 resolution is ~1e-7).
+TIE_RTOL = 1e-4
+MM_TO_INCH = 0.03937007874015748  # stormhub.met.consts
+
+
+def enabled(payload: Any) -> bool:
+    """True when the payload asks for this engine (``search_engine:
+    "cumsum"``); stormhub's own per-window search is the default."""
+    return payload.attributes.get("search_engine", "stormhub").lower() == "cumsum"
+
+
+class Footprint(NamedTuple):
+    """The watershed on the clipped grid and where it may be shifted."""
+
+    mask: np.ndarray  # watershed cells within its bounding window
+    row_off: int
+    col_off: int
+    shifts: list[tuple[int, int]]  # (dx, dy) in cells, in Transpose order
+
+
+def footprint(watershed_mask: np.ndarray) -> Footprint:
+    """Candidate shifts of ``watershed_mask`` (a full-grid boolean array)."""
+    rows, cols = np.nonzero(watershed_mask)
+    r0, r1 = int(rows.min()), int(rows.max()) + 1
+    c0, c1 = int(cols.min()), int(cols.max()) + 1
+    height, width = watershed_mask.shape
+    shifts = [
+        (dx, dy)
+        for dx in range(-c0, width - c1 + 1, TRANSPOSE_STEP)
+        for dy in range(-r0, height - r1 + 1, TRANSPOSE_STEP)
+    ]
+    return Footprint(watershed_mask[r0:r1, c0:c1], r0, c0, shifts)
+
+
+class Cumulative(NamedTuple):
+    """Running totals of a ``(time, y, x)`` cube, with a leading zero slice."""
+
+    sums: np.ndarray  # float64, NaN hours counted as 0
+    counts: np.ndarray  # finite hours so far
+    times: np.ndarray
+
+
+def cumulate(cube: np.ndarray, times: np.ndarray) -> Cumulative:
+    """Cumulative sums of ``cube`` at ``times`` over its time axis."""
+    finite = np.isfinite(cube)
+    sums = np.zeros((len(cube) + 1, *cube.shape[1:]), dtype=np.float64)
+    sums[1:] = cube
+    sums[1:][~finite] = 0.0
+    np.cumsum(sums, axis=0, out=sums)
+    counts = np.zeros(sums.shape, dtype=np.int32)
+    np.cumsum(finite, axis=0, out=counts[1:])
+    return Cumulative(sums, counts, times)
+
+
+def window_bounds(
+    times: np.ndarray, starts: Sequence[datetime], duration: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """Indices ``[lo, hi)`` into ``times`` of each window ``(start, start +
+    duration]``."""
+    first = np.array(starts, dtype="datetime64[ns]") + np.timedelta64(1, "h")
+    last = first + np.timedelta64(duration - 1, "h")
+    lo = np.searchsorted(times, first, side="left")
+    hi = np.searchsorted(times, last, side="right")
+    return lo, hi
+
+
+def window_totals(
+    cumulative: Cumulative, starts: Sequence[datetime], duration: int
+) -> np.ndarray:
+    """Per-cell total of each window ``(start, start + duration]``.
+
+    A cell with no finite hour in a window is NaN, as with
+    ``sum(skipna=True, min_count=1)``. Any duration up to the span of
+    ``cumulative`` comes from the same cumulative sums.
+    """
+    sums, counts, times = cumulative
+    lo, hi = window_bounds(times, starts, duration)
+    totals = sums[hi] - sums[lo]
+    totals[counts[hi] == counts[lo]] = np.nan
+    return totals
+
+
+def _runs(mask: np.ndarray) -> list[tuple[int, int, int]]:
+    """``(row, start, stop)`` of each horizontal run of True cells."""
+    runs = []
+    for row, line in enumerate(mask):
+        edges = np.diff(np.concatenate(([0], line.astype(np.int8), [0])))
+        starts, stops = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        runs += [(row, int(a), int(b)) for a, b in zip(starts, stops)]
+    return runs
+
+
+def shift_means(totals: np.ndarray, fp: Footprint) -> np.ndarray:
+    """Mean of the watershed cells under each shift, ``(window, shift)``.
+
+    NaN where a watershed cell is NaN (an invalid shift). Each run of
+    watershed cells in a row is a difference of two row-wise prefix sums, so
+    a shift costs one lookup per run instead of one per cell, and every shift
+    of every window in the block is scored at once.
+    """
+    finite = np.isfinite(totals)
+    shape = (*totals.shape[:2], totals.shape[2] + 1)
+    prefix = np.zeros(shape, dtype=np.float64)
+    np.cumsum(np.where(finite, totals, 0.0), axis=2, out=prefix[..., 1:])
+    holes = np.zeros(shape, dtype=np.int32)
+    np.cumsum(~finite, axis=2, out=holes[..., 1:])
+    del finite
+
+    dx, dy = np.array(fp.shifts).reshape(-1, 2).T
+    sums = np.zeros((len(totals), len(dx)))
+    missing = np.zeros(sums.shape, dtype=np.int32)
+    for row, start, stop in _runs(fp.mask):
+        r = fp.row_off + row + dy
+        a, b = fp.col_off + start + dx, fp.col_off + stop + dx
+        sums += prefix[:, r, b] - prefix[:, r, a]
+        missing += holes[:, r, b] - holes[:, r, a]
+    means = sums / fp.mask.sum()
+    means[missing > 0] = np.nan
+    return means
+
+
+def shifted_total(
+    hours: np.ndarray, fp: Footprint, shift: tuple[int, int]
+) -> np.ma.MaskedArray:
+    """The window total under the watershed shifted by ``shift``, summed as
+    stormhub sums it: in the dtype of ``hours`` (float32 for AORC), hour by
+    hour, with ``sum(skipna=True, min_count=1)``; masked to the watershed as
+    ``max_transpose`` masks it."""
+    dx, dy = shift
+    r, c = fp.row_off + dy, fp.col_off + dx
+    height, width = fp.mask.shape
+    box = hours[:, r : r + height, c : c + width]
+    missing = np.isnan(box)
+    total = np.where(missing, 0, box).sum(axis=0)
+    total[missing.all(axis=0)] = np.nan
+    return np.ma.masked_array(total, ~fp.mask)
+
+
+def best_shift(hours: np.ndarray, means: np.ndarray, fp: Footprint) -> int:
+    """Index into ``fp.shifts`` of a window's best transposition, or -1.
+
+    ``means`` are the window's ``shift_means`` and ``hours`` its hours.
+    ``max_transpose`` keeps the first shift whose float32 ``nanmean`` is
+    strictly higher; the shifts within ``TIE_RTOL`` of the best float64 mean
+    are the only ones float32 rounding can reorder, so they are compared on
+    that ``nanmean``. A window whose best mean is 0 is dry under every valid
+    shift and takes the first.
+    """
+    valid = ~np.isnan(means)
+    if not valid.any():
+        return -1
+    top = means[valid].max()
+    if top == 0:
+        return int(np.argmax(valid))
+    near = np.flatnonzero(valid & (means >= top - abs(top) * TIE_RTOL))
+    if len(near) == 1:
+        return int(near[0])
+    best, best_mean = -1, None
+    for k in near:
+        mean = np.nanmean(shifted_total(hours, fp, fp.shifts[k]))
+        if best_mean is None or mean > best_mean:
+            best, best_mean = int(k), mean
+    return best
+
+
+def transposed_centroids(
+    watershed_mask: np.ndarray, transform: Any
+) -> Callable[[int, int], tuple[float, float]]:
+    """The centroid ``max_transpose`` reports for a shift ``(dx, dy)`` in
+    cells: the watershed mask traced to a polygon on ``transform`` and
+    translated by the shift in degrees (``transform`` is the grid's
+    ``rio.transform()``, whose ``a``/``e`` are ``rio.resolution()``).
+
+    Raises ValueError or TypeError, as stormhub does, when the mask is not
+    one polygon.
+    """
+    from rasterio.features import shapes
+    from shapely.affinity import translate
+    from shapely.geometry import shape
+
+    polygons = [
+        shape(geometry)
+        for geometry, _ in shapes(
+            watershed_mask.astype(np.ubyte), watershed_mask, transform=transform
+        )
+    ]
+    if len(polygons) != 1:
+        raise ValueError(f"Expected single geometry feature, got {len(polygons)}")
+    polygon = polygons[0]
+    if polygon.geom_type != "Polygon":
+        raise TypeError(f"Expected geometry type 'Polygon', got {polygon.geom_type}")
+
+    @functools.cache
+    def centroid(dx: int, dy: int) -> tuple[float, float]:
+        point = translate(
+            polygon, float(dx * transform.a), float(dy * transform.e)
+        ).centroid
+        return point.x, point.y
+
+    return centroid
+
+
+def _inches(total: np.ma.MaskedArray) -> tuple[float, float, float]:
+    """min/mean/max as ``AORCItem._create_stats`` reports them."""
+    return tuple(
+        round(float(f(total)) * MM_TO_INCH, 2)
+        for f in (np.nanmin, np.nanmean, np.nanmax)
+    )
+
+
+def score_windows(
+    cube: np.ndarray,
+    times: np.ndarray,
+    watershed_mask: np.ndarray,
+    centroid: Callable[[int, int], tuple[float, float]],
+    windows: Mapping[int, Sequence[datetime]],
+) -> dict[int, list[StormStat]]:
+    """``storm-stats.csv`` rows for each duration's start times in
+    ``windows``, all from one cumulative sum of ``cube``; windows with no
+    valid shift are left out, as stormhub fails them. ``centroid`` maps a
+    shift to the transposed watershed's centroid (``transposed_centroids``)."""
+    cumulative = cumulate(cube, times)
+    fp = footprint(watershed_mask)
+
+    stats: dict[int, list[StormStat]] = {}
+    skipped = 0
+    for duration, starts in windows.items():
+        means = shift_means(window_totals(cumulative, starts, duration), fp)
+        lo, hi = window_bounds(times, starts, duration)
+        stats[duration] = []
+        for start, a, b, window in zip(starts, lo, hi, means):
+            k = best_shift(cube[a:b], window, fp)
+            if k < 0:
+                skipped += 1
+                continue
+            total = shifted_total(cube[a:b], fp, fp.shifts[k])
+            stats[duration].append(
+                StormStat(start, *_inches(total), *centroid(*fp.shifts[k]))
+            )
+    if skipped:
+        first = min(min(starts) for starts in windows.values() if starts)
+        log.warning(
+            "%d window(s) from %s have no valid transposition; skipped",
+            skipped,
+            f"{first:%Y-%m-%dT%H}",
+        )
+    return stats
+
+
+def plan_blocks(
+    dates: Sequence[datetime], block_hours: int = SEARCH_BLOCK_HOURS
+) -> list[list[datetime]]:
+    """Group candidate start times into blocks spanning under ``block_hours``."""
+    blocks: list[list[datetime]] = []
+    for date in sorted(dates):
+        if blocks and date - blocks[-1][0] < timedelta(hours=block_hours):
+            blocks[-1].append(date)
+        else:
+            blocks.append([date])
+    return blocks
+
+
+def _load_block(
+    first: datetime, last: datetime, duration: int, transposition: Any
+) -> Any:
+    """APCP over ``transposition`` for every window starting in [first, last],
+    selected and clipped as ``AORCItem.aorc_source_data`` does."""
+    ds = _load_hours(
+        first + timedelta(hours=1), last + timedelta(hours=duration), transposition
+    )
+    return ds[APCP_VARIABLE].transpose("time", "latitude", "longitude")
+
+
+def _load_hours(t0: datetime, t1: datetime, transposition: Any) -> Any:
+    """The APCP Dataset of the hours ``[t0, t1]`` over ``transposition``."""
+    import rioxarray  # noqa: F401  (registers .rio)
+    import xarray as xr
+
+    west, south, east, north = transposition.bounds
+    parts = [
+        aorc_store.open_year(year)[[APCP_VARIABLE]].sel(
+            time=slice(t0, t1),
+            longitude=slice(west, east),
+            latitude=slice(south, north),
+        )
+        for year in range(t0.year, t1.year + 1)
+    ]
+    ds = parts[0] if len(parts) == 1 else xr.concat(parts, dim="time")
+    return ds.rio.clip([transposition], drop=True, all_touched=True)
+
+
+@functools.lru_cache(maxsize=8)
+def _watershed_mask(watershed_json: str, transform: Any, shape: tuple) -> np.ndarray:
+    """The watershed rasterized ``all_touched`` onto a grid, as ``Transpose``
+    does. Every block of a run has the same clipped grid, so a worker
+    rasterizes it once."""
+    from rasterio.features import geometry_mask
+    from shapely.geometry import shape as to_shape
+
+    return geometry_mask(
+        [to_shape(json.loads(watershed_json))],
+        out_shape=shape,
+        transform=transform,
+        all_touched=True,
+        invert=True,
+    )
+
+
+def search_block(
+    windows: dict[int, list[datetime]],
+    watershed_geojson: dict,
+    transposition_geojson: dict,
+    cube: str | None = None,
+) -> dict[int, list[StormStat]]:
+    """Score one block of candidate start times for every duration in
+    ``windows`` from a single load, or from the shared ``cube`` (a path)
+    holding its hours. Runs in a pool worker."""
+    from shapely.geometry import shape
+
+    starts = sorted({d for dates in windows.values() for d in dates})
+    if cube is None:
+        precip = _load_block(
+            starts[0], starts[-1], max(windows), shape(transposition_geojson)
+        )
+    else:
+        hours = shared_cube.dataset(
+            shared_cube.attach(cube),
+            starts[0] + timedelta(hours=1),
+            starts[-1] + timedelta(hours=max(windows)),
+        )
+        precip = hours[APCP_VARIABLE]
+    transform = precip.rio.transform(recalc=True)
+    watershed_mask = _watershed_mask(
+        json.dumps(watershed_geojson, sort_keys=True),
+        transform,
+        (int(precip.rio.height), int(precip.rio.width)),
+    )
+    try:
+        centroid = transposed_centroids(watershed_mask, transform)
+    except (ValueError, TypeError) as e:
+        # max_transpose fails every window of the grid the same way.
+        log.error("%s - %s: %s", starts[0], starts[-1], e)
+        return {duration: [] for duration in windows}
+    return score_windows(
+        precip.values, precip["time"].values, watershed_mask, centroid, windows
+    )
+
+
+def search(
+    catalog: Any,
+    dates: Mapping[int, Sequence[datetime]],
+    stats_csvs: Mapping[int, Path],
+    pool: SharedPool,
+    workers: int,
+    cube_root: Path | None = None,
+) -> None:
+    """Append a row to each duration's ``storm-stats.csv`` for each of its
+    ``dates`` as blocks finish.
+
+    ``dates`` and ``stats_csvs`` are keyed by storm duration; every duration
+    is scored from the same load of a block. At most ``workers`` blocks are
+    searched at once. With ``cube_root`` (the cache dir) the blocks read
+    shared cubes built there instead of loading their own hours.
+    """
+    wanted = {duration: set(starts) for duration, starts in dates.items()}
+    total = sum(len(starts) for starts in wanted.values())
+    starts = sorted(set().union(*wanted.values()))
+    # Cut at AORC time-chunk boundaries when the stores' grid can be read,
+    # so neighbouring blocks don't both read and decode the same chunks.
+    grid = chunk_plan.load(aorc_preflight.window_years(starts, max(wanted)))
+    if grid is not None:
+        blocks = chunk_plan.search_blocks(starts, grid, SEARCH_BLOCK_HOURS)
+    else:
+        blocks = plan_blocks(starts)
+    log.info(
+        "Cumulative-sum storm search: %d candidate window(s) of %s h in %d block(s)",
+        total,
+        "/".join(str(d) for d in wanted),
+        len(blocks),
+    )
+    calls = []
+    for block in blocks:
+        windows = {d: [s for s in block if s in wanted[d]] for d in wanted}
+        calls.append(
+            (
+                {d: starts for d, starts in windows.items() if starts},
+                catalog.watershed.geometry,
+                catalog.valid_transposition_region.geometry,
+            )
+        )
+
+    files = {}
+    with ExitStack() as stack:
+        for duration, stats_csv in stats_csvs.items():
+            stats_csv.parent.mkdir(parents=True, exist_ok=True)
+            if not stats_csv.exists():
+                stats_csv.write_text(STATS_HEADER + "\n", encoding="utf-8")
+            files[duration] = stack.enter_context(
+                open(stats_csv, "a", encoding="utf-8")
+            )
+        if cube_root is None:
+            results = pool.run_bounded(search_block, calls, workers)
+        else:
+            results = _on_shared_cubes(
+                calls, blocks, max(wanted), pool, workers, cube_root
+            )
+        done = 0
+        for (windows, *_), stats in results:
+            for duration, rows in stats.items():
+                f = files[duration]
+                f.write("".join(format_stats_row(row) for row in rows))
+                f.flush()
+            block = sorted({d for starts in windows.values() for d in starts})
+            done += sum(len(starts) for starts in windows.values())
+            log.info(
+                "%s - %s searched (%d remaining)",
+                f"{block[0]:%Y-%m-%dT%H}",
+                f"{block[-1]:%Y-%m-%dT%H}",
+                total - done,
+            )
+
+
+def _on_shared_cubes(
+    calls: list[tuple],
+    blocks: list[list[datetime]],
+    duration: int,
+    pool: SharedPool,
+    workers: int,
+    cube_root: Path,
+) -> Iterator[tuple[tuple, dict[int, list[StormStat]]]]:
+    """``run_bounded`` over ``calls`` a segment of blocks at a time, each
+    segment's blocks attached to a cube of its hours. The next segment's
+    cube is filled on a thread while the current one is searched."""
+    from shapely.geometry import shape
+
+    spans = [
+        (block[0] + timedelta(hours=1), block[-1] + timedelta(hours=duration))
+        for block in blocks
+    ]
+    runs = shared_cube.segments(spans, shared_cube.SHARED_CUBE_MAX_HOURS)
+    pool.hook_reads()  # the cubes are loaded in this process
+    load = functools.partial(_load_hours, transposition=shape(calls[0][2]))
+
+    def fill(run: list[int]) -> Path:
+        return shared_cube.build(cube_root, [spans[i] for i in run], load)
+
+    with ThreadPoolExecutor(1, thread_name_prefix="aorc-cube") as filler:
+        ahead = filler.submit(fill, runs[0])
+        try:
+            for k, run in enumerate(runs):
+                cube, ahead = ahead.result(), None
+                if k + 1 < len(runs):
+                    ahead = filler.submit(fill, runs[k + 1])
+                try:
+                    yield from pool.run_bounded(
+                        search_block, [(*calls[i], str(cube)) for i in run], workers
+                    )
+                finally:
+                    shared_cube.remove(cube)
+        finally:
+            # A cube filled ahead of a search that stopped is never attached.
+            if ahead is not None and not ahead.cancel():
+                with contextlib.suppress(Exception):
+                    shared_cube.remove(ahead.result())
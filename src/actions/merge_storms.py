@@ -0,0 +1,70 @@
+"""Action: merge-storms — Build the catalog from the candidates of shard jobs."""
+
+from __future__ import annotations
+
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from stormhub.utils import StacPathManager
+
+from actions import previous_run, shards, stats_index, storm_durations
+from actions.process_storms import process_storms
+from actions.storm_stream import StormStat
+
+log = logging.getLogger(__name__)
+
+
+def merge_storms(ctx: dict[str, Any], action: Any) -> None:
+    payload = ctx["payload"]
+    local_root: Path = ctx["local_root"]
+    attrs = payload.attributes
+    catalog_id = attrs["catalog_id"]
+
+    specs = shards.merge_specs(attrs["shards"])
+    geometry = stats_index.payload_geometry_key(payload, local_root)
+    spm = StacPathManager(str(local_root / catalog_id))
+
+    for duration in storm_durations(attrs):
+        collection_id = spm.storm_collection_id(duration)
+        merged: dict[datetime, StormStat] = {}
+        missing: list[str] = []
+        for shard in specs:
+            # Beside the output dir, so the shards are not uploaded again.
+            path = local_root / shards.rel_path(collection_id, shard)
+            if not path.exists() and not previous_run.fetch(
+                ctx["pm"],
+                payload,
+                shards.rel_path(collection_id, shard),
+                path,
+                base=attrs["output_path"],
+            ):
+                missing.append(shard.spec)
+                continue
+            rows = stats_index.read(path, geometry, duration)
+            if rows is None:
+                missing.append(shard.spec)
+                continue
+            # Overlapping ranges score the same window twice; keep one.
+            for row in rows:
+                merged.setdefault(row.storm_date, row)
+        if missing:
+            raise RuntimeError(
+                f"merge-storms: no {duration}h candidates from shard(s) {missing} "
+                "(not finished, or scanned for another geometry)"
+            )
+
+        # process-storms seeds storm-stats.csv from this index, so it only
+        # scans start times no shard covered, then ranks the whole period.
+        n = stats_index.write(
+            stats_index.cached_path(local_root, collection_id),
+            merged.values(),
+            geometry,
+            duration,
+        )
+        log.info(
+            "Merged %d %dh candidate windows from %d shard(s)", n, duration, len(specs)
+        )
+
+    process_storms(ctx, action)
@@ -0,0 +1,186 @@
+"""Action: prefetch-aorc — Bulk-load the period's AORC chunks into the cache.
+
+Every candidate window of the storm search, and every ``_convert_single_storm``
+call, opens the national AORC yearly zarr and slices it down to the
+transposition domain again, one chunk request at a time. This stage, between
+download-inputs and process-storms, fetches every chunk those reads can touch
+— the transposition bbox, ``start_date`` to ``end_date`` + the longest
+``storm_duration`` (or just the windows of ``specific_dates``), APCP and (when
+convert-to-dss runs) TMP — in one batched, chunk-aligned pass, into the shared
+chunk cache (``aorc_cache``). The search and the conversion then read them
+from local disk under the keys zarr asks for, with no change to stormhub.
+
+The pass stops once the cache would start evicting (``AORC_CACHE_MAX_MB``);
+anything left is fetched on demand as before. Chunks already cached are
+skipped, so a resumed run only fetches what is missing. A no-op when the
+cache is off.
+"""
+
+from __future__ import annotations
+
+import datetime
+import itertools
+import logging
+import os
+from pathlib import Path
+from typing import Any, Iterator, Sequence
+
+import aorc_store
+from actions import aorc_preflight, specific_dates, storm_durations
+from aorc_cache import ChunkCache, settled, time_chunk_limits
+from run_metrics import RunMetrics, install_read_counter
+from worker_sizing import geometry_bbox
+
+log = logging.getLogger(__name__)
+
+# zarr variable names in the AORC yearly stores.
+APCP_VARIABLE = "APCP_surface"
+TMP_VARIABLE = "TMP_2maboveground"
+# Chunks per batched request; fsspec fetches a batch concurrently.
+PREFETCH_BATCH = int(os.environ.get("AORC_PREFETCH_BATCH", "64"))
+
+
+def index_range(values: Sequence[Any], lo: Any, hi: Any) -> tuple[int, int] | None:
+    """First and last index of ``values`` within ``[lo, hi]``, or None.
+
+    Works for ascending and descending coordinates (AORC latitude descends).
+    """
+    inside = [i for i, v in enumerate(values) if lo <= v <= hi]
+    if not inside:
+        return None
+    return inside[0], inside[-1]
+
+
+def chunk_keys(
+    variable: str,
+    chunks: Sequence[int],
+    ranges: Sequence[tuple[int, int]],
+    separator: str = ".",
+) -> Iterator[str]:
+    """zarr keys of every chunk of ``variable`` overlapping ``ranges``.
+
+    ``ranges`` holds an inclusive ``(first, last)`` index per dimension.
+    """
+    per_dim = [
+        range(first // size, last // size + 1)
+        for (first, last), size in zip(ranges, chunks)
+    ]
+    for index in itertools.product(*per_dim):
+        yield f"{variable}/{separator.join(map(str, index))}"
+
+
+def _year_chunk_keys(
+    year: int,
+    variables: Sequence[str],
+    bbox: tuple[float, float, float, float],
+    start: datetime.datetime,
+    end: datetime.datetime,
+) -> list[str]:
+    """Chunk paths in ``year``'s store the analysis period can read."""
+    import numpy as np
+
+    metadata = aorc_store.consolidated_metadata(year)
+    if metadata is None:
+        return []
+    store = aorc_store.store_url(year)
+    ds = aorc_store.open_year(year)
+    west, south, east, north = bbox
+    coord_ranges = {
+        "time": index_range(
+            ds["time"].values, np.datetime64(start), np.datetime64(end)
+        ),
+        "latitude": index_range(ds["latitude"].values, south, north),
+        "longitude": index_range(ds["longitude"].values, west, east),
+    }
+    if any(r is None for r in coord_ranges.values()):
+        return []
+
+    # The last time chunk is rewritten when the store is extended; the cache
+    # never keeps it.
+    limits = time_chunk_limits(metadata)
+    paths: list[str] = []
+    for variable in variables:
+        zarray = metadata[f"{variable}/.zarray"]
+        dims = metadata[f"{variable}/.zattrs"]["_ARRAY_DIMENSIONS"]
+        keys = chunk_keys(
+            variable,
+            zarray["chunks"],
+            [coord_ranges[dim] for dim in dims],
+            zarray.get("dimension_separator") or ".",
+        )
+        paths.extend(f"{store}/{key}" for key in keys if settled(key, limits))
+    return paths
+
+
+def prefetch_aorc(ctx: dict[str, Any], action: Any) -> None:
+    payload = ctx["payload"]
+    local_root: Path = ctx["local_root"]
+    cache: ChunkCache | None = ctx.get("chunk_cache")
+    metrics: RunMetrics = ctx["metrics"]
+
+    if cache is None:
+        log.info("AORC chunk cache is off (AORC_CACHE_MAX_MB=0); nothing to prefetch")
+        return
+
+    attrs = payload.attributes
+    end_date = attrs.get("end_date") or attrs["start_date"]
+    duration = max(storm_durations(attrs))
+    start = datetime.datetime.fromisoformat(attrs["start_date"])
+    end = datetime.datetime.fromisoformat(end_date) + datetime.timedelta(
+        days=1, hours=duration
+    )
+
+    transposition = local_root / Path(payload.inputs[0].paths["transposition"]).name
+    bbox = geometry_bbox(transposition)
+    if bbox is None:
+        log.warning(
+            "Cannot read a lon/lat bbox from %s; skipping AORC prefetch",
+            transposition,
+        )
+        return
+
+    variables = [APCP_VARIABLE]
+    if any(a.name == "convert-to-dss" for a in payload.actions):
+        variables.append(TMP_VARIABLE)
+
+    fs = aorc_store.filesystem()
+    # Prefetched bytes are S3 reads too.
+    install_read_counter(metrics.aorc_bytes_counter)
+
+    dates = specific_dates.from_attrs(attrs)
+    if dates:
+        # Only the chunks the requested windows read, not the whole range.
+        spans = specific_dates.windows(dates, duration)
+        years = aorc_preflight.window_years(dates, duration)
+    else:
+        spans = [(start, end)]
+        years = aorc_preflight.required_years(attrs["start_date"], end_date, duration)
+    paths: list[str] = []
+    for year in years:
+        for first, last in spans:
+            if first.year <= year <= last.year:
+                paths += _year_chunk_keys(year, variables, bbox, first, last)
+    paths = list(dict.fromkeys(paths))  # windows in one chunk share it
+    todo = [p for p in paths if not cache.contains(p)]
+    log.info(
+        "Prefetching %d AORC chunk(s) (%d already cached) for %s",
+        len(todo),
+        len(paths) - len(todo),
+        ", ".join(variables),
+    )
+
+    fetched = 0
+    for i in range(0, len(todo), PREFETCH_BATCH):
+        if cache.room() <= 0:
+            log.warning(
+                "AORC chunk cache is full; %d chunk(s) left to fetch on demand "
+                "(raise AORC_CACHE_MAX_MB to prefetch the whole period)",
+                len(todo) - i,
+            )
+            break
+        # Missing chunks are fill values in zarr; skip them like zarr does.
+        batch = fs.cat(todo[i : i + PREFETCH_BATCH], on_error="omit")
+        for path, data in batch.items():
+            cache.put(path, None, None, data)
+            fetched += len(data)
+    log.info("Prefetched %.1f MB of AORC chunks", fetched / 2**20)
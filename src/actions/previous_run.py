@@ -0,0 +1,56 @@
+"""Outputs of a previous run that this run builds on.
+
+By default that is the run that last wrote ``output_path``. ``extend_from``
+names another one — e.g. last year's catalog when a new AORC year has been
+mirrored and the catalog is extended to it (see README, "Extending a
+Catalog"). Two of its outputs are reused:
+
+* the storm-stats index of each collection (``stats_index``), so only the
+  candidate start times it does not cover are scanned. The whole
+  ``storm-stats.csv`` is still ranked together, so storms either side of the
+  old end date decluster against each other exactly as in a full rebuild;
+* its DSS files, through the ``dss-manifest.json`` convert-to-dss writes: a
+  storm that was already converted, for the same catalog, transposition
+  domain and resolution, is downloaded under its new rank's ``dss_filename``
+  instead of converted again.
+"""
+
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from typing import Any
+
+log = logging.getLogger(__name__)
+
+
+def base_path(payload: Any) -> str:
+    """Remote root of the previous run's outputs."""
+    attrs = payload.attributes
+    return (attrs.get("extend_from") or attrs["output_path"]).rstrip("/")
+
+
+def fetch(
+    pm: Any, payload: Any, rel_path: str, local_path: Path, base: str | None = None
+) -> bool:
+    """Download ``rel_path`` of the previous run's outputs (or of ``base``) to
+    ``local_path``; False when it is not there."""
+    from cc.plugin_manager import DataSourceOpInput
+
+    remote_path = f"{(base or base_path(payload)).rstrip('/')}/{rel_path}"
+    local_path.parent.mkdir(parents=True, exist_ok=True)
+    for source in payload.outputs:
+        # Same store as the outputs; the path key is only for this copy.
+        source.paths[rel_path] = remote_path
+        op = DataSourceOpInput(name=source.name, pathkey=rel_path, datakey=None)
+        try:
+            pm.copy_file_to_local(ds=op, localpath=str(local_path))
+        except Exception as e:  # NoSuchKey on a first run, among others
+            local_path.unlink(missing_ok=True)
+            log.info("Nothing at %s (%s)", remote_path, type(e).__name__)
+            continue
+        finally:
+            del source.paths[rel_path]
+        log.info("Fetched %s", remote_path)
+        return True
+    return False
@@ -1,4 +1,11 @@
-"""Action: process-storms — Create STAC catalog and storm collection from NOAA AORC data."""
+"""Action: process-storms — Create STAC catalog and storm collections from NOAA AORC data.
+
+``storm_duration`` may list several durations (``"24,48,72,96"``); each gets
+its own collection (``catalog.spm.storm_collection_id``) in the one catalog,
+and the cumulative-sum engine scores all of them from one read of the data.
+With ``specific_dates`` only those windows are scored and each gets an item
+(``specific_dates``).
+"""
 
 from __future__ import annotations
 
@@ -6,16 +13,35 @@ import json
 import logging
 import os
 from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack
+from datetime import datetime
+from functools import partial
 from pathlib import Path
 from typing import Any
 
 from stormhub.met.storm_catalog import StormCatalog, new_catalog, new_collection
 
-from worker_sizing import resolve_num_workers
-from actions import aorc_preflight
+import aorc_store
+from worker_pool import SharedPool
+from actions import (
+    adaptive_search,
+    aorc_preflight,
+    cumsum_search,
+    previous_run,
+    scan_progress,
+    shards,
+    shared_cube,
+    specific_dates,
+    stats_index,
+    storm_durations,
+    storm_stream,
+)
 
 log = logging.getLogger(__name__)
 
+# Under the cache dir: a shard job's working catalog, never uploaded.
+SHARD_WORKDIR = "shard-catalog"
+
 
 def _try_reload_collection(
     catalog_dir: str, catalog_id: str, storm_duration: int
@@ -46,10 +72,195 @@ def _try_reload_collection(
         return None
 
 
+def _storm_params(
+    attrs: dict[str, Any], pool: SharedPool
+) -> tuple[list[int], dict[str, Any]]:
+    """The payload's storm durations, and new_collection's arguments for the
+    first of them."""
+    end_date = attrs.get("end_date") or attrs["start_date"]
+    durations = storm_durations(attrs)
+    storm_params = {
+        "start_date": attrs["start_date"],
+        "end_date": end_date,
+        "storm_duration": durations[0],
+        "min_precip_threshold": float(attrs.get("min_precip_threshold", "0.0")),
+        "top_n_events": int(attrs.get("top_n_events", "10")),
+        "check_every_n_hours": int(attrs.get("check_every_n_hours", "24")),
+        # The pool's current concurrency (WorkerMemoryModel); max_workers is
+        # only the ceiling it may grow to.
+        "num_workers": pool.limit,
+        "specific_dates": json.loads(attrs["specific_dates"])
+        if attrs.get("specific_dates")
+        else [],
+    }
+    return durations, storm_params
+
+
+def _pool_died(num_workers: int) -> RuntimeError:
+    return RuntimeError(
+        f"Storm processing pool died with num_workers={num_workers} (likely OOM) "
+        "and kept dying on retry even with the memory watchdog throttling it. "
+        "Lower via 'num_workers' payload attribute or CC_NUM_WORKERS env."
+    )
+
+
+def _score(
+    ctx: dict[str, Any],
+    catalog: Any,
+    scans: dict[int, tuple[Path, list[datetime]]],
+    num_workers: int,
+) -> None:
+    """Append a row for each remaining start time to each duration's
+    ``storm-stats.csv`` — every duration from one read of the data with the
+    cumulative-sum engine, else stormhub's search duration by duration.
+    Nothing is ranked. Runs on the pool lent to stormhub."""
+    pool: SharedPool = ctx["pool"]
+    if cumsum_search.enabled(ctx["payload"]):
+        cumsum_search.search(
+            catalog,
+            {d: remaining for d, (_, remaining) in scans.items()},
+            {d: stats_csv for d, (stats_csv, _) in scans.items()},
+            pool,
+            pool.max_workers,
+            cube_root=_cube_root(ctx),
+        )
+        return
+
+    from stormhub.met.storm_catalog import collect_event_stats
+
+    for d, (_, remaining) in scans.items():
+        collect_event_stats(
+            remaining, catalog, storm_duration=d, num_workers=num_workers
+        )
+
+
+def _cube_root(ctx: dict[str, Any]) -> Path | None:
+    """Where the cumsum search builds its shared AORC cubes, if it does."""
+    return ctx["local_root"] if shared_cube.enabled(ctx["payload"]) else None
+
+
+def _specific_collection(
+    catalog: Any,
+    stats_csv: Path,
+    plan: list[datetime],
+    storm_duration: int,
+    num_workers: int,
+) -> Any | None:
+    """The collection of every ``specific_dates`` window that was scored."""
+    rows = stats_index.csv_rows(stats_csv) if stats_csv.exists() else {}
+    scored = [rows[d] for d in dict.fromkeys(plan) if d in rows]
+    if len(scored) < len(set(plan)):
+        log.warning(
+            "%d of %d specific date(s) could not be scored for %dh; "
+            "they are left out of the collection",
+            len(set(plan)) - len(scored),
+            len(set(plan)),
+            storm_duration,
+        )
+    if not scored:
+        return None
+    return specific_dates.build_collection(catalog, scored, storm_duration, num_workers)
+
+
+def _scan_shard(
+    ctx: dict[str, Any],
+    shard: shards.Shard,
+    durations: list[int],
+    storm_params: dict[str, Any],
+) -> None:
+    """Score this shard's candidate start times for every duration and write
+    them to the output dir for merge-storms; nothing is ranked."""
+    payload = ctx["payload"]
+    local_root: Path = ctx["local_root"]
+    pool: SharedPool = ctx["pool"]
+    attrs = payload.attributes
+    catalog_id = attrs["catalog_id"]
+
+    dates = shards.select(shard, storm_stream.scan_plan(storm_params))
+    log.info(
+        "Shard %s: %d candidate start time(s)%s",
+        shard.spec,
+        len(dates),
+        f", {dates[0]:%Y-%m-%dT%H} - {dates[-1]:%Y-%m-%dT%H}" if dates else "",
+    )
+    if dates:
+        aorc_preflight.assert_years_available(
+            start_date=f"{dates[0]:%Y-%m-%d}",
+            end_date=f"{dates[-1]:%Y-%m-%d}",
+            storm_duration_hours=max(durations),
+        )
+
+    # The working catalog stays out of the output dir, which every shard
+    # uploads to: a shard job only contributes its shard files.
+    catalog = new_catalog(
+        catalog_id,
+        str(ctx.get("config_path", local_root / "config.json")),
+        local_directory=str(local_root / SHARD_WORKDIR),
+        catalog_description=attrs["catalog_description"],
+    )
+    scans = {}
+    for d in durations:
+        stats_csv = scan_progress.stats_csv_path(catalog, d)
+        scans[d] = (stats_csv, scan_progress.prepare_resume(stats_csv, dates))
+
+    aorc_store.install_dataset_cache()
+    try:
+        if dates:
+            with pool.lend_to_stormhub():
+                _score(ctx, catalog, scans, storm_params["num_workers"])
+    except BrokenProcessPool as e:
+        raise _pool_died(storm_params["num_workers"]) from e
+    ctx["metrics"].add(
+        "storms_processed", sum(len(remaining) for _, remaining in scans.values())
+    )
+
+    geometry = stats_index.payload_geometry_key(payload, local_root)
+    wanted = set(dates)
+    for d, (stats_csv, _) in scans.items():
+        rows = stats_index.csv_rows(stats_csv) if stats_csv.exists() else {}
+        collection_id = catalog.spm.storm_collection_id(d)
+        path = shards.local_path(local_root / catalog_id, collection_id, shard)
+        n = stats_index.write(
+            path, [r for r in rows.values() if r.storm_date in wanted], geometry, d
+        )
+        log.info("Shard %s: %d %dh candidate windows in %s", shard.spec, n, d, path)
+
+    ctx["collections"] = {}
+    ctx["storm_params"] = storm_params
+
+
+def _seed_from_index(
+    ctx: dict[str, Any],
+    catalog: Any,
+    stats_csv: Path,
+    geometry: str,
+    storm_duration: int,
+    plan: list[datetime],
+) -> None:
+    """Add a previous run's indexed statistics to ``stats_csv``: from the
+    cache dir, else from the previous run's outputs."""
+    collection_id = catalog.spm.storm_collection_id(storm_duration)
+    path = stats_index.cached_path(ctx["local_root"], collection_id)
+    rows = stats_index.read(path, geometry, storm_duration)
+    if rows is None and ctx.get("pm") is not None:
+        rel_path = f"{collection_id}/{stats_index.INDEX_FILE}"
+        if previous_run.fetch(ctx["pm"], ctx["payload"], rel_path, path):
+            rows = stats_index.read(path, geometry, storm_duration)
+    if rows:
+        n = stats_index.seed(stats_csv, rows, plan)
+        log.info(
+            "Reusing %d of %d candidate windows from the %s storm-stats index",
+            n,
+            len(plan),
+            collection_id,
+        )
+
+
 def process_storms(ctx: dict[str, Any], action: Any) -> None:
     payload = ctx["payload"]
     local_root: Path = ctx["local_root"]
     config_path: Path = ctx.get("config_path", local_root / "config.json")
+    pool: SharedPool = ctx["pool"]
 
     attrs = payload.attributes
     catalog_id = attrs["catalog_id"]
@@ -62,53 +273,240 @@ def process_storms(ctx: dict[str, Any], action: Any) -> None:
             end_date,
         )
 
-    storm_params = {
-        "start_date": attrs["start_date"],
-        "end_date": end_date,
-        "storm_duration": int(attrs.get("storm_duration", "72")),
-        "min_precip_threshold": float(attrs.get("min_precip_threshold", "0.0")),
-        "top_n_events": int(attrs.get("top_n_events", "10")),
-        "check_every_n_hours": int(attrs.get("check_every_n_hours", "24")),
-        "num_workers": resolve_num_workers(attrs),
-        "specific_dates": json.loads(attrs["specific_dates"])
-        if attrs.get("specific_dates")
-        else [],
+    durations, storm_params = _storm_params(attrs, pool)
+    shard = shards.from_payload(payload)
+    if shard is not None:
+        _scan_shard(ctx, shard, durations, storm_params)
+        return
+
+    # Try to resume from a previous run's saved catalog/collections. A query
+    # rebuilds them: N or the threshold may have changed.
+    query = stats_index.query_only(payload)
+    collections = {
+        d: None if query else _try_reload_collection(str(local_root), catalog_id, d)
+        for d in durations
     }
+    pending = [d for d, collection in collections.items() if collection is None]
 
-    # Try to resume from a previous run's saved catalog/collection
-    collection = _try_reload_collection(
-        str(local_root), catalog_id, storm_params["storm_duration"]
-    )
+    # Only the given start times are scored and every one gets an item; no
+    # work scales with start_date..end_date.
+    targeted = bool(storm_params["specific_dates"])
+    # The hourly scan's top-N, refining a check_every_n_hours scan only where
+    # a storm could still make it.
+    stride = 0
+    if adaptive_search.enabled(payload) and not targeted:
+        if not cumsum_search.enabled(payload):
+            log.warning("adaptive_search needs the cumsum search_engine; ignored")
+        elif storm_params["check_every_n_hours"] > 1:
+            stride = storm_params["check_every_n_hours"]
+            storm_params["check_every_n_hours"] = 1
 
-    if collection is None:
-        # Fail fast: HEAD each required AORC year before the multi-hour scan,
+    if pending:
+        # Fail fast: probe each required AORC year before the multi-hour scan,
         # instead of dying mid-scan on a missing year.
-        aorc_preflight.assert_years_available(
-            start_date=attrs["start_date"],
-            end_date=end_date,
-            storm_duration_hours=storm_params["storm_duration"],
-        )
+        plan = storm_stream.scan_plan(storm_params)
+        if targeted:
+            aorc_preflight.assert_years_mirrored(
+                aorc_preflight.window_years(plan, max(pending))
+            )
+        else:
+            aorc_preflight.assert_years_available(
+                start_date=attrs["start_date"],
+                end_date=end_date,
+                storm_duration_hours=max(pending),
+            )
 
-        catalog = new_catalog(
-            catalog_id,
-            str(config_path),
-            local_directory=str(local_root),
-            catalog_description=attrs["catalog_description"],
-        )
+        if len(pending) < len(durations):
+            # new_catalog would save a catalog.json without the collections
+            # reloaded above; add the missing durations to the saved one.
+            catalog = StormCatalog.from_file(
+                os.path.join(str(local_root), catalog_id, "catalog.json")
+            )
+        else:
+            catalog = new_catalog(
+                catalog_id,
+                str(config_path),
+                local_directory=str(local_root),
+                catalog_description=attrs["catalog_description"],
+            )
 
+        # Pick up an interrupted scan: only the start times missing from the
+        # previous run's storm-stats.csv, and from a storm-stats index of the
+        # same geometry, are searched again.
+        geometry = stats_index.payload_geometry_key(payload, local_root)
+        scans = {}
+        for d in pending:
+            stats_csv = scan_progress.stats_csv_path(catalog, d)
+            _seed_from_index(ctx, catalog, stats_csv, geometry, d, plan)
+            if not query:
+                scans[d] = (stats_csv, scan_progress.prepare_resume(stats_csv, plan))
+                continue
+            # A query ranks the seeded csv as it is: nothing is left to scan,
+            # not even prepare_resume's one window.
+            lacking = scan_progress.compact(stats_csv, plan)
+            if lacking:
+                raise RuntimeError(
+                    f"query_stats: the {d}h storm-stats index lacks "
+                    f"{len(lacking)} of the {len(plan)} candidate start times "
+                    f"(first {lacking[0]:%Y-%m-%dT%H}); run without query_stats "
+                    "to scan them"
+                )
+            scans[d] = (stats_csv, [])
+
+        # The cumulative-sum engine scores all but the last start time of
+        # every duration, from one read of the data, and appends them to each
+        # duration's storm-stats.csv; new_collection searches that one itself,
+        # then ranks the whole file and creates the items.
+        search_params = {}
+        for d, (_, remaining) in scans.items():
+            search_params[d] = {**storm_params, "storm_duration": d}
+            if len(remaining) < len(plan):
+                search_params[d]["specific_dates"] = remaining
+        scan_first = None
+        if (
+            not (targeted or stride)
+            and cumsum_search.enabled(payload)
+            and any(len(remaining) > 1 for _, remaining in scans.values())
+        ):
+            scan_first = partial(
+                cumsum_search.search,
+                catalog,
+                {d: remaining[:-1] for d, (_, remaining) in scans.items()},
+                {d: stats_csv for d, (stats_csv, _) in scans.items()},
+                pool,
+                cube_root=_cube_root(ctx),
+            )
+            for d, (_, remaining) in scans.items():
+                search_params[d]["specific_dates"] = remaining[-1:]
+
+        pipelined = storm_stream.pipeline_enabled(payload)
+        if pipelined and query:
+            log.info("pipeline_dss: nothing to overlap for query_stats")
+            pipelined = False
+        elif pipelined and len(durations) > 1:
+            log.warning(
+                "pipeline_dss handles one storm_duration; converting the %d "
+                "durations after the search instead",
+                len(durations),
+            )
+            pipelined = False
+        elif pipelined and targeted:
+            log.info("pipeline_dss: nothing to overlap for specific_dates")
+            pipelined = False
+        elif pipelined and stride:
+            log.info("pipeline_dss: converting after the adaptive search")
+            pipelined = False
+
+        # stormhub's own opens of AORC years in this process are cached too,
+        # as in the pool workers.
+        aorc_store.install_dataset_cache()
+        # Candidate windows searched by this run (a resumed scan only
+        # searches what the previous run didn't finish).
+        searched = sum(len(remaining) for _, remaining in scans.values())
         try:
-            collection = new_collection(catalog, **storm_params)
+            with ExitStack() as stack:
+                for d, (stats_csv, _) in scans.items():
+                    stack.enter_context(
+                        scan_progress.ScanProgress(
+                            local_root,
+                            stats_csv,
+                            plan,
+                            search_params[d],
+                            filename=scan_progress.SCAN_PROGRESS_FILE
+                            if len(durations) == 1
+                            else f"scan-progress-{d}hr.json",
+                        )
+                    )
+                stack.enter_context(pool.lend_to_stormhub())
+                if pipelined:
+                    # Convert storms to DSS as they become final instead of
+                    # after the whole scan; convert-to-dss then only fills the
+                    # gaps.
+                    (d,) = pending
+                    collections[d] = storm_stream.run_pipelined(
+                        catalog,
+                        search_params[d],
+                        dss_dir=local_root / catalog_id / "data",
+                        transposition_file=str(
+                            local_root
+                            / Path(payload.inputs[0].paths["transposition"]).name
+                        ),
+                        catalog_id=catalog_id,
+                        checkpoint=ctx["checkpoint"],
+                        plan=plan,
+                        pool=pool,
+                        scan_first=scan_first,
+                    )
+                elif query:
+                    for d, (stats_csv, _) in scans.items():
+                        collections[d] = (
+                            _specific_collection(
+                                catalog, stats_csv, plan, d, storm_params["num_workers"]
+                            )
+                            if targeted
+                            else stats_index.rank_collection(
+                                catalog,
+                                d,
+                                storm_params["min_precip_threshold"],
+                                storm_params["top_n_events"],
+                                storm_params["num_workers"],
+                            )
+                        )
+                elif targeted:
+                    _score(ctx, catalog, scans, storm_params["num_workers"])
+                    for d, (stats_csv, _) in scans.items():
+                        collections[d] = _specific_collection(
+                            catalog, stats_csv, plan, d, storm_params["num_workers"]
+                        )
+                elif stride:
+                    scored = adaptive_search.search(
+                        catalog,
+                        plan,
+                        {d: stats_csv for d, (stats_csv, _) in scans.items()},
+                        local_root,
+                        stride,
+                        storm_params["top_n_events"],
+                        storm_params["min_precip_threshold"],
+                        pool,
+                        pool.max_workers,
+                        cube_root=_cube_root(ctx),
+                    )
+                    searched = sum(
+                        len(scored[d]) - (len(plan) - len(remaining))
+                        for d, (_, remaining) in scans.items()
+                    )
+                    for d, (stats_csv, _) in scans.items():
+                        # new_collection rescores one scored window, then
+                        # ranks them all.
+                        search_params[d]["specific_dates"] = (
+                            scan_progress.prepare_resume(stats_csv, scored[d])
+                            or plan[-1:]
+                        )
+                        collections[d] = new_collection(catalog, **search_params[d])
+                else:
+                    if scan_first is not None:
+                        scan_first(pool.max_workers)
+                    for d in pending:
+                        collections[d] = new_collection(catalog, **search_params[d])
+            ctx["metrics"].add("storms_processed", searched)
         except BrokenProcessPool as e:
+            raise _pool_died(storm_params["num_workers"]) from e
+        for d, (stats_csv, _) in scans.items():
+            stats_index.save(
+                stats_csv,
+                local_root,
+                catalog.spm.storm_collection_id(d),
+                geometry,
+                d,
+            )
+        missing = [d for d in pending if collections[d] is None]
+        if missing:
             raise RuntimeError(
-                f"Storm processing pool died with num_workers="
-                f"{storm_params['num_workers']} (likely OOM). Lower via "
-                "'num_workers' payload attribute or CC_NUM_WORKERS env."
-            ) from e
-        if collection is None:
-            raise RuntimeError("no storms found matching criteria")
+                f"no storms found matching criteria for storm_duration {missing}"
+            )
 
-    log.info("Catalog and collection ready")
+    log.info("Catalog and %d collection(s) ready", len(collections))
 
-    # Store collection in context for downstream actions
-    ctx["collection"] = collection
+    # Store collections in context for downstream actions, by duration
+    ctx["collections"] = collections
     ctx["storm_params"] = storm_params
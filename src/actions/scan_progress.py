@@ -0,0 +1,206 @@
+"""Resume an interrupted process-storms scan from where it stopped.
+
+``new_collection`` evaluates every candidate start time and only then ranks,
+so before this module a SIGTERM or OOM hours into a multi-year scan threw the
+whole scan away: ``_try_reload_collection`` needs a finished collection.
+
+stormhub already appends one flushed ``storm-stats.csv`` row per finished
+candidate window, and that file is all the ranking step reads. It survives in
+the cache dir, so it *is* the durable record of which start times are done.
+On restart ``prepare_resume`` compacts it (drops the torn last line of a killed
+writer, duplicates, and rows outside the current scan) and returns the start
+times still missing; process-storms hands just those to ``new_collection`` as
+``specific_dates``. The new rows are appended to the same file and the ranking
+still sees the whole scan, so the catalog is identical to an uninterrupted run.
+
+While the scan runs, ``ScanProgress`` also snapshots progress and the running
+top-N (with statistics) to ``scan-progress.json`` (``scan-progress-24hr.json``
+etc. when a run scans several durations) in the cache dir every
+``SCAN_PROGRESS_SECONDS``, for operators watching a long scan and for the
+post-mortem of one that died. It lives outside the catalog dir, so it is never
+uploaded.
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from actions.storm_stream import (
+    StatsTail,
+    StormStat,
+    TopNSelector,
+    parse_stats_row,
+)
+
+log = logging.getLogger(__name__)
+
+SCAN_PROGRESS_FILE = "scan-progress.json"
+SCAN_PROGRESS_SECONDS = float(os.environ.get("SCAN_PROGRESS_SECONDS", "60"))
+STATS_HEADER = "storm_date,min,mean,max,x,y"
+
+
+def stats_csv_path(catalog: Any, storm_duration: int) -> Path:
+    """The ``storm-stats.csv`` new_collection appends to for this duration."""
+    collection_id = catalog.spm.storm_collection_id(storm_duration)
+    return Path(catalog.spm.collection_dir(collection_id)) / "storm-stats.csv"
+
+
+def _kept_lines(stats_csv: Path, plan: list[datetime]) -> dict[datetime, str]:
+    """The first complete row of each of ``plan``'s start times in
+    ``stats_csv``, by start time."""
+    wanted = set(plan)
+    kept: dict[datetime, str] = {}
+    # A line without its newline was being written when the job died.
+    for line in stats_csv.read_text(encoding="utf-8").splitlines(keepends=True):
+        if not line.endswith("\n"):
+            continue
+        row = parse_stats_row(line.rstrip("\n"))
+        if row is not None and row.storm_date in wanted:
+            kept.setdefault(row.storm_date, line)
+    return kept
+
+
+def _rewrite(stats_csv: Path, kept: dict[datetime, str]) -> None:
+    tmp = stats_csv.with_name(stats_csv.name + ".tmp")
+    tmp.write_text(STATS_HEADER + "\n" + "".join(kept.values()), encoding="utf-8")
+    os.replace(tmp, stats_csv)
+
+
+def compact(stats_csv: Path, plan: list[datetime]) -> list[datetime]:
+    """Compact ``stats_csv`` to one row per scanned date of ``plan`` and
+    return the dates it lacks — every row is kept, for ranking without a
+    search."""
+    if not stats_csv.exists():
+        return plan
+    kept = _kept_lines(stats_csv, plan)
+    _rewrite(stats_csv, kept)
+    return [d for d in plan if d not in kept]
+
+
+def prepare_resume(stats_csv: Path, plan: list[datetime]) -> list[datetime]:
+    """Compact a previous run's ``stats_csv`` and return the dates left to scan.
+
+    When every date is already scanned, the last one is dropped and returned so
+    new_collection still has a date to run (an empty ``specific_dates`` would
+    make it rescan the whole range) — one window instead of the whole scan.
+    """
+    if not stats_csv.exists():
+        return plan
+
+    kept = _kept_lines(stats_csv, plan)
+    remaining = [d for d in plan if d not in kept]
+    if plan and not remaining:
+        del kept[plan[-1]]
+        remaining = [plan[-1]]
+    _rewrite(stats_csv, kept)
+
+    if kept:
+        log.info(
+            "Resuming storm search: %d/%d candidate start times already scanned, "
+            "continuing from %s",
+            len(kept),
+            len(plan),
+            remaining[0],
+        )
+    return remaining
+
+
+class ScanProgress:
+    """Snapshot scan progress to ``SCAN_PROGRESS_FILE`` on a background thread.
+
+    Use as a context manager around the scan; a last snapshot is written on
+    exit, including when the scan is interrupted.
+    """
+
+    def __init__(
+        self,
+        local_root: Path,
+        stats_csv: Path,
+        plan: list[datetime],
+        storm_params: dict[str, Any],
+        interval: float = SCAN_PROGRESS_SECONDS,
+        filename: str = SCAN_PROGRESS_FILE,
+    ) -> None:
+        self.path = local_root / filename
+        self._tail = StatsTail(stats_csv)
+        self._plan = sorted(plan)
+        self._params = storm_params
+        self._interval = interval
+        # A flag per plan date and the running top-N, not every row: the
+        # snapshot costs the same at any length of the period of record.
+        self._scanned = bytearray(len(self._plan))
+        self._n_scanned = 0
+        self._cursor = 0  # first plan date without a row
+        self._top = TopNSelector(
+            storm_params["storm_duration"],
+            storm_params["top_n_events"],
+            storm_params["min_precip_threshold"],
+        )
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="scan-progress", daemon=True
+        )
+
+    def __enter__(self) -> ScanProgress:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._write_logged()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            self._write_logged()
+
+    def _write_logged(self) -> None:
+        # Progress reporting must never take the scan down with it.
+        try:
+            self.write()
+        except OSError as e:
+            log.warning("Could not write %s: %s", self.path, e)
+
+    def write(self) -> None:
+        for row in self._tail.read_new_rows():
+            self._record(row)
+
+        params = self._params
+        plan = self._plan
+        next_start = plan[self._cursor] if self._cursor < len(plan) else None
+        # Provisional: windows near the end of what has been scanned can still
+        # be displaced once their neighbours finish.
+        top = self._top.ranked(drop_tail=False)
+
+        snapshot = {
+            "updated": datetime.now().isoformat(timespec="seconds"),
+            "storm_duration": params["storm_duration"],
+            "candidates": len(self._plan),
+            "scanned": self._n_scanned,
+            "next_start": next_start.isoformat() if next_start else None,
+            "top_n": [
+                {**row._asdict(), "storm_date": row.storm_date.isoformat()}
+                for row in top
+            ],
+        }
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(snapshot, indent=2), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def _record(self, row: StormStat) -> None:
+        self._top.add(row)
+        plan = self._plan
+        i = bisect.bisect_left(plan, row.storm_date)
+        if i == len(plan) or plan[i] != row.storm_date or self._scanned[i]:
+            return
+        self._scanned[i] = 1
+        self._n_scanned += 1
+        while self._cursor < len(plan) and self._scanned[self._cursor]:
+            self._cursor += 1
@@ -0,0 +1,117 @@
+"""Split one catalog's storm search over several Cloud Compute jobs.
+
+A shard job (``shard`` payload attribute) runs process-storms over part of the
+candidate start times of ``start_date``..``end_date`` — either the k-th of n
+contiguous slices (``"3/8"``) or an explicit date range
+(``"2000-01-01/2009-12-31"``) — and uploads its candidates, every window's
+statistics, as a storm-stats index (``stats_index``) under
+``output_path/shards/<collection id>/``. It ranks nothing and creates no items.
+
+A merge job (the ``merge-storms`` action, ``shards`` attribute listing the
+shards) fetches them all, drops duplicate start times (overlapping ranges),
+and builds the catalog from their union as process-storms would: the whole
+period is ranked at once, so a storm near a shard boundary is declustered
+against its neighbours in the next shard. Each window belongs to the shard of
+its start time and was scored over its full duration, reading past the end of
+its shard where needed, so no window is cut at a boundary.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, NamedTuple, Sequence
+
+SHARDS_DIRNAME = "shards"
+_SLICE = re.compile(r"(\d+)/(\d+)")
+_RANGE = re.compile(r"(\d{4}-\d{2}-\d{2})/(\d{4}-\d{2}-\d{2})")
+
+
+class Shard(NamedTuple):
+    """The k-th of n slices of the candidate start times, or a date range."""
+
+    spec: str
+    index: int = 0
+    count: int = 0
+    first: datetime | None = None
+    last: datetime | None = None  # inclusive day
+
+    @property
+    def name(self) -> str:
+        if self.count:
+            return f"shard-{self.index:03d}-of-{self.count:03d}"
+        return f"shard-{self.first:%Y%m%d}-{self.last:%Y%m%d}"
+
+
+def parse(spec: str) -> Shard:
+    """A ``shard`` attribute value: ``"k/n"`` (1 <= k <= n) or
+    ``"YYYY-MM-DD/YYYY-MM-DD"``. Raises ValueError otherwise."""
+    spec = spec.strip()
+    if m := _RANGE.fullmatch(spec):
+        first, last = (datetime.fromisoformat(d) for d in m.groups())
+        if last < first:
+            raise ValueError(f"shard {spec!r}: range ends before it starts")
+        return Shard(spec, first=first, last=last)
+    if m := _SLICE.fullmatch(spec):
+        index, count = (int(v) for v in m.groups())
+        if not 1 <= index <= count:
+            raise ValueError(f"shard {spec!r}: expected k/n with 1 <= k <= n")
+        return Shard(spec, index=index, count=count)
+    raise ValueError(f"shard {spec!r}: expected 'k/n' or 'YYYY-MM-DD/YYYY-MM-DD'")
+
+
+def is_valid(spec: str) -> bool:
+    try:
+        parse(spec)
+    except ValueError:
+        return False
+    return True
+
+
+def from_payload(payload: Any) -> Shard | None:
+    """The shard this job scans, or None for a whole-period job."""
+    spec = payload.attributes.get("shard")
+    return parse(spec) if spec else None
+
+
+def merge_specs(value: str) -> list[Shard]:
+    """The ``shards`` attribute of a merge job: a shard count (``"8"`` for
+    ``1/8`` .. ``8/8``) or a JSON list of shard specs."""
+    value = value.strip()
+    if value.isdigit():
+        count = int(value)
+        if count < 1:
+            raise ValueError("shards: expected at least one shard")
+        return [parse(f"{k}/{count}") for k in range(1, count + 1)]
+    specs = json.loads(value)
+    if not isinstance(specs, list) or not specs:
+        raise ValueError("shards: expected a count or a JSON list of shard specs")
+    return [parse(str(spec)) for spec in specs]
+
+
+def merge_specs_valid(value: str) -> bool:
+    try:
+        merge_specs(value)
+    except ValueError:  # JSONDecodeError included
+        return False
+    return True
+
+
+def select(shard: Shard, plan: Sequence[datetime]) -> list[datetime]:
+    """``shard``'s candidate start times out of the whole ``plan``."""
+    if shard.count:
+        n, k = len(plan), shard.index
+        return list(plan[n * (k - 1) // shard.count : n * k // shard.count])
+    end = shard.last + timedelta(days=1)
+    return [d for d in plan if shard.first <= d < end]
+
+
+def rel_path(collection_id: str, shard: Shard) -> str:
+    """Where a shard's candidates live, relative to the output dir."""
+    return f"{SHARDS_DIRNAME}/{collection_id}/{shard.name}.npz"
+
+
+def local_path(output_dir: Path, collection_id: str, shard: Shard) -> Path:
+    return output_dir / rel_path(collection_id, shard)
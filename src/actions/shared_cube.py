@@ -0,0 +1,235 @@
+"""One decoded copy of the clipped AORC domain, shared by every pool worker.
+
+Each search task (``cumsum_search``) and each DSS batch (``convert_to_dss``)
+used to open the AORC stores, clip the transposition domain and decode its
+own copy of the hours it needs, so a worker's memory grew with the domain and
+the pool could afford few workers. With ``shared_cube: "true"`` in the
+payload the plugin process does that load once: ``build`` writes every hour
+the tasks will read, clipped exactly as the tasks clip it, to raw float32
+files under ``SHARED_CUBE_DIRNAME`` of the cache dir, ``SHARED_CUBE_FILL_HOURS``
+at a time. Tasks get the cube's path and ``attach`` it as read-only
+``np.memmap`` views; ``dataset`` wraps the hours a task needs as the xarray
+Dataset its own load would have returned. The pages live once, in the page
+cache every worker maps, and a worker's own memory scales with what it
+computes and writes.
+
+A cube only holds the hours of its spans (a search segment, or the top-N
+storms' windows), in time order with gaps between spans. ``cube.json`` is
+written last, so a cube without it is incomplete and is never attached.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import uuid
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Iterable, NamedTuple, Sequence
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Under the cache dir; each cube is removed once its tasks have run.
+SHARED_CUBE_DIRNAME = "aorc-cube"
+# Hours the plugin process decodes per load while filling a cube.
+SHARED_CUBE_FILL_HOURS = int(os.environ.get("SHARED_CUBE_FILL_HOURS", "720"))
+# Most hours one search cube spans; a longer scan is searched a segment at a
+# time, the next segment filled while the current one is searched.
+SHARED_CUBE_MAX_HOURS = int(os.environ.get("SHARED_CUBE_MAX_HOURS", "8784"))
+CUBE_FILE = "cube.json"
+COORDS_FILE = "coords.npz"
+CUBE_VERSION = 1
+HOUR = timedelta(hours=1)
+
+
+class Cube(NamedTuple):
+    """An attached cube: read-only ``(time, latitude, longitude)`` views."""
+
+    path: Path
+    variables: dict[str, np.ndarray]
+    attrs: dict[str, dict[str, Any]]
+    times: np.ndarray  # datetime64[ns]
+    latitude: np.ndarray
+    longitude: np.ndarray
+    crs: str
+
+
+# The cube this process attached last. A single slot: a finished cube's
+# files are deleted, and a mapping kept here would hold their disk space.
+_attached: dict[str, Cube] = {}
+
+
+def enabled(payload: Any) -> bool:
+    """True when the payload asks workers to share one decoded AORC cube."""
+    return payload.attributes.get("shared_cube", "").lower() == "true"
+
+
+def merge_spans(
+    spans: Iterable[tuple[datetime, datetime]],
+) -> list[tuple[datetime, datetime]]:
+    """Hour ranges ``[first, last]`` in time order, overlapping or adjacent
+    ones merged."""
+    merged: list[tuple[datetime, datetime]] = []
+    for first, last in sorted(spans):
+        if merged and first <= merged[-1][1] + HOUR:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def segments(
+    spans: Sequence[tuple[datetime, datetime]], max_hours: int
+) -> list[list[int]]:
+    """Indices of time-ordered ``spans`` in consecutive runs whose union
+    spans at most ``max_hours`` (a longer span gets a run of its own)."""
+    runs: list[list[int]] = []
+    first = None
+    for i, (start, end) in enumerate(spans):
+        if runs and end - first < timedelta(hours=max_hours):
+            runs[-1].append(i)
+        else:
+            runs.append([i])
+            first = start
+    return runs
+
+
+def build(
+    root: Path,
+    spans: Iterable[tuple[datetime, datetime]],
+    load: Callable[[datetime, datetime], Any],
+) -> Path:
+    """Fill a new cube under ``root`` with every hour of ``spans``; returns
+    its path, the name tasks ``attach`` it by.
+
+    ``load(first, last)`` returns the clipped hours ``[first, last]`` as an
+    xarray Dataset with ``time``, ``latitude`` and ``longitude`` dims, as a
+    task would load them itself.
+    """
+    path = root / SHARED_CUBE_DIRNAME / uuid.uuid4().hex[:12]
+    path.mkdir(parents=True)
+    attrs: dict[str, dict[str, Any]] = {}
+    times: list[np.ndarray] = []
+    grid: tuple[np.ndarray, np.ndarray] | None = None
+    crs = ""
+    try:
+        with ExitStack() as stack:
+            files: dict[str, Any] = {}
+            for first, last in merge_spans(spans):
+                t0 = first
+                while t0 <= last:
+                    t1 = min(last, t0 + (SHARED_CUBE_FILL_HOURS - 1) * HOUR)
+                    ds = load(t0, t1)
+                    if grid is None:
+                        grid = (ds["latitude"].values, ds["longitude"].values)
+                        crs = ds.rio.crs.to_wkt()
+                        for name in ds.data_vars:
+                            attrs[name] = _plain(ds[name].attrs)
+                            files[name] = stack.enter_context(
+                                open(path / f"{name}.f32", "wb")
+                            )
+                    elif not (
+                        np.array_equal(ds["latitude"].values, grid[0])
+                        and np.array_equal(ds["longitude"].values, grid[1])
+                    ):
+                        raise ValueError(f"AORC {t0}..{t1} is on another grid")
+                    for name, f in files.items():
+                        values = ds[name].transpose("time", "latitude", "longitude")
+                        f.write(np.ascontiguousarray(values.values, np.float32).data)
+                    times.append(ds["time"].values.astype("datetime64[ns]"))
+                    t0 = t1 + HOUR
+        if grid is None:
+            raise ValueError("no hours to load into a shared cube")
+        time = np.concatenate(times)
+        np.savez(path / COORDS_FILE, time=time, latitude=grid[0], longitude=grid[1])
+        (path / CUBE_FILE).write_text(
+            json.dumps({"version": CUBE_VERSION, "variables": attrs, "crs": crs}),
+            encoding="utf-8",
+        )
+    except BaseException:
+        remove(path)
+        raise
+    log.info(
+        "Shared AORC cube %s: %d h of %d x %d cells, %s (%.0f MB)",
+        path.name,
+        len(time),
+        len(grid[0]),
+        len(grid[1]),
+        "/".join(attrs),
+        sum(f.stat().st_size for f in path.glob("*.f32")) / 2**20,
+    )
+    return path
+
+
+def attach(path: str | Path) -> Cube:
+    """The cube at ``path`` as read-only memory maps, from this process if
+    it attached it already."""
+    path = Path(path)
+    cube = _attached.get(str(path))
+    if cube is not None:
+        return cube
+    meta = json.loads((path / CUBE_FILE).read_text(encoding="utf-8"))
+    if meta["version"] != CUBE_VERSION:
+        raise ValueError(f"shared cube {path} has version {meta['version']}")
+    with np.load(path / COORDS_FILE) as coords:
+        times, lat, lon = coords["time"], coords["latitude"], coords["longitude"]
+    shape = (len(times), len(lat), len(lon))
+    cube = Cube(
+        path,
+        {
+            name: np.memmap(path / f"{name}.f32", np.float32, mode="r", shape=shape)
+            for name in meta["variables"]
+        },
+        meta["variables"],
+        times,
+        lat,
+        lon,
+        meta["crs"],
+    )
+    _attached.clear()
+    _attached[str(path)] = cube
+    return cube
+
+
+def dataset(cube: Cube, first: datetime, last: datetime) -> Any:
+    """The cube's hours in ``[first, last]`` as an xarray Dataset of views,
+    with its CRS, as the task's own load would have returned them."""
+    import rioxarray  # noqa: F401  (registers .rio)
+    import xarray as xr
+
+    lo = np.searchsorted(cube.times, np.datetime64(first, "ns"), side="left")
+    hi = np.searchsorted(cube.times, np.datetime64(last, "ns"), side="right")
+    dims = ("time", "latitude", "longitude")
+    ds = xr.Dataset(
+        {
+            name: (dims, values[lo:hi], dict(cube.attrs[name]))
+            for name, values in cube.variables.items()
+        },
+        coords={
+            "time": cube.times[lo:hi],
+            "latitude": cube.latitude,
+            "longitude": cube.longitude,
+        },
+    )
+    ds = ds.rio.set_spatial_dims(x_dim="longitude", y_dim="latitude")
+    return ds.rio.write_crs(cube.crs)
+
+
+def remove(path: str | Path) -> None:
+    """Delete a cube once its tasks have run."""
+    _attached.pop(str(path), None)
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def _plain(attrs: dict[str, Any]) -> dict[str, Any]:
+    """The JSON-storable attributes of a variable (units and the like)."""
+    return {
+        key: value.item() if isinstance(value, np.generic) else value
+        for key, value in attrs.items()
+        if isinstance(value, (str, int, float, np.generic))
+    }
@@ -0,0 +1,212 @@
+"""Regrid AORC to the SHG grid of the DSS files from a cached index map.
+
+stormhub's ``write_to_dss`` reprojects every storm's clipped AORC stack to
+SHG with ``rio.reproject`` (nearest neighbour), rebuilding the warp for each
+storm, each variable and each block of 144 hours. The grids never change
+within a run: every storm is clipped to the same transposition domain and
+written at ``DSS_OUTPUT_RESOLUTION_KM``.
+
+Nearest-neighbour resampling copies one source cell into each SHG cell, so
+the whole warp is an index map: for every SHG cell, the flat index of its
+source cell, or -1 outside the source grid. ``index_map`` gets it by
+reprojecting a grid of cell indices once with the same arguments
+``write_to_dss`` uses, and stores it in ``SHG_REGRID_DIRNAME`` of the cache
+dir, keyed by the transposition geometry (``stats_index.geometry_key``) and
+resolution; it is kept when a successful run cleans up. ``regrid`` then maps
+a storm's whole time stack with one NumPy gather, and ``write_dss`` writes
+the grids exactly as ``write_to_dss`` does.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from actions import stats_index
+
+log = logging.getLogger(__name__)
+
+# Under the cache dir; kept when a successful run cleans up.
+SHG_REGRID_DIRNAME = "shg-regrid"
+INDEX_MAP_VERSION = 1
+
+
+class IndexMap(NamedTuple):
+    """Source cell of every SHG cell, and where the SHG grid sits."""
+
+    index: Any  # (rows, cols) flat source-cell indices, -1 for none
+    lower_x: int  # SHG column of the lower-left cell
+    lower_y: int  # SHG row of the lower-left cell
+    source: tuple  # source grid: (rows, cols, *transform)
+
+
+# Index maps this process has loaded, by file.
+_loaded: dict[Path, IndexMap] = {}
+
+
+def source_grid(data: Any) -> tuple:
+    """What an index map depends on besides the geometry: the clipped AORC
+    grid's shape and affine transform."""
+    transform = data.rio.transform()
+    return (data.rio.height, data.rio.width, *(round(v, 9) for v in transform[:6]))
+
+
+def cached_path(cache_dir: Path, geometry: str, resolution_km: int) -> Path:
+    """Where ``cache_dir`` keeps the index map of a geometry and resolution."""
+    return cache_dir / SHG_REGRID_DIRNAME / f"{geometry[:16]}-{resolution_km}km.npz"
+
+
+def write(path: Path, imap: IndexMap) -> None:
+    import numpy as np
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Workers may build the same map at once; each renames its own file.
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        np.savez_compressed(
+            f,
+            index=imap.index,
+            lower=np.array([imap.lower_x, imap.lower_y]),
+            source=np.array(imap.source, dtype=np.float64),
+            version=np.array(INDEX_MAP_VERSION),
+        )
+    os.replace(tmp, path)
+
+
+def read(path: Path, source: tuple) -> IndexMap | None:
+    """The index map at ``path``; None if it is missing, unreadable, or was
+    built for another source grid."""
+    import numpy as np
+
+    if not path.exists():
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as stored:
+            if int(stored["version"]) != INDEX_MAP_VERSION or not np.array_equal(
+                stored["source"], np.array(source, dtype=np.float64)
+            ):
+                log.info("Ignoring %s: built for another AORC grid", path)
+                return None
+            lower_x, lower_y = stored["lower"].tolist()
+            return IndexMap(stored["index"], lower_x, lower_y, source)
+    except (OSError, KeyError, ValueError) as e:
+        log.warning("Ignoring unreadable SHG index map %s: %s", path, e)
+        return None
+
+
+def build(data: Any, resolution_km: int) -> IndexMap:
+    """Reproject a grid of ``data``'s cell indices to SHG as ``write_to_dss``
+    reprojects ``data``."""
+    import numpy as np
+    import rasterio
+    import rioxarray  # noqa: F401  (registers .rio)
+    import xarray as xr
+    from stormhub.met.consts import KM_TO_M_CONVERSION_FACTOR
+    from stormhub.utils import get_shg_reprojection_kwargs
+
+    grid = data.isel(time=0, drop=True) if "time" in data.dims else data
+    y, x = grid.rio.y_dim, grid.rio.x_dim
+    grid = grid.transpose(y, x)
+    rows, cols = grid.shape
+    cells = xr.DataArray(
+        np.arange(rows * cols, dtype=np.int32).reshape(rows, cols),
+        coords={y: grid[y].values, x: grid[x].values},
+        dims=(y, x),
+    )
+    cells = cells.rio.set_spatial_dims(x_dim=x, y_dim=y)
+    cells = cells.rio.write_crs(grid.rio.crs).rio.write_transform(grid.rio.transform())
+    cells = cells.rio.write_nodata(-1)
+    kwargs, lower_x, lower_y = get_shg_reprojection_kwargs(
+        grid,
+        resolution_km * KM_TO_M_CONVERSION_FACTOR,
+        rasterio.enums.Resampling.nearest,
+    )
+    index = cells.rio.reproject(**kwargs).values.astype(np.int32)
+    return IndexMap(index, lower_x, lower_y, source_grid(grid))
+
+
+def index_map(
+    data: Any, transposition_file: str | Path, resolution_km: int, cache_dir: Path
+) -> IndexMap:
+    """The index map from ``data``'s grid to SHG, from this process, the
+    cache dir, or built and stored there."""
+    geometry = stats_index.geometry_key(transposition_file)
+    path = cached_path(cache_dir, geometry, resolution_km)
+    source = source_grid(data)
+    imap = _loaded.get(path)
+    if imap is None or imap.source != source:
+        imap = read(path, source)
+        if imap is None:
+            log.info("Building the SHG %d km index map %s", resolution_km, path.name)
+            imap = build(data, resolution_km)
+            write(path, imap)
+        _loaded[path] = imap
+    return imap
+
+
+def regrid(values: Any, imap: IndexMap) -> Any:
+    """``values`` (time, rows, cols) on the SHG grid (time, SHG rows, SHG
+    cols); cells without a source cell are NaN, as after ``rio.reproject``."""
+    import numpy as np
+
+    flat = values.reshape(values.shape[0], -1)
+    out = np.full((values.shape[0], *imap.index.shape), np.nan, dtype=flat.dtype)
+    inside = imap.index >= 0
+    out[:, inside] = flat[:, imap.index[inside]]
+    return out
+
+
+def write_dss(
+    output_dss_path: str,
+    data: Any,
+    imap: IndexMap,
+    aoi_name: str,
+    variable: Any,
+    resolution_km: int,
+) -> None:
+    """Write ``data`` of ``variable`` (a ``NOAADataVariable``) to DSS, one
+    SHG grid per hour, with the paths and metadata of ``write_to_dss``."""
+    import numpy as np
+    from hecdss import HecDss
+    from pandas import Timestamp
+    from stormhub.met.consts import KM_TO_M_CONVERSION_FACTOR, SHG_WKT
+    from stormhub.met.zarr_to_dss import (
+        DSSPath,
+        create_gridded_data,
+        date_range_dss_path_format,
+    )
+
+    values = data.transpose("time", data.rio.y_dim, data.rio.x_dim).values
+    grids = regrid(values, imap)
+    measurement = variable.measurement_type
+    dss = HecDss(output_dss_path)
+    try:
+        for time, grid in zip(data.time.values, grids):
+            start, end = date_range_dss_path_format(
+                Timestamp(time).to_pydatetime(), measurement
+            )
+            path = DSSPath(
+                f"SHG{resolution_km}K",
+                aoi_name.upper(),
+                variable.dss_variable_title.upper(),
+                start,
+                end,
+                "AORC",
+            )
+            dss.put(
+                create_gridded_data(
+                    path=path,
+                    data=np.flipud(grid),
+                    grid_type="albers_with_time_ref",
+                    data_type=measurement.value,
+                    cell_size=resolution_km * KM_TO_M_CONVERSION_FACTOR,
+                    data_units=variable.measurement_unit,
+                    srs_definition=SHG_WKT,
+                    lower_left_cell_x=imap.lower_x,
+                    lower_left_cell_y=imap.lower_y,
+                )
+            )
+    finally:
+        dss.close()
@@ -0,0 +1,112 @@
+"""Build a collection for exactly the payload's ``specific_dates``.
+
+``specific_dates`` re-runs a handful of known events. The scan itself only
+evaluates those start times, but the rest of the run was still sized for
+``start_date``..``end_date``: the AORC pre-flight probed, and prefetch-aorc
+fetched, every year of the range, and stormhub's ranking applied the
+threshold, declustering and top-N to the dates — always dropping the latest
+one, whose window ends after the last candidate.
+
+A targeted run instead probes and prefetches only the years and chunks the
+dates' windows read, scores those windows, and creates an item for every
+date, ranked by mean precipitation, with stormhub's ``create_items`` (which
+places each storm's transposition). The collection is finished as
+``new_collection`` finishes its own. Work scales with the number of dates,
+not the length of the date range.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Sequence
+
+from actions.storm_stream import STATS_DATE_FORMAT, StormStat, parse_dates
+
+log = logging.getLogger(__name__)
+
+RANKED_STORMS_FILE = "ranked-storms.csv"  # as StormAnalyzer.rank_and_save
+RANKED_STORMS_HEADER = "storm_date,mean,min,max,por_rank,annual_rank"
+
+
+def from_attrs(attrs: dict[str, Any]) -> list[datetime]:
+    """The payload's ``specific_dates``; empty for a date-range run."""
+    values = attrs.get("specific_dates")
+    return parse_dates(json.loads(values)) if values else []
+
+
+def windows(
+    dates: Sequence[datetime], storm_duration: int
+) -> list[tuple[datetime, datetime]]:
+    """First and last AORC hour each date's window reads."""
+    return [
+        (d + timedelta(hours=1), d + timedelta(hours=storm_duration)) for d in dates
+    ]
+
+
+def rank(rows: Sequence[StormStat]) -> list[dict[str, Any]]:
+    """Every window by descending mean, with its period-of-record and
+    calendar-year rank — no threshold, declustering, or top-N."""
+    records: list[dict[str, Any]] = []
+    year_ranks: dict[int, int] = {}
+    ordered = sorted(rows, key=lambda row: (-row.mean, row.storm_date))
+    for por_rank, row in enumerate(ordered, start=1):
+        year = row.storm_date.year
+        year_ranks[year] = year_ranks.get(year, 0) + 1
+        records.append(
+            {
+                "storm_date": row.storm_date,
+                "mean": row.mean,
+                "min": row.min,
+                "max": row.max,
+                "por_rank": por_rank,
+                "annual_rank": year_ranks[year],
+            }
+        )
+    return records
+
+
+def write_ranked(path: Path, records: Sequence[dict[str, Any]]) -> None:
+    """``ranked-storms.csv`` with the columns stormhub writes."""
+    lines = [RANKED_STORMS_HEADER]
+    lines += [
+        f"{r['storm_date'].strftime(STATS_DATE_FORMAT)},{r['mean']},{r['min']},"
+        f"{r['max']},{r['por_rank']},{r['annual_rank']}"
+        for r in records
+    ]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def build_collection(
+    catalog: Any, rows: Sequence[StormStat], storm_duration: int, num_workers: int
+) -> Any:
+    """Create an item for each of ``rows`` and add their collection to
+    ``catalog``, as ``new_collection`` would for its top-N."""
+    from stormhub.met.storm_catalog import create_items
+
+    collection_id = catalog.spm.storm_collection_id(storm_duration)
+    records = rank(rows)
+    ranked_csv = Path(catalog.spm.collection_dir(collection_id)) / RANKED_STORMS_FILE
+    write_ranked(ranked_csv, records)
+
+    log.info("Creating items for %d specific date(s)", len(records))
+    create_items(
+        records, catalog, storm_duration=storm_duration, num_workers=num_workers
+    )
+    return finish_collection(catalog, collection_id, ranked_csv)
+
+
+def finish_collection(catalog: Any, collection_id: str, ranked_csv: Path) -> Any:
+    """Collect the items created on disk into ``collection_id`` and add it to
+    ``catalog``, as ``new_collection`` finishes its own."""
+    collection = catalog.new_collection_from_items_on_disk(collection_id)
+    collection.add_ranked_storms_asset(str(ranked_csv), catalog.spm)
+    collection.add_summary_stats(catalog.spm)
+    collection.watershed_centroid_feature_collection(catalog.spm)
+    collection.max_precip_feature_collection(catalog.spm)
+    catalog.add_collection_to_catalog(collection, override=True)
+    catalog.save_catalog()
+    return collection
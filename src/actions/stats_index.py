@@ -0,0 +1,198 @@
+"""Persisted index of every candidate window's storm statistics.
+
+Only the top-N survives in the STAC collection, so changing ``top_n_events``
+or ``min_precip_threshold`` used to mean the whole multi-hour scan again.
+After each collection is built, process-storms stores every row of its
+``storm-stats.csv`` (start time, min/mean/max precipitation, and the centroid
+of the best transposition) as columns of a compressed NumPy archive,
+``INDEX_FILE``, next to the csv. It is uploaded with the catalog, and a copy
+is kept in ``STATS_INDEX_DIRNAME`` of the cache dir, which survives cleanup.
+
+A later run looks for an index in the cache dir, then in the previous run's
+outputs (``previous_run``: ``output_path``, or ``extend_from``).
+If it was built for the same watershed and transposition geometry
+(``geometry_key``) and duration, its rows for the run's candidate start times
+are written back into ``storm-stats.csv`` before ``prepare_resume``, so only
+start times the index lacks are scanned. When it covers them all — the same
+date range with a new N or threshold — ranking and item creation are all that
+run. ``query_stats: "true"`` makes that the only thing a run may do: it fails
+instead of scanning when the index does not cover the request, and
+``rank_collection`` ranks the seeded csv without scoring a single window.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterable, Sequence
+
+from actions.storm_stream import StormStat, format_stats_row, parse_stats_row
+
+log = logging.getLogger(__name__)
+
+INDEX_FILE = "storm-stats-index.npz"
+# Under the cache dir; kept when a successful run cleans up.
+STATS_INDEX_DIRNAME = "stats-index"
+INDEX_VERSION = 1
+
+
+def query_only(payload: Any) -> bool:
+    """True when the payload asks to rebuild collections from the index only."""
+    return payload.attributes.get("query_stats", "").lower() == "true"
+
+
+def geometry_key(*geometry_files: str | Path) -> str:
+    """Digest of the geometry files the statistics depend on."""
+    digest = hashlib.sha256()
+    for path in geometry_files:
+        digest.update(Path(path).read_bytes())
+    return digest.hexdigest()
+
+
+def payload_geometry_key(payload: Any, local_root: Path) -> str:
+    """``geometry_key`` of the payload's downloaded watershed and
+    transposition domain."""
+    paths = payload.inputs[0].paths
+    return geometry_key(
+        local_root / Path(paths["watershed"]).name,
+        local_root / Path(paths["transposition"]).name,
+    )
+
+
+def cached_path(local_root: Path, collection_id: str) -> Path:
+    """Where the cache dir keeps ``collection_id``'s index between runs."""
+    return local_root / STATS_INDEX_DIRNAME / f"{collection_id}.npz"
+
+
+def write(
+    path: Path, rows: Iterable[StormStat], geometry: str, storm_duration: int
+) -> int:
+    """Write ``rows`` to the index at ``path``; returns the number of rows."""
+    import numpy as np
+
+    rows = sorted(rows)
+    columns = list(zip(*rows)) or [[] for _ in StormStat._fields]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez_compressed(
+            f,
+            storm_date=np.array(columns[0], dtype="datetime64[h]"),
+            **{
+                name: np.array(values, dtype=np.float64)
+                for name, values in zip(StormStat._fields[1:], columns[1:])
+            },
+            geometry=np.array(geometry),
+            storm_duration=np.array(storm_duration),
+            version=np.array(INDEX_VERSION),
+        )
+    os.replace(tmp, path)
+    return len(rows)
+
+
+def read(path: Path, geometry: str, storm_duration: int) -> list[StormStat] | None:
+    """Rows of the index at ``path``; None if it is missing, unreadable, or
+    was built for another geometry or duration."""
+    import numpy as np
+
+    if not path.exists():
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as index:
+            if (
+                int(index["version"]) != INDEX_VERSION
+                or str(index["geometry"]) != geometry
+                or int(index["storm_duration"]) != storm_duration
+            ):
+                log.info("Ignoring %s: built for another geometry or duration", path)
+                return None
+            dates = index["storm_date"].astype("datetime64[s]").astype(datetime)
+            columns = [index[name].tolist() for name in StormStat._fields[1:]]
+    except (OSError, KeyError, ValueError) as e:
+        log.warning("Ignoring unreadable storm-stats index %s: %s", path, e)
+        return None
+    return [StormStat(date, *values) for date, *values in zip(dates, *columns)]
+
+
+def save(
+    stats_csv: Path,
+    local_root: Path,
+    collection_id: str,
+    geometry: str,
+    storm_duration: int,
+) -> None:
+    """Index ``stats_csv`` beside it (uploaded) and in the cache dir."""
+    if not stats_csv.exists():
+        return
+    rows = csv_rows(stats_csv)
+    path = stats_csv.with_name(INDEX_FILE)
+    n = write(path, rows.values(), geometry, storm_duration)
+    cached = cached_path(local_root, collection_id)
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cached.with_name(cached.name + ".tmp")
+    tmp.write_bytes(path.read_bytes())
+    os.replace(tmp, cached)
+    log.info("Indexed %d candidate windows in %s", n, path)
+
+
+def csv_rows(stats_csv: Path) -> dict[datetime, StormStat]:
+    """The rows of ``stats_csv`` by start time (the last of duplicates)."""
+    lines = stats_csv.read_text(encoding="utf-8").splitlines()
+    return {row.storm_date: row for row in map(parse_stats_row, lines) if row}
+
+
+def seed(stats_csv: Path, rows: Sequence[StormStat], plan: Sequence[datetime]) -> int:
+    """Append the index ``rows`` for ``plan``'s start times to ``stats_csv``.
+
+    Rows the csv already has are left to ``prepare_resume``, which keeps the
+    first row of each start time. Returns the number of rows appended.
+    """
+    from actions.scan_progress import STATS_HEADER
+
+    wanted = set(plan)
+    rows = [row for row in rows if row.storm_date in wanted]
+    if not rows:
+        return 0
+    stats_csv.parent.mkdir(parents=True, exist_ok=True)
+    if not stats_csv.exists():
+        stats_csv.write_text(STATS_HEADER + "\n", encoding="utf-8")
+    with open(stats_csv, "a", encoding="utf-8") as f:
+        f.write("".join(format_stats_row(row) for row in rows))
+    return len(rows)
+
+
+def rank_collection(
+    catalog: Any,
+    storm_duration: int,
+    min_precip_threshold: float,
+    top_n_events: int,
+    num_workers: int,
+) -> Any | None:
+    """Rank the whole ``storm-stats.csv`` and create the top-N items, as
+    ``new_collection`` does after its search; None when no window meets the
+    threshold."""
+    from stormhub.met.analysis import StormAnalyzer
+    from stormhub.met.storm_catalog import create_items
+
+    from actions.specific_dates import finish_collection
+
+    collection_id = catalog.spm.storm_collection_id(storm_duration)
+    stats_csv = Path(catalog.spm.collection_dir(collection_id)) / "storm-stats.csv"
+    try:
+        analyzer = StormAnalyzer(str(stats_csv), min_precip_threshold, storm_duration)
+    except ValueError as e:
+        log.error("No %dh storms at the threshold: %s", storm_duration, e)
+        return None
+    ranked, ranked_csv = analyzer.rank_and_save(collection_id, catalog.spm)
+    top = ranked[ranked["por_rank"] <= top_n_events]
+    log.info("Creating items for the top %d %dh storms", len(top), storm_duration)
+    create_items(
+        top.to_dict(orient="records"),
+        catalog,
+        storm_duration=storm_duration,
+        num_workers=num_workers,
+    )
+    return finish_collection(catalog, collection_id, Path(ranked_csv))
@@ -0,0 +1,594 @@
+"""Stream finished storms from process-storms into DSS conversion.
+
+Without this, ``process_storms`` runs stormhub's ``new_collection`` to
+completion and only then does ``convert_to_dss`` list the collection, so the
+conversion pool idles through the whole scan and the search pool idles through
+the whole conversion. In pipelined mode (``pipeline_dss`` payload attribute)
+the scan runs on a background thread while this module tails the
+``storm-stats.csv`` stormhub appends to as each candidate window finishes,
+decides which storms are final, and converts them on the same worker pool
+while the scan carries on, split between the two by ``split_workers``.
+
+Within a run (one catalog, transposition domain and SHG resolution) a storm's
+DSS content depends only on its start time and duration, but its rank is part
+of ``dss_filename`` and is only known once stormhub has ranked the whole scan.
+Conversions are therefore written under a rank-free staging name and renamed
+once the collection exists. Anything staged that did not make the
+final top-N is discarded, and any final storm that was not staged is left for
+convert-to-dss (which skips storms the checkpoint records as converted) — so
+the pipeline only moves work earlier and can never change the catalog.
+"""
+
+from __future__ import annotations
+
+import bisect
+import heapq
+import logging
+import os
+import shutil
+import threading
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Iterable, NamedTuple
+
+from actions import dss_filename, parse_storm_datetime, storm_rank
+from checkpoint import Checkpoint
+from worker_pool import SharedPool
+from worker_sizing import split_workers
+
+log = logging.getLogger(__name__)
+
+# StormAnalyzer.rank_and_filter_storms declusters with buffer_hours=24: an
+# accepted storm blocks [start, start + duration + 24h) for everything ranked
+# below it.
+RANK_BUFFER_HOURS = 24
+STATS_DATE_FORMAT = "%Y-%m-%dT%H"  # storm_date column of storm-stats.csv
+STAGING_DIRNAME = ".staged"
+
+PIPELINE_POLL_SECONDS = float(os.environ.get("PIPELINE_POLL_SECONDS", "10"))
+# Opt-in: how cautiously to also queue storms whose top-N membership is
+# likely but not yet provable (see FinalityTracker). The default 0 converts
+# only provably final storms during the scan.
+PIPELINE_SPECULATION = float(os.environ.get("PIPELINE_SPECULATION", "0"))
+
+
+def pipeline_enabled(payload: Any) -> bool:
+    """True when the payload asks for pipelining and will run convert-to-dss."""
+    if payload.attributes.get("pipeline_dss", "").lower() != "true":
+        return False
+    return any(action.name == "convert-to-dss" for action in payload.actions)
+
+
+def staged_dss_path(staging_dir: Path, storm_start: datetime, duration: int) -> Path:
+    """Rank-free staging name for a storm converted before its rank is known."""
+    return staging_dir / f"{storm_start:%Y%m%d%H}_{duration}hr.dss"
+
+
+class FinalityTracker:
+    """Decide, mid-scan, which storms belong in the final top-N.
+
+    Mirrors stormhub's greedy ranking: windows are taken by descending mean,
+    an accepted window blocks ``[start, start + h)`` with ``h = duration +
+    24h``, and a window is also dropped when ``start + h`` is not before the
+    latest candidate over the threshold. Two windows conflict when their starts
+    are at most ``h`` apart.
+
+    Results arrive in any order, so only the *settled prefix* — candidates
+    before the first unscanned plan date and far enough from the latest
+    candidate — is ranked. The prefix only grows, so its candidates go into a
+    ``TopNSelector`` as they settle and the tracker holds at most its
+    ``capacity`` of them plus the unsettled tail. A storm ``S`` accepted
+    there is final when
+
+    * no chain of conflicting windows ranked at or above ``S`` links it to the
+      unsettled tail (so later results cannot flip its own acceptance), and
+    * the storms ranked above it that are already settled, plus the most
+      storms that could still be accepted in the unsettled span, are fewer
+      than ``top_n`` (so it cannot be pushed out), and
+    * no two conflicting settled windows share a mean at or above its own.
+      stormhub orders equal means by ``storm-stats.csv`` row order (see
+      ``TopNSelector``), and which of two tied neighbours it accepts can
+      change both ``S``'s acceptance and the count above it.
+
+    The second test is strict and rarely passes early in a long scan. With
+    ``speculation > 0`` a storm is also queued when the settled rate of
+    storms above it, extrapolated over the unscanned span and scaled by
+    ``speculation``, still leaves it inside the top-N. A wrong guess costs one
+    discarded conversion, never a wrong catalog.
+    """
+
+    def __init__(
+        self,
+        plan: Iterable[datetime],
+        storm_duration: int,
+        top_n: int,
+        min_precip_threshold: float,
+        speculation: float = PIPELINE_SPECULATION,
+    ) -> None:
+        self._plan = sorted(set(plan))
+        self._h = timedelta(hours=storm_duration + RANK_BUFFER_HOURS)
+        self._top_n = top_n
+        self._threshold = min_precip_threshold
+        self._speculation = speculation
+        self._settled = TopNSelector(storm_duration, top_n, min_precip_threshold)
+        # Candidates over the threshold not settled yet, by start time.
+        self._pending: list[tuple[datetime, float]] = []
+        self._ahead: set[datetime] = set()  # plan dates seen past the cursor
+        self._latest: datetime | None = None
+        self._cursor = 0  # index of the first plan date without a result
+        self._emitted: set[datetime] = set()
+
+    @property
+    def done(self) -> bool:
+        return self._cursor >= len(self._plan)
+
+    def observe(self, storm_date: datetime, mean: float) -> None:
+        """Record one finished candidate window of the plan; the first result
+        for a start time stands."""
+        i = bisect.bisect_left(self._plan, storm_date)
+        if (
+            i == len(self._plan)
+            or self._plan[i] != storm_date
+            or i < self._cursor
+            or storm_date in self._ahead
+        ):
+            return
+        self._ahead.add(storm_date)
+        if mean >= self._threshold:
+            heapq.heappush(self._pending, (storm_date, mean))
+            if self._latest is None or storm_date > self._latest:
+                self._latest = storm_date
+        plan = self._plan
+        while self._cursor < len(plan) and plan[self._cursor] in self._ahead:
+            self._ahead.remove(plan[self._cursor])
+            self._cursor += 1
+
+    def newly_final(self) -> list[datetime]:
+        """Storm start times that became final since the last call."""
+        final = [d for d in self._final() if d not in self._emitted]
+        self._emitted.update(final)
+        return final
+
+    def _final(self) -> list[datetime]:
+        if self._latest is None or not self._plan:
+            return []
+        h = self._h
+        # Windows within h of the latest candidate can still be dropped (or,
+        # once a later candidate lands, accepted); the scan cursor bounds the
+        # rest.
+        settled_before = self._latest - h
+        if not self.done:
+            settled_before = min(settled_before, self._plan[self._cursor])
+        while self._pending and self._pending[0][0] < settled_before:
+            storm_date, mean = heapq.heappop(self._pending)
+            self._settled.add(StormStat(storm_date, 0.0, mean, 0.0, 0.0, 0.0))
+
+        accepted = [
+            (row.mean, row.storm_date) for row in self._settled.ranked(drop_tail=False)
+        ]
+        tie = _highest_tie(self._settled.rows(), h)
+        if tie is not None:
+            # Storms at or below a tie are left to convert-to-dss, which
+            # follows stormhub's own ranking. accepted is in rank order, so
+            # this keeps a prefix.
+            accepted = [(m, d) for m, d in accepted if m > tie]
+        if self.done:
+            # Nothing left to arrive: the prefix ranking is the final ranking.
+            return [d for _, d in accepted]
+
+        # Every window ranked above an accepted storm is kept, and one the
+        # selector dropped can never be accepted, whatever arrives later.
+        by_date_desc = sorted(
+            ((row.storm_date, row.mean) for row in self._settled.rows()),
+            reverse=True,
+        )
+        first, last = self._plan[0], self._plan[-1]
+        unseen = len(self._plan) - self._cursor - len(self._ahead)
+        final: list[datetime] = []
+        for k, (mean, start) in enumerate(accepted):
+            reach = _reach_point(by_date_desc, settled_before, mean, start, h)
+            if start >= reach:
+                continue  # a later result can still block this storm
+            above = sum(1 for _, d in accepted[:k] if d < reach)
+
+            # Accepted starts are more than h apart, and none can start within
+            # h of the last plan date.
+            span = (last - h) - reach
+            slots = span // (h + timedelta(hours=1)) + 1 if span > timedelta(0) else 0
+            unsettled = (
+                unseen
+                + len(self._pending)
+                + sum(1 for d, _ in by_date_desc if d >= reach)
+            )
+            if above + min(slots, unsettled) < self._top_n:
+                final.append(start)
+                continue
+
+            if self._speculation > 0:
+                settled_hours = max(
+                    (reach - first) / timedelta(hours=1), h / timedelta(hours=1)
+                )
+                rate = (above + 1) / settled_hours
+                expected = rate * max((last - reach) / timedelta(hours=1), 0.0)
+                if above + self._speculation * expected < self._top_n:
+                    final.append(start)
+        return final
+
+
+def greedy_top_n(
+    ranked: list[tuple[float, datetime]], h: timedelta, top_n: int
+) -> list[tuple[float, datetime]]:
+    """Greedy declustering over ``(mean, start)`` already in rank order."""
+    accepted: list[tuple[float, datetime]] = []
+    # Interval index of accepted windows: each blocks [s, s + h), and they
+    # never overlap, so the sorted starts alone answer the overlap query.
+    starts: list[datetime] = []
+    for mean, start in ranked:
+        # Conflict iff some accepted s has s - h <= start < s + h, i.e.
+        # start - h < s <= start + h.
+        i = bisect.bisect_right(starts, start - h)
+        if i < len(starts) and starts[i] <= start + h:
+            continue
+        bisect.insort(starts, start)
+        accepted.append((mean, start))
+        if len(accepted) >= top_n:
+            break
+    return accepted
+
+
+class TopNSelector:
+    """Streaming top-N over candidate windows, in memory bounded by ``top_n``.
+
+    Candidates arrive in any order — from a tailed ``storm-stats.csv``, or
+    as ``FinalityTracker``'s settled prefix grows — and ``ranked()`` returns
+    what stormhub's greedy ranking would make of all of them. Only the
+    ``capacity`` best windows by ``(-mean, start)`` are kept in a min-heap,
+    plus the latest candidate over the threshold.
+
+    That is exact: until the N-th storm is accepted, every window the greedy
+    pass looks at is accepted (at most N), conflicts with one of those (each
+    has at most ``2h`` hourly neighbours), or is dropped for ending at or
+    after the latest candidate (at most ``h + 1`` hours). No window ranked
+    below those can make the top-N, whatever the period of record.
+
+    Up to ties: stormhub sorts by mean with pandas' default quicksort, which
+    is not stable, on means rounded to two decimals, so windows with equal
+    means come out in an order that depends on the csv's row order. Here
+    they are ordered by start time, and of two conflicting windows with
+    equal means the two rankings may accept different ones.
+    """
+
+    def __init__(
+        self, storm_duration: int, top_n: int, min_precip_threshold: float
+    ) -> None:
+        self._h = timedelta(hours=storm_duration + RANK_BUFFER_HOURS)
+        hours = storm_duration + RANK_BUFFER_HOURS
+        self.capacity = top_n * (2 * hours + 1) + hours + 1
+        self._top_n = top_n
+        self._threshold = min_precip_threshold
+        # (mean, -start) keys: the heap root is the worst window kept.
+        self._heap: list[tuple[float, float, StormStat]] = []
+        self._kept: dict[datetime, float] = {}
+        self._latest: datetime | None = None
+
+    def add(self, row: StormStat) -> None:
+        """Offer one finished candidate window."""
+        if row.mean < self._threshold:
+            return
+        if self._latest is None or row.storm_date > self._latest:
+            self._latest = row.storm_date
+        if row.storm_date in self._kept:
+            return  # rescanned or overlapping shards: the first row stands
+        entry = (row.mean, -(row.storm_date - datetime.min).total_seconds(), row)
+        if len(self._heap) < self.capacity:
+            heapq.heappush(self._heap, entry)
+        elif entry[:2] > self._heap[0][:2]:
+            del self._kept[heapq.heapreplace(self._heap, entry)[2].storm_date]
+        else:
+            return
+        self._kept[row.storm_date] = row.mean
+
+    def rows(self) -> list[StormStat]:
+        """The candidate windows kept, in no particular order."""
+        return [row for _, _, row in self._heap]
+
+    def ranked(self, drop_tail: bool = True) -> list[StormStat]:
+        """The top-N storms in rank order.
+
+        With ``drop_tail`` (stormhub's rule, right once every candidate is
+        in) windows ending at or after the latest candidate are dropped;
+        without it a mid-scan snapshot keeps them, provisionally.
+        """
+        rows = sorted(self.rows(), key=lambda r: (-r.mean, r.storm_date))
+        if drop_tail and self._latest is not None:
+            rows = [row for row in rows if row.storm_date + self._h < self._latest]
+        by_date = {row.storm_date: row for row in rows}
+        accepted = greedy_top_n(
+            [(row.mean, row.storm_date) for row in rows], self._h, self._top_n
+        )
+        return [by_date[d] for _, d in accepted]
+
+
+def _reach_point(
+    by_date_desc: list[tuple[datetime, float]],
+    settled_before: datetime,
+    mean: float,
+    start: datetime,
+    h: timedelta,
+) -> datetime:
+    """Earliest start a change in the unsettled tail can propagate back to.
+
+    Only windows ranked at or above ``mean`` decide whether ``start`` is
+    accepted; a change in the tail travels back through a chain of such
+    windows, each within ``h`` of the next.
+    """
+    reach = settled_before - h
+    for d, m in by_date_desc:
+        if d < reach:
+            break
+        if d != start and m >= mean:
+            reach = min(reach, d - h)
+    return reach
+
+
+def _highest_tie(rows: Iterable[StormStat], h: timedelta) -> float | None:
+    """The highest mean shared by two conflicting windows, or None.
+
+    Only conflicting windows decide each other's acceptance, so ties between
+    windows more than ``h`` apart cannot change the ranking.
+    """
+    by_mean: dict[float, list[datetime]] = {}
+    for row in rows:
+        by_mean.setdefault(row.mean, []).append(row.storm_date)
+    tied = [
+        mean
+        for mean, starts in by_mean.items()
+        if any(b - a <= h for a, b in zip(sorted(starts), sorted(starts)[1:]))
+    ]
+    return max(tied, default=None)
+
+
+class StormStat(NamedTuple):
+    """One ``storm-stats.csv`` row: a candidate window's best transposition."""
+
+    storm_date: datetime
+    min: float
+    mean: float
+    max: float
+    x: float
+    y: float
+
+
+class StatsTail:
+    """Read the rows stormhub appends to ``storm-stats.csv`` since last call."""
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._offset = 0
+
+    def read_new(self) -> list[tuple[datetime, float]]:
+        return [(row.storm_date, row.mean) for row in self.read_new_rows()]
+
+    def read_new_rows(self) -> list[StormStat]:
+        if not self._path.exists():
+            return []
+        with open(self._path, "rb") as f:
+            f.seek(self._offset)
+            chunk = f.read()
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            return []  # only a partial line so far
+        self._offset += end + 1
+
+        rows: list[StormStat] = []
+        for line in chunk[: end + 1].decode("utf-8").splitlines():
+            row = parse_stats_row(line)
+            if row is not None:
+                rows.append(row)
+        return rows
+
+
+def parse_stats_row(line: str) -> StormStat | None:
+    """Parse one ``storm-stats.csv`` line; None for the header or a bad row."""
+    fields = line.split(",")
+    if len(fields) != len(StormStat._fields) or fields[0] == "storm_date":
+        return None
+    try:
+        return StormStat(
+            datetime.strptime(fields[0], STATS_DATE_FORMAT),
+            *(float(v) for v in fields[1:]),
+        )
+    except ValueError:
+        log.debug("Skipping unparseable storm-stats row: %r", line)
+        return None
+
+
+def format_stats_row(row: StormStat) -> str:
+    """One ``storm-stats.csv`` line, as stormhub writes it."""
+    values = ",".join(str(v) for v in row[1:])
+    return f"{row.storm_date.strftime(STATS_DATE_FORMAT)},{values}\n"
+
+
+def parse_dates(values: Iterable[str]) -> list[datetime]:
+    """``specific_dates`` values, ISO or ``storm-stats.csv`` form."""
+    dates = []
+    for value in values:
+        try:
+            dates.append(datetime.fromisoformat(value))
+        except ValueError:
+            dates.append(datetime.strptime(value, STATS_DATE_FORMAT))
+    return dates
+
+
+def scan_plan(storm_params: dict[str, Any]) -> list[datetime]:
+    """Candidate start times new_collection will evaluate, in the same form."""
+    if storm_params["specific_dates"]:
+        return parse_dates(storm_params["specific_dates"])
+
+    from stormhub.utils import generate_date_range
+
+    return generate_date_range(
+        storm_params["start_date"],
+        storm_params["end_date"],
+        every_n_hours=storm_params["check_every_n_hours"],
+    )
+
+
+def run_pipelined(
+    catalog: Any,
+    storm_params: dict[str, Any],
+    *,
+    dss_dir: Path,
+    transposition_file: str,
+    catalog_id: str,
+    checkpoint: Checkpoint,
+    plan: list[datetime],
+    pool: SharedPool,
+    scan_first: Callable[[int], None] | None = None,
+) -> Any:
+    """Run ``new_collection`` while converting final storms alongside it.
+
+    ``plan`` is every candidate start time of the whole scan. On a resumed
+    scan ``storm_params`` only asks for the dates still missing, while the
+    rows already in ``storm-stats.csv`` are replayed into the tracker.
+
+    Both stages run on ``pool``; the caller lends it to stormhub for the
+    search. ``scan_first(workers)``, if given, runs on the search thread
+    before ``new_collection`` with the search share of the workers (the
+    cumulative-sum engine appending its rows to ``storm-stats.csv``).
+
+    Returns the collection exactly as ``new_collection`` would. Final storms
+    converted during the scan are already in ``dss_dir`` under their ranked
+    names, and recorded in ``checkpoint``, when this returns.
+    """
+    from stormhub.met.storm_catalog import new_collection
+
+    from actions.convert_to_dss import _convert_single_storm
+
+    search_workers, convert_workers = split_workers(storm_params["num_workers"])
+    if convert_workers == 0:
+        log.warning(
+            "pipeline_dss needs a budget of at least 2 workers (have %d) — "
+            "running the storm search on its own",
+            storm_params["num_workers"],
+        )
+        if scan_first is not None:
+            scan_first(storm_params["num_workers"])
+        return new_collection(catalog, **storm_params)
+
+    duration = storm_params["storm_duration"]
+    tracker = FinalityTracker(
+        plan,
+        duration,
+        storm_params["top_n_events"],
+        storm_params["min_precip_threshold"],
+    )
+    collection_id = catalog.spm.storm_collection_id(duration)
+    tail = StatsTail(
+        Path(catalog.spm.collection_dir(collection_id)) / "storm-stats.csv"
+    )
+    staging_dir = dss_dir / STAGING_DIRNAME
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    log.info(
+        "Pipelined storm search: %d search worker(s), %d DSS worker(s)",
+        search_workers,
+        convert_workers,
+    )
+
+    outcome: dict[str, Any] = {}
+
+    def _search() -> None:
+        try:
+            if scan_first is not None:
+                scan_first(search_workers)
+            outcome["collection"] = new_collection(
+                catalog, **{**storm_params, "num_workers": search_workers}
+            )
+        except BaseException as e:  # re-raised on the caller's thread below
+            outcome["error"] = e
+
+    search = threading.Thread(target=_search, name="storm-search", daemon=True)
+    queued: deque[datetime] = deque()
+    staged: dict[datetime, Future] = {}
+
+    # Conversions share the run's worker pool with the search; capping them
+    # at the convert share leaves the search share free for stormhub's
+    # batches. Storms still queued when the search ends are left for
+    # convert-to-dss, which then has the whole pool.
+    search.start()
+    while True:
+        search.join(timeout=PIPELINE_POLL_SECONDS)
+        for storm_date, mean in tail.read_new():
+            tracker.observe(storm_date, mean)
+        for storm_start in tracker.newly_final():
+            log.info("Queueing DSS conversion for final storm %s", storm_start)
+            queued.append(storm_start)
+        if not search.is_alive():
+            break
+        in_flight = sum(1 for future in staged.values() if not future.done())
+        while queued and in_flight < convert_workers:
+            storm_start = queued.popleft()
+            path = staged_dss_path(staging_dir, storm_start, duration)
+            path.unlink(missing_ok=True)  # left by an interrupted run
+            staged[storm_start] = pool.submit(
+                _convert_single_storm,
+                str(path),
+                transposition_file,
+                catalog_id,
+                storm_start.isoformat(),
+                duration,
+            )
+            in_flight += 1
+
+    converted: set[datetime] = set()
+    for storm_start, future in staged.items():
+        error = future.result()
+        if error:
+            log.warning("Pipelined conversion of %s failed: %s", storm_start, error)
+        else:
+            converted.add(storm_start)
+
+    if "error" in outcome:
+        raise outcome["error"]
+    collection = outcome.get("collection")
+    if collection is not None:
+        _promote_staged(
+            collection, converted, staging_dir, dss_dir, duration, checkpoint
+        )
+    _clear_staging(staging_dir)
+    return collection
+
+
+def _promote_staged(
+    collection: Any,
+    converted: set[datetime],
+    staging_dir: Path,
+    dss_dir: Path,
+    duration: int,
+    checkpoint: Checkpoint,
+) -> None:
+    """Rename staged conversions of final storms to their ranked filenames."""
+    items = list(collection.get_all_items())
+    promoted = 0
+    for idx, item in enumerate(items, 1):
+        storm_start = parse_storm_datetime(item)
+        if storm_start is None or storm_start not in converted:
+            continue
+        rank = storm_rank(item, idx)
+        target = dss_dir / dss_filename(storm_start, rank, duration)
+        os.replace(staged_dss_path(staging_dir, storm_start, duration), target)
+        checkpoint.mark_storm_done(str(rank), target)
+        promoted += 1
+    log.info(
+        "Pipeline: %d/%d final storms converted during the scan, %d discarded",
+        promoted,
+        len(items),
+        len(converted) - promoted,
+    )
+
+
+def _clear_staging(staging_dir: Path) -> None:
+    # Includes the partial-write subdirectory of any conversion that failed.
+    shutil.rmtree(staging_dir, ignore_errors=True)
@@ -9,6 +9,8 @@ from typing import Any
 
 from cc.plugin_manager import DataSourceOpInput
 
+from run_metrics import RunMetrics
+
 log = logging.getLogger(__name__)
 
 S3_MAX_RETRIES = 3
@@ -49,12 +51,26 @@ def upload_outputs(ctx: dict[str, Any], action: Any) -> None:
     if not output_dir.exists():
         raise FileNotFoundError(f"Output directory not found: {output_dir}")
 
-    files = [f for f in output_dir.rglob("*") if f.is_file()]
+    metrics: RunMetrics = ctx["metrics"]
+    files = [f for f in output_dir.rglob("*") if f.is_file() and f != metrics.path]
     if not files:
         raise FileNotFoundError(f"No output files found in: {output_dir}")
 
     log.info("Uploading %d files to %s", len(files), remote_base)
+    _upload(pm, payload, output_dir, remote_base, files, metrics)
+
+    # The report goes last so it includes this upload (as "running").
+    _upload(pm, payload, output_dir, remote_base, [metrics.write()], None)
+
 
+def _upload(
+    pm: Any,
+    payload: Any,
+    output_dir: Path,
+    remote_base: str,
+    files: list[Path],
+    metrics: RunMetrics | None,
+) -> None:
     for output_source in payload.outputs:
         for file in files:
             rel_path = str(file.relative_to(output_dir))
@@ -65,3 +81,5 @@ def upload_outputs(ctx: dict[str, Any], action: Any) -> None:
             )
             log.info("  [%s] %s -> %s", output_source.name, file.name, remote_path)
             _s3_upload_with_retry(pm, op, str(file))
+            if metrics is not None:
+                metrics.add("bytes_uploaded", file.stat().st_size)
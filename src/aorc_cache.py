@@ -0,0 +1,310 @@
+"""On-disk AORC chunk cache shared by every pool worker.
+
+The storm search and DSS conversion fetch the same AORC zarr chunks from S3
+over and over: overlapping 72 h windows, ``check_every_n_hours`` stepping, and
+each final storm loaded once by the search and again by
+``_convert_single_storm``. Egress from the NOAA bucket is the largest
+per-run cost after compute.
+
+``ChunkCache`` keeps each fetched chunk as a file under
+``<cache_dir>/aorc-chunks``. Like the read counter in ``run_metrics`` it hooks
+``s3fs``'s ``_cat_file``, through which zarr fetches every chunk of every
+store ``aorc_storage_options`` configures, so stormhub needs no change:
+
+* only chunks of the AORC buckets are cached (the NOAA public bucket and the
+  mirror in ``AORC_S3_BASE_URL``); zarr metadata is always fetched, since a
+  mirrored year can be extended;
+* extending a store rewrites its last time chunk, so that chunk is never
+  cached: each process reads a store's consolidated metadata once to learn
+  where its time axis ends (``time_chunk_limits``), and only chunks before
+  the last one are ``settled``;
+* a whole-object read (no range, or from byte 0 to the end) has one entry,
+  and a ranged read of a cached object is served from it;
+* a chunk is written to a temp file and renamed into place, so a worker never
+  reads another's half-written chunk;
+* a hit touches the file's mtime and eviction drops the oldest mtimes first
+  (LRU), down to ``EVICT_TO`` of ``AORC_CACHE_MAX_MB``. One worker at a time
+  evicts, under an ``flock``; the others keep going.
+
+The cache survives a successful run (``plugin.run_actions`` keeps it when it
+cleans up ``cache_dir``), so runs on the same volume share it. Hit and miss
+counters live in shared memory and are reported per action in
+``metrics.json``. ``AORC_CACHE_MAX_MB=0`` turns the cache off.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+from pathlib import Path
+from typing import Any, Iterator
+from urllib.parse import urlparse
+
+log = logging.getLogger(__name__)
+
+CACHE_DIRNAME = "aorc-chunks"
+AORC_CACHE_MAX_MB = int(os.environ.get("AORC_CACHE_MAX_MB", "10240"))
+# Eviction frees down to this share of the cap, so it doesn't run per write.
+EVICT_TO = 0.9
+# NOAA's public AORC zarr bucket (stormhub's default source).
+AORC_PUBLIC_BUCKET = "noaa-nws-aorc-v1-1-1km"
+# zarr v2 and v3 metadata keys; never cached.
+METADATA_NAMES = {".zmetadata", ".zarray", ".zattrs", ".zgroup", "zarr.json"}
+
+# Indexes into ChunkCache.counters.
+_USED, _HITS, _MISSES, _HIT_BYTES = range(4)
+
+# Per store URL, this process's time_chunk_limits (None: unreadable).
+_store_limits: dict[str, dict[str, tuple[int, str, int]] | None] = {}
+
+
+def aorc_prefixes(base_url: str | None = None) -> tuple[str, ...]:
+    """``bucket/prefix`` strings whose objects are AORC data."""
+    prefixes = [AORC_PUBLIC_BUCKET + "/"]
+    base = base_url or os.environ.get("AORC_S3_BASE_URL")
+    if base:
+        parsed = urlparse(base)
+        if parsed.scheme == "s3":
+            prefixes.append(f"{parsed.netloc}{parsed.path.rstrip('/')}/")
+    return tuple(prefixes)
+
+
+def time_chunk_limits(metadata: dict[str, Any]) -> dict[str, tuple[int, str, int]]:
+    """``(time axis, key separator, last time chunk)`` of each array in a
+    store's consolidated ``metadata`` (its ``.zmetadata`` ``metadata``)."""
+    limits = {}
+    for name, zarray in metadata.items():
+        variable, _, leaf = name.rpartition("/")
+        if leaf != ".zarray" or not zarray.get("shape"):
+            continue
+        dims = metadata.get(f"{variable}/.zattrs", {}).get("_ARRAY_DIMENSIONS", [])
+        axis = dims.index("time") if "time" in dims else 0
+        size, chunk = zarray["shape"][axis], zarray["chunks"][axis]
+        separator = zarray.get("dimension_separator") or "."
+        limits[variable] = (axis, separator, max(0, -(-size // chunk) - 1))
+    return limits
+
+
+def split_chunk(path: str) -> tuple[str, str] | None:
+    """``(store URL, chunk key)`` of a chunk path in a ``<year>.zarr`` store."""
+    store, sep, key = path.removeprefix("s3://").partition(".zarr/")
+    return (store + ".zarr", key) if sep else None
+
+
+def settled(key: str, limits: dict[str, tuple[int, str, int]] | None) -> bool:
+    """True when chunk ``key`` (``variable/i.j.k``) lies before its store's
+    last time chunk, the only one an extended store rewrites."""
+    variable, _, index = key.rpartition("/")
+    limit = (limits or {}).get(variable)
+    if limit is None:
+        # A "/" separator: the variable is the key's first part.
+        variable, _, index = key.partition("/")
+        limit = (limits or {}).get(variable)
+    if limit is None:
+        return False
+    axis, separator, last = limit
+    try:
+        return int(index.split(separator)[axis]) < last
+    except (IndexError, ValueError):
+        return False
+
+
+def _whole(start: int | None, end: int | None) -> bool:
+    return not start and end is None
+
+
+class ChunkCache:
+    """Byte-capped LRU cache of AORC chunks on local disk.
+
+    Create it in the parent and hand it to the pool workers (it pickles
+    through ``initargs``); its counters are shared across all of them.
+    """
+
+    def __init__(self, root: Path, max_bytes: int, prefixes: tuple[str, ...]) -> None:
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.prefixes = prefixes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.counters = multiprocessing.get_context("spawn").Array("q", 4)
+        self.counters[_USED] = sum(size for _, _, size in self._entries())
+
+    @classmethod
+    def for_cache_dir(cls, cache_dir: Path) -> ChunkCache | None:
+        """The cache under ``cache_dir``, or None when disabled."""
+        if AORC_CACHE_MAX_MB <= 0:
+            return None
+        cache = cls(cache_dir / CACHE_DIRNAME, AORC_CACHE_MAX_MB << 20, aorc_prefixes())
+        log.info(
+            "AORC chunk cache at %s: %.0f of %d MB in use",
+            cache.root,
+            cache.counters[_USED] / 2**20,
+            AORC_CACHE_MAX_MB,
+        )
+        return cache
+
+    def covers(self, path: str) -> bool:
+        path = path.removeprefix("s3://")
+        return path.startswith(self.prefixes) and (
+            path.rsplit("/", 1)[-1] not in METADATA_NAMES
+        )
+
+    def _file(self, path: str, start: int | None, end: int | None) -> Path:
+        if _whole(start, end):
+            start = end = None
+        key = f"{path.removeprefix('s3://')}:{start}:{end}".encode()
+        digest = hashlib.sha1(key).hexdigest()
+        return self.root / digest[:2] / digest
+
+    def get(
+        self, path: str, start: int | None = None, end: int | None = None
+    ) -> bytes | None:
+        file = self._file(path, start, end)
+        try:
+            data = file.read_bytes()
+        except OSError:  # not cached, or evicted by another worker
+            data = None
+        if data is None and not _whole(start, end):
+            # A range of an object cached whole.
+            file = self._file(path, None, None)
+            with contextlib.suppress(OSError):
+                data = file.read_bytes()[start:end]
+        if data is None:
+            self._add(_MISSES, 1)
+            return None
+        with contextlib.suppress(OSError):
+            os.utime(file)  # most recently used
+        self._add(_HITS, 1)
+        self._add(_HIT_BYTES, len(data))
+        return data
+
+    def put(self, path: str, start: int | None, end: int | None, data: bytes) -> None:
+        file = self._file(path, start, end)
+        tmp = file.with_name(f"{file.name}.{os.getpid()}.tmp")
+        try:
+            file.parent.mkdir(exist_ok=True)
+            tmp.write_bytes(data)
+            os.replace(tmp, file)
+        except OSError as e:  # a full disk must not fail the read
+            tmp.unlink(missing_ok=True)
+            log.warning("AORC chunk cache write failed: %s", e)
+            return
+        if self._add(_USED, len(data)) > self.max_bytes:
+            self.evict()
+
+    def contains(self, path: str) -> bool:
+        """True when the whole object at ``path`` is cached."""
+        return self._file(path, None, None).exists()
+
+    def room(self) -> int:
+        """Bytes that can still be added before eviction would start."""
+        return int(self.max_bytes * EVICT_TO) - self.counters[_USED]
+
+    def evict(self) -> None:
+        """Drop least recently used chunks down to ``EVICT_TO`` of the cap."""
+        with self._evict_lock() as locked:
+            if not locked:
+                return  # another worker is on it
+            entries = sorted(self._entries())
+            used = sum(size for _, _, size in entries)
+            target = self.max_bytes * EVICT_TO
+            freed = 0
+            for _, file, size in entries:
+                if used - freed <= target:
+                    break
+                with contextlib.suppress(OSError):
+                    file.unlink()
+                    freed += size
+            with self.counters.get_lock():
+                self.counters[_USED] = used - freed
+        log.info("AORC chunk cache: evicted %.0f MB", freed / 2**20)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "aorc_cache_hits": self.counters[_HITS],
+            "aorc_cache_misses": self.counters[_MISSES],
+            "aorc_cache_bytes_served": self.counters[_HIT_BYTES],
+        }
+
+    def _add(self, index: int, value: int) -> int:
+        with self.counters.get_lock():
+            self.counters[index] += value
+            return self.counters[index]
+
+    def _entries(self) -> Iterator[tuple[float, Path, int]]:
+        """``(mtime, file, size)`` of every cached chunk."""
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:  # evicted meanwhile
+                    continue
+                yield st.st_mtime, Path(entry.path), st.st_size
+
+    @contextlib.contextmanager
+    def _evict_lock(self) -> Iterator[bool]:
+        with open(self.root / ".lock", "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def install_chunk_cache(cache: ChunkCache) -> None:
+    """Serve this process's AORC chunk reads through s3fs from ``cache``.
+
+    Installed after ``run_metrics.install_read_counter``, so hits are not
+    counted as bytes read from S3.
+    """
+    try:
+        from s3fs import S3FileSystem
+    except ImportError:
+        return
+    original = S3FileSystem._cat_file
+    if getattr(original, "_chunk_cache", False):
+        return
+
+    async def _limits(self: Any, store: str) -> dict | None:
+        if store not in _store_limits:
+            try:
+                raw = await original(self, f"{store}/.zmetadata")
+                limits = time_chunk_limits(json.loads(raw)["metadata"])
+            except (OSError, ValueError, KeyError) as e:  # none consolidated, offline
+                log.info("AORC chunk cache: not caching %s (%s)", store, e)
+                limits = None
+            _store_limits[store] = limits
+        return _store_limits[store]
+
+    async def _cat_file(
+        self: Any,
+        path: str,
+        start: int | None = None,
+        end: int | None = None,
+        **kwargs: Any,
+    ) -> Any:
+        chunk = split_chunk(path) if cache.covers(path) else None
+        if chunk is None or not settled(chunk[1], await _limits(self, chunk[0])):
+            return await original(self, path, start=start, end=end, **kwargs)
+        # Disk I/O off fsspec's event loop, which serves every other read.
+        data = await asyncio.to_thread(cache.get, path, start, end)
+        if data is None:
+            data = await original(self, path, start=start, end=end, **kwargs)
+            await asyncio.to_thread(cache.put, path, start, end, data)
+        return data
+
+    _cat_file._chunk_cache = True
+    S3FileSystem._cat_file = _cat_file
@@ -0,0 +1,157 @@
+"""Process-local cache of opened AORC yearly stores and their metadata.
+
+Every ``_convert_single_storm`` call runs ``noaa_zarr_to_dss`` from scratch,
+so each task opened its year's zarr again: a ``.zmetadata`` round trip plus
+the ``time`` / ``latitude`` / ``longitude`` arrays xarray loads to build its
+indexes. The pre-flight did the same with a boto3 client of its own.
+
+This module keeps, per process and keyed by store:
+
+* the consolidated metadata (``consolidated_metadata``), which the pre-flight
+  and prefetch-aorc read in the plugin process;
+* opened datasets. ``install_dataset_cache`` wraps ``xarray.open_zarr`` (and
+  ``open_dataset`` with ``engine="zarr"``) so that stormhub's opens of an AORC
+  store return a shallow copy of the dataset this process already opened,
+  coordinate indexes included. Pool workers install it on start, so every
+  task a worker runs reuses it.
+
+Both are LRU-bounded (``AORC_DATASET_CACHE_SIZE`` datasets, a few years'
+worth) and dropped by ``invalidate`` — for one year or all — when a store
+changes under the run, e.g. a year was mirrored or extended. Missing years are
+not cached, so a year mirrored later is found.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Any
+
+from aorc_cache import AORC_PUBLIC_BUCKET
+
+log = logging.getLogger(__name__)
+
+AORC_DATASET_CACHE_SIZE = int(os.environ.get("AORC_DATASET_CACHE_SIZE", "4"))
+METADATA_CACHE_SIZE = 32
+
+
+class _LRU(OrderedDict):
+    def __init__(self, maxsize: int) -> None:
+        super().__init__()
+        self.maxsize = maxsize
+
+    def get_fresh(self, key: str) -> Any:
+        value = self.get(key)
+        if value is not None:
+            self.move_to_end(key)
+        return value
+
+    def add(self, key: str, value: Any) -> None:
+        self[key] = value
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
+_metadata = _LRU(METADATA_CACHE_SIZE)
+_datasets = _LRU(AORC_DATASET_CACHE_SIZE)
+
+
+def base_url() -> str:
+    base = os.environ.get("AORC_S3_BASE_URL") or f"s3://{AORC_PUBLIC_BUCKET}"
+    return base.rstrip("/")
+
+
+def store_url(year: int, base: str | None = None) -> str:
+    return f"{(base or base_url()).rstrip('/')}/{year}.zarr"
+
+
+def filesystem() -> Any:
+    """The AORC S3 filesystem (fsspec reuses one instance per process)."""
+    import fsspec
+    from stormhub.met.zarr_to_dss import aorc_storage_options
+
+    return fsspec.filesystem("s3", **aorc_storage_options())
+
+
+def consolidated_metadata(year: int, base: str | None = None) -> dict | None:
+    """The year's ``.zmetadata`` ``metadata`` mapping, or None if absent."""
+    url = store_url(year, base)
+    cached = _metadata.get_fresh(url)
+    if cached is not None:
+        return cached
+    try:
+        raw = filesystem().cat(f"{url}/.zmetadata")
+    except Exception as e:  # NoSuchKey, AccessDenied, transient errors
+        log.info("AORC %s: no consolidated metadata (%s)", url, type(e).__name__)
+        return None
+    metadata = json.loads(raw)["metadata"]
+    _metadata.add(url, metadata)
+    return metadata
+
+
+def open_year(year: int, base: str | None = None) -> Any:
+    """The year's store opened with xarray, from this process's cache."""
+    import xarray as xr
+
+    open_zarr = getattr(xr.open_zarr, "__wrapped__", xr.open_zarr)
+    mapper = filesystem().get_mapper(store_url(year, base))
+    return _cached_open(open_zarr, mapper, {"consolidated": True})
+
+
+def invalidate(year: int | None = None) -> None:
+    """Forget cached metadata and datasets of ``year``, or of every year."""
+    for cache in (_metadata, _datasets):
+        for key in list(cache):
+            if year is None or f"/{year}.zarr" in key:
+                del cache[key]
+
+
+def _store_key(store: Any) -> str | None:
+    """Cache key for an AORC ``store`` (URL or fsspec mapper), else None."""
+    root = getattr(store, "root", store)
+    if not isinstance(root, (str, os.PathLike)):
+        return None
+    root = os.fspath(root).removeprefix("s3://").rstrip("/")
+    bases = {base_url().removeprefix("s3://"), AORC_PUBLIC_BUCKET}
+    if not any(root.startswith(base + "/") for base in bases):
+        return None
+    return root
+
+
+def _cached_open(opener: Any, store: Any, kwargs: dict[str, Any]) -> Any:
+    key = _store_key(store)
+    if key is None:
+        return opener(store, **kwargs)
+    key = f"{key}|{sorted((k, repr(v)) for k, v in kwargs.items())}"
+    dataset = _datasets.get_fresh(key)
+    if dataset is None:
+        dataset = opener(store, **kwargs)
+        _datasets.add(key, dataset)
+    # Callers may assign to the dataset; never let that reach the cached one.
+    return dataset.copy(deep=False)
+
+
+def install_dataset_cache() -> None:
+    """Serve this process's opens of AORC stores from ``_datasets``."""
+    try:
+        import xarray as xr
+    except ImportError:
+        return
+    if getattr(xr.open_zarr, "_aorc_cache", False):
+        return
+    open_zarr, open_dataset = xr.open_zarr, xr.open_dataset
+
+    def _open_zarr(store: Any, **kwargs: Any) -> Any:
+        return _cached_open(open_zarr, store, kwargs)
+
+    def _open_dataset(filename_or_obj: Any, **kwargs: Any) -> Any:
+        if kwargs.get("engine") != "zarr":
+            return open_dataset(filename_or_obj, **kwargs)
+        return _cached_open(open_dataset, filename_or_obj, kwargs)
+
+    _open_zarr._aorc_cache = True
+    _open_zarr.__wrapped__ = open_zarr
+    xr.open_zarr, xr.open_dataset = _open_zarr, _open_dataset
@@ -0,0 +1,128 @@
+"""Resume checkpoint: completed actions plus per-storm DSS conversion state.
+
+Replaces the old ``local_root/.checkpoint`` (one completed action name per
+line). That file could only say "convert-to-dss finished"; within the action,
+``Path(output_path).exists()`` was the idempotency check, so a pod killed while
+HecDss was writing left a truncated DSS file that the next run skipped and
+``create_grid_file`` later choked on.
+
+The manifest is one JSON document in the cache dir, rewritten atomically
+(temp file + ``os.replace``) after every change::
+
+    {
+      "version": 1,
+      "actions": ["download-inputs", "process-storms"],
+      "storms": {
+        "3": {"state": "done", "filename": "19820607_72hr_st1_r003.dss",
+              "size": 1234567, "sha256": "..."}
+      }
+    }
+
+Storms are keyed by catalog rank (``"24hr/3"`` when a run builds several
+durations; see ``actions.storm_key``). A storm counts as done only if its entry is
+``done`` for the same filename and the file on disk still has the recorded
+size — a stat, not a re-hash, so resuming a large catalog costs nothing for
+the storms that already finished. The hash is recorded once, when the file is
+committed, for auditing and for downstream consumers.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any
+
+log = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = "checkpoint.json"
+LEGACY_CHECKPOINT_FILE = ".checkpoint"
+CHECKPOINT_VERSION = 1
+
+STORM_DONE = "done"
+STORM_FAILED = "failed"
+
+
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """Structured resume state for one cache dir."""
+
+    def __init__(self, path: Path, data: dict[str, Any] | None = None) -> None:
+        self.path = path
+        data = data or {}
+        self.actions: set[str] = set(data.get("actions", []))
+        self.storms: dict[str, dict[str, Any]] = dict(data.get("storms", {}))
+
+    @classmethod
+    def load(cls, local_root: Path) -> Checkpoint:
+        """Read the manifest under ``local_root``, migrating a legacy file."""
+        path = local_root / CHECKPOINT_FILE
+        if path.exists():
+            try:
+                return cls(path, json.loads(path.read_text(encoding="utf-8")))
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                # Only a crash mid-``os.replace`` could do this; a fresh manifest
+                # just means redoing work, never trusting a bad file.
+                log.warning("Ignoring unreadable checkpoint %s: %s", path, e)
+                return cls(path)
+
+        checkpoint = cls(path)
+        legacy = local_root / LEGACY_CHECKPOINT_FILE
+        if legacy.exists():
+            checkpoint.actions = set(legacy.read_text(encoding="utf-8").split())
+            log.info("Migrated legacy %s to %s", legacy.name, path.name)
+        return checkpoint
+
+    def save(self) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(
+            json.dumps(
+                {
+                    "version": CHECKPOINT_VERSION,
+                    "actions": sorted(self.actions),
+                    "storms": self.storms,
+                },
+                indent=2,
+                sort_keys=True,
+            ),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.path)
+
+    def mark_action(self, name: str) -> None:
+        self.actions.add(name)
+        self.save()
+
+    def storm_done(self, key: str, path: Path) -> bool:
+        """True if ``path`` is the committed output recorded for storm ``key``."""
+        entry = self.storms.get(key)
+        if not entry or entry.get("state") != STORM_DONE:
+            return False
+        if entry.get("filename") != path.name:
+            return False  # rank now belongs to a different storm
+        try:
+            return path.stat().st_size == entry.get("size")
+        except OSError:
+            return False
+
+    def mark_storm_done(self, key: str, path: Path) -> None:
+        self.storms[key] = {
+            "state": STORM_DONE,
+            "filename": path.name,
+            "size": path.stat().st_size,
+            "sha256": file_sha256(path),
+        }
+        self.save()
+
+    def mark_storm_failed(self, key: str, filename: str, error: str) -> None:
+        self.storms[key] = {"state": STORM_FAILED, "filename": filename, "error": error}
+        self.save()
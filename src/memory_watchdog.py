@@ -0,0 +1,221 @@
+"""Slow the worker pool down before the cgroup OOM-kills it.
+
+The pool size comes from an estimate of per-worker memory
+(``worker_sizing``). A transposition domain bigger than the estimate used to
+get a worker OOM-killed, a ``BrokenProcessPool``, and a dead job.
+
+``MemoryWatchdog`` samples the cgroup v2 files while a heavy action runs and
+steers the shared pool (``worker_pool.SharedPool``):
+
+* above ``WATCHDOG_THROTTLE_AT`` of ``memory.max`` it lowers the pool's task
+  limit by one, so the next task waits for a running one to finish;
+* above ``WATCHDOG_RETIRE_AT`` it also retires idle workers, whose heaps
+  still hold their previous task's arrays;
+* a new ``oom_kill`` in ``memory.events`` halves the limit at once (the pool
+  resubmits the killed tasks);
+* once usage plus one more task's worth fits under the throttle line again,
+  and nothing has been cut for ``WATCHDOG_GROW_COOLDOWN_SECONDS``, the limit
+  grows back by one, up to what the ``WorkerMemoryModel`` allows.
+
+Once the pool has completed ``worker_sizing.CALIBRATION_TASKS`` tasks, the
+watchdog also hands the workers' peak RSS to the model once, and sets the
+limit to the worker count the measurement affords.
+
+Usage is ``memory.current`` minus ``inactive_file`` from ``memory.stat``: page
+cache the kernel will drop before it OOM-kills anyone is not pressure. "One
+task's worth" is the largest usage-per-running-task seen so far. The limit is
+the lower of ``memory.max`` and ``memory.high``. Without a cgroup v2 memory
+limit the watchdog does nothing.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from worker_sizing import CALIBRATION_TASKS, worker_rss_mb
+
+log = logging.getLogger(__name__)
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+WATCHDOG_INTERVAL_SECONDS = float(os.environ.get("WATCHDOG_INTERVAL_SECONDS", "1"))
+WATCHDOG_THROTTLE_AT = float(os.environ.get("WATCHDOG_THROTTLE_AT", "0.85"))
+WATCHDOG_RETIRE_AT = float(os.environ.get("WATCHDOG_RETIRE_AT", "0.93"))
+# Minimum time between two cuts: give a finishing task the chance to free
+# its memory before cutting again.
+WATCHDOG_THROTTLE_COOLDOWN_SECONDS = float(
+    os.environ.get("WATCHDOG_THROTTLE_COOLDOWN_SECONDS", "5")
+)
+WATCHDOG_GROW_COOLDOWN_SECONDS = float(
+    os.environ.get("WATCHDOG_GROW_COOLDOWN_SECONDS", "30")
+)
+
+
+def _read_int(path: Path) -> int | None:
+    try:
+        value = path.read_text().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+def _read_keyed(path: Path) -> dict[str, int]:
+    """Parse a flat-keyed cgroup file (``memory.stat``, ``memory.events``)."""
+    try:
+        lines = path.read_text().splitlines()
+    except OSError:
+        return {}
+    values = {}
+    for line in lines:
+        key, _, value = line.partition(" ")
+        if value.strip().isdigit():
+            values[key] = int(value)
+    return values
+
+
+class MemoryWatchdog:
+    """Background thread adjusting ``pool``'s task limit to memory pressure.
+
+    Use as a context manager around a heavy action. ``step`` is one sample
+    and is what the thread calls every ``WATCHDOG_INTERVAL_SECONDS``.
+    """
+
+    def __init__(
+        self,
+        pool: Any,
+        cgroup_root: Path = CGROUP_ROOT,
+        clock: Any = time.monotonic,
+        model: Any = None,
+    ) -> None:
+        self.pool = pool
+        self.model = model
+        self._root = cgroup_root
+        self._clock = clock
+        # memory.high, when set lower, is where the kernel starts throttling
+        # and reclaiming: treat it as the ceiling.
+        limits = [
+            _read_int(cgroup_root / name) for name in ("memory.max", "memory.high")
+        ]
+        self.limit_bytes = min((b for b in limits if b), default=None)
+        self._oom_kills = self._read_oom_kills()
+        self._per_task = 0
+        self._last_cut = float("-inf")
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.limit_bytes)
+
+    def __enter__(self) -> MemoryWatchdog:
+        if self.enabled:
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="memory-watchdog", daemon=True
+            )
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(WATCHDOG_INTERVAL_SECONDS):
+            try:
+                self.step()
+            except Exception:  # never let monitoring take the run down
+                log.exception("Memory watchdog sample failed")
+
+    def _read_oom_kills(self) -> int:
+        return _read_keyed(self._root / "memory.events").get("oom_kill", 0)
+
+    def usage_bytes(self) -> int | None:
+        current = _read_int(self._root / "memory.current")
+        if current is None:
+            return None
+        inactive_file = _read_keyed(self._root / "memory.stat").get("inactive_file", 0)
+        return max(current - inactive_file, 0)
+
+    def step(self) -> None:
+        """Take one sample and adjust the pool's limit."""
+        if not self.enabled:
+            return
+        self._calibrate()
+        usage = self.usage_bytes()
+        if usage is None:
+            return
+        now = self._clock()
+        pool = self.pool
+        running = pool.in_flight
+        if running:
+            self._per_task = max(self._per_task, usage // running)
+        ratio = usage / self.limit_bytes
+
+        oom_kills = self._read_oom_kills()
+        if oom_kills > self._oom_kills:
+            self._oom_kills = oom_kills
+            self._cut(max(1, min(pool.limit, max(running, 1)) // 2), now, ratio)
+            log.warning(
+                "cgroup OOM-killed a process; pool limit now %d (killed tasks "
+                "are resubmitted)",
+                pool.limit,
+            )
+            return
+
+        if ratio >= WATCHDOG_THROTTLE_AT:
+            if now - self._last_cut >= WATCHDOG_THROTTLE_COOLDOWN_SECONDS:
+                self._cut(min(pool.limit, max(running, 1)) - 1, now, ratio)
+            if ratio >= WATCHDOG_RETIRE_AT:
+                pool.retire_idle()
+            return
+
+        if (
+            pool.limit < self._ceiling()
+            and now - self._last_cut >= WATCHDOG_GROW_COOLDOWN_SECONDS
+            and usage + self._per_task < WATCHDOG_THROTTLE_AT * self.limit_bytes
+        ):
+            pool.set_limit(pool.limit + 1)
+            self._last_cut = now  # one step per cooldown, up as well as down
+            log.info(
+                "Memory at %.0f%% of limit; pool limit raised to %d",
+                100 * ratio,
+                pool.limit,
+            )
+
+    def _ceiling(self) -> int:
+        if self.model is None:
+            return self.pool.max_workers
+        return self.model.workers()
+
+    def _calibrate(self) -> None:
+        model = self.model
+        if model is None or model.calibrated:
+            return
+        if self.pool.completed < CALIBRATION_TASKS:
+            return
+        peak_mb = worker_rss_mb(self.pool.worker_pids(), "VmHWM")
+        if peak_mb is None:
+            return
+        workers = model.observe(peak_mb)
+        if not model.pinned:
+            self.pool.set_limit(workers)
+
+    def _cut(self, limit: int, now: float, ratio: float) -> None:
+        before = self.pool.limit
+        self.pool.set_limit(limit)
+        self._last_cut = now
+        if self.pool.limit < before:
+            log.warning(
+                "Memory at %.0f%% of limit; pool limit lowered %d -> %d",
+                100 * ratio,
+                before,
+                self.pool.limit,
+            )
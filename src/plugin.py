@@ -10,8 +10,11 @@ from __future__ import annotations
 # set before stormhub is imported below.
 import aorc_env  # noqa: F401
 
+import contextlib
+import importlib
 import logging
 import logging.config
+import math
 import multiprocessing
 import os
 import shutil
@@ -20,16 +23,22 @@ import sys
 import time
 from enum import IntEnum
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any, Callable
 
-from cc.plugin_manager import PluginManager
 from stormhub.logger import initialize_logger
 
-from actions.download_inputs import download_inputs
-from actions.process_storms import process_storms
-from actions.convert_to_dss import convert_to_dss
-from actions.create_grid_file import create_grid_file
-from actions.upload_outputs import upload_outputs
+from actions import shards, storm_durations
+from actions.shg_regrid import SHG_REGRID_DIRNAME
+from actions.stats_index import STATS_INDEX_DIRNAME
+from aorc_cache import CACHE_DIRNAME, ChunkCache
+from checkpoint import Checkpoint
+from memory_watchdog import MemoryWatchdog
+from run_metrics import METRICS_FILE, RunMetrics
+from worker_pool import SharedPool
+from worker_sizing import WorkerMemoryModel, worker_rss_mb
+
+if TYPE_CHECKING:
+    from cc.plugin_manager import PluginManager
 
 
 def _configure_logging() -> None:
@@ -66,10 +75,11 @@ def _configure_logging() -> None:
 _configure_logging()
 log = logging.getLogger(__name__)
 
-# Force spawn as the multiprocessing default. The action imports above touch
-# multiprocessing during import, which fixes the start method to "fork" before
-# this line runs — so a plain set_start_method("spawn") raises "context has
-# already been set" and (when swallowed) leaves the default at fork. Any
+# Force spawn as the multiprocessing default. The action modules (imported
+# lazily, see ACTION_DISPATCH) and their libraries touch multiprocessing during
+# import, which can fix the start method to "fork" — so a plain
+# set_start_method("spawn") may raise "context has already been set" and (when
+# swallowed) leave the default at fork. Any
 # default-context ProcessPoolExecutor then FORKs, and forked workers deadlock on
 # their first fsspec/s3fs read because fork doesn't duplicate fsspec's async
 # event-loop thread. force=True makes spawn the effective default; ValueError
@@ -88,7 +98,7 @@ class ExitCode(IntEnum):
 REQUIRED_ATTRS = ["catalog_id", "catalog_description", "output_path", "start_date"]
 REQUIRED_INPUT_KEYS = ["watershed", "transposition"]
 # Optional payload attribute naming the local cache/scratch directory used for the
-# STAC catalog, DSS conversion, and the resume .checkpoint. Point it at an attached
+# STAC catalog, DSS conversion, and the resume checkpoint.json. Point it at an attached
 # volume (e.g. the /model PVC) so the multi-hour catalog does NOT land on node
 # ephemeral-storage and trip a disk-pressure eviction. When unset or empty it falls
 # back to a repo-relative "Local" dir — preserving prior behavior and local runs
@@ -96,31 +106,74 @@ REQUIRED_INPUT_KEYS = ["watershed", "transposition"]
 CACHE_DIR_ATTR = "cache_dir"
 DEFAULT_CACHE_DIR = "Local"
 
+# Actions that run even when the checkpoint says they finished. process-storms
+# puts the collection every later action needs into ctx, and on resume it only
+# reloads the saved catalog from the cache dir, which takes seconds.
+RERUN_ON_RESUME = {"process-storms", "merge-storms"}
+
+# Actions that run their work on the shared worker pool. The pool is only
+# started when the payload has one of them.
+POOL_ACTIONS = {"process-storms", "merge-storms", "convert-to-dss"}
+
+# Handlers as "module:function", imported only when the payload runs them.
+# Importing every action up front pulled stormhub's whole scientific stack
+# (xarray, zarr, rasterio, pyproj, ...) into upload-only and re-run jobs that
+# never touch it; test_plugin_startup holds the line.
 ACTION_DISPATCH = {
-    "download-inputs": download_inputs,
-    "process-storms": process_storms,
-    "convert-to-dss": convert_to_dss,
-    "create-grid-file": create_grid_file,
-    "upload-outputs": upload_outputs,
+    "download-inputs": "actions.download_inputs:download_inputs",
+    "prefetch-aorc": "actions.prefetch_aorc:prefetch_aorc",
+    "process-storms": "actions.process_storms:process_storms",
+    "merge-storms": "actions.merge_storms:merge_storms",
+    "convert-to-dss": "actions.convert_to_dss:convert_to_dss",
+    "create-grid-file": "actions.create_grid_file:create_grid_file",
+    "upload-outputs": "actions.upload_outputs:upload_outputs",
 }
 
+
+def resolve_handler(name: str) -> Callable[[dict[str, Any], Any], None]:
+    """Import and return the handler for action ``name``."""
+    module, _, func = ACTION_DISPATCH[name].partition(":")
+    return getattr(importlib.import_module(module), func)
+
+
 # Attribute type constraints: (validator_fn, human description)
 _POSITIVE_INT = (lambda v: v.isdigit() and int(v) > 0, "positive integer string")
+_POSITIVE_INT_LIST = (
+    lambda v: all(d.strip().isdigit() and int(d) > 0 for d in v.split(",")),
+    "positive integer string, or a comma-separated list of them",
+)
 _NON_NEGATIVE_FLOAT = (
     lambda v: _is_non_negative_float(v),
     "non-negative numeric string",
 )
 _DATE_FMT = (lambda v: _is_iso_date(v), "YYYY-MM-DD date string")
 _JSON_LIST = (lambda v: _is_json_string_list(v), "JSON array of date strings")
+_BOOL = (lambda v: v.lower() in ("true", "false"), '"true" or "false"')
+_SEARCH_ENGINE = (
+    lambda v: v.lower() in ("cumsum", "stormhub"),
+    '"cumsum" or "stormhub"',
+)
+_SHARD = (shards.is_valid, '"k/n" (1 <= k <= n) or "YYYY-MM-DD/YYYY-MM-DD"')
+_SHARD_LIST = (
+    shards.merge_specs_valid,
+    "shard count, or JSON array of shard specs",
+)
 
 ATTR_VALIDATORS: dict[str, tuple] = {
     "start_date": _DATE_FMT,
     "end_date": _DATE_FMT,
-    "storm_duration": _POSITIVE_INT,
+    "storm_duration": _POSITIVE_INT_LIST,
     "top_n_events": _POSITIVE_INT,
     "check_every_n_hours": _POSITIVE_INT,
     "min_precip_threshold": _NON_NEGATIVE_FLOAT,
     "specific_dates": _JSON_LIST,
+    "pipeline_dss": _BOOL,
+    "shared_cube": _BOOL,
+    "query_stats": _BOOL,
+    "adaptive_search": _BOOL,
+    "search_engine": _SEARCH_ENGINE,
+    "shard": _SHARD,
+    "shards": _SHARD_LIST,
 }
 
 
@@ -147,6 +200,23 @@ def _is_json_string_list(v: str) -> bool:
         return False
 
 
+def _validate_sharding(attrs: dict[str, str], actions: list[str]) -> None:
+    """A shard job only scans; merge-storms builds the catalog instead of
+    process-storms."""
+    if attrs.get("shard"):
+        after = {"merge-storms", "convert-to-dss", "create-grid-file"} & set(actions)
+        if after:
+            raise ValueError(
+                f"A shard job (shard={attrs['shard']!r}) cannot run {sorted(after)}; "
+                "run them in the merge-storms job"
+            )
+    if "merge-storms" in actions:
+        if not attrs.get("shards"):
+            raise ValueError("merge-storms needs the 'shards' attribute")
+        if "process-storms" in actions:
+            raise ValueError("merge-storms replaces process-storms; run one of them")
+
+
 def validate_payload(payload: Any) -> None:
     """Fail fast with clear messages if payload is misconfigured."""
     attrs = payload.attributes
@@ -173,6 +243,8 @@ def validate_payload(payload: Any) -> None:
     if errors:
         raise ValueError("Invalid payload attribute values:\n" + "\n".join(errors))
 
+    _validate_sharding(attrs, [action.name for action in payload.actions])
+
     if not payload.outputs:
         raise ValueError("Payload has no outputs configured")
     if not payload.inputs:
@@ -193,27 +265,69 @@ def run_actions(pm: PluginManager, payload: Any) -> None:
 
     interrupted = False
     succeeded = False
+    running: str | None = None
 
     def handle_signal(signum: int, frame: Any) -> None:
+        # Every action can now be resumed mid-way (process-storms from
+        # storm-stats.csv, convert-to-dss per storm from the checkpoint), so a
+        # spot reclaim should stop the job now rather than let it run into the
+        # SIGKILL at the end of the grace period.
         nonlocal interrupted
-        log.warning("Received signal %d, will shut down after current action", signum)
         interrupted = True
+        if running is None:
+            log.warning("Received signal %d, shutting down before next action", signum)
+            return
+        log.warning("Received signal %d, interrupting action %s", signum, running)
+        raise KeyboardInterrupt
 
     signal.signal(signal.SIGTERM, handle_signal)
     signal.signal(signal.SIGINT, handle_signal)
 
-    # Track completed actions for checkpoint/resume
-    checkpoint_file = local_root / ".checkpoint"
-    completed_actions: set[str] = set()
-    if checkpoint_file.exists():
-        completed_actions = set(checkpoint_file.read_text().splitlines())
-        log.info("Resuming from checkpoint — already completed: %s", completed_actions)
+    # Track completed actions (and per-storm DSS state) for checkpoint/resume
+    checkpoint = Checkpoint.load(local_root)
+    if checkpoint.actions:
+        log.info(
+            "Resuming from checkpoint — already completed: %s",
+            sorted(checkpoint.actions),
+        )
+
+    # Per-action metrics.json, in the output dir so upload-outputs ships it.
+    catalog_id = payload.attributes["catalog_id"]
+    metrics = RunMetrics(
+        local_root / catalog_id / METRICS_FILE,
+        {"catalog_id": catalog_id, "actions": [a.name for a in payload.actions]},
+    )
+
+    # One warm pool for every heavy action. Its workers spawn and import
+    # stormhub et al. in the background while download-inputs runs.
+    pool: SharedPool | None = None
+    model: WorkerMemoryModel | None = None
+    chunk_cache: ChunkCache | None = None
+    if any(action.name in POOL_ACTIONS for action in payload.actions):
+        model = WorkerMemoryModel(payload.attributes)
+        chunk_cache = ChunkCache.for_cache_dir(local_root)
+        pool = SharedPool(
+            model.max_workers,
+            read_counter=metrics.aorc_bytes_counter,
+            limit=model.workers(),
+            threads_per_worker=model.threads,
+            chunk_cache=chunk_cache,
+        )
+        metrics.watch_workers(pool.worker_pids)
+        if chunk_cache is not None:
+            metrics.watch_cache(chunk_cache.stats)
+        pool.warm()
+    watchdog = MemoryWatchdog(pool, model=model) if pool is not None else None
 
     # Shared context passed to all actions
     ctx: dict[str, Any] = {
         "pm": pm,
         "payload": payload,
         "local_root": local_root,
+        "checkpoint": checkpoint,
+        "pool": pool,
+        "chunk_cache": chunk_cache,
+        "metrics": metrics,
         "_start_time": time.monotonic(),
     }
 
@@ -223,8 +337,7 @@ def run_actions(pm: PluginManager, payload: Any) -> None:
                 log.warning("Shutdown requested, aborting after action %d", i)
                 raise KeyboardInterrupt
 
-            handler = ACTION_DISPATCH.get(action.name)
-            if handler is None:
+            if action.name not in ACTION_DISPATCH:
                 log.error(
                     "Unknown action: %s (available: %s)",
                     action.name,
@@ -232,7 +345,7 @@ def run_actions(pm: PluginManager, payload: Any) -> None:
                 )
                 raise ValueError(f"Unknown action: {action.name}")
 
-            if action.name in completed_actions:
+            if action.name in checkpoint.actions and action.name not in RERUN_ON_RESUME:
                 log.info(
                     "[%d/%d] Skipping action (already completed): %s",
                     i + 1,
@@ -244,8 +357,19 @@ def run_actions(pm: PluginManager, payload: Any) -> None:
             log.info(
                 "[%d/%d] Running action: %s", i + 1, len(payload.actions), action.name
             )
+            handler = resolve_handler(action.name)
             t0 = time.monotonic()
-            handler(ctx, action)
+            running = action.name
+            # The watchdog throttles the pool as cgroup memory runs out, so a
+            # too-big domain slows the action down instead of OOM-killing it.
+            guard: Any = contextlib.nullcontext()
+            if watchdog is not None and action.name in POOL_ACTIONS:
+                guard = watchdog
+                if model is not None and model.predicted_mb is None:
+                    _predict_worker_memory(model, pool, payload, local_root)
+            with metrics.measure(action.name), guard:
+                handler(ctx, action)
+            running = None
             elapsed = time.monotonic() - t0
             log.info(
                 "Action %s completed in %.1fs",
@@ -254,17 +378,28 @@ def run_actions(pm: PluginManager, payload: Any) -> None:
             )
 
             # Checkpoint after each successful action
-            completed_actions.add(action.name)
-            checkpoint_file.write_text(
-                "\n".join(sorted(completed_actions)), encoding="utf-8"
-            )
+            checkpoint.mark_action(action.name)
 
         succeeded = True
         total_elapsed = time.monotonic() - ctx["_start_time"]
         log.info("All actions completed successfully in %.1fs", total_elapsed)
     finally:
+        if pool is not None:
+            pool.shutdown(wait=succeeded)
         if succeeded and local_root.exists():
-            shutil.rmtree(local_root)
+            keep = {CACHE_DIRNAME, STATS_INDEX_DIRNAME, SHG_REGRID_DIRNAME}
+            if any((local_root / name).exists() for name in keep):
+                # The AORC chunk cache, the storm-stats indexes and the SHG
+                # index maps stay for the next run on this volume.
+                for child in local_root.iterdir():
+                    if child.name in keep:
+                        continue
+                    if child.is_dir():
+                        shutil.rmtree(child)
+                    else:
+                        child.unlink()
+            else:
+                shutil.rmtree(local_root)
             log.info("Cleaned up %s", local_root)
         elif local_root.exists():
             log.warning(
@@ -272,7 +407,43 @@ def run_actions(pm: PluginManager, payload: Any) -> None:
             )
 
 
+def _predict_worker_memory(
+    model: WorkerMemoryModel, pool: SharedPool, payload: Any, local_root: Path
+) -> None:
+    """Size the pool for this payload's domain once the geometry is local."""
+    transposition = local_root / Path(payload.inputs[0].paths["transposition"]).name
+    if not transposition.exists():
+        return
+    from actions import cumsum_search, shared_cube
+
+    attrs = payload.attributes
+    hours = max(storm_durations(attrs))
+    step = int(attrs.get("check_every_n_hours", "24"))
+    if attrs.get("adaptive_search", "").lower() == "true":
+        # Its coarse pass also loads a window covering a whole stride, and
+        # its refine pass scores every hour.
+        hours += step - 1
+        step = 1
+    block_hours = block_windows = 0
+    if cumsum_search.enabled(payload):
+        # A search task holds a whole block, not one storm window.
+        block_hours = cumsum_search.SEARCH_BLOCK_HOURS + hours
+        block_windows = math.ceil(cumsum_search.SEARCH_BLOCK_HOURS / step)
+    model.predict(
+        transposition,
+        hours,
+        baseline_mb=worker_rss_mb(pool.worker_pids()),
+        block_hours=block_hours,
+        block_windows=block_windows,
+        shared_input=shared_cube.enabled(payload),
+    )
+    if not model.pinned:
+        pool.set_limit(model.workers())
+
+
 def main() -> None:
+    from cc.plugin_manager import PluginManager
+
     pm = PluginManager()
     payload = pm.get_payload()
     validate_payload(payload)
@@ -0,0 +1,324 @@
+"""Per-action resource metrics, written to ``metrics.json`` in the output dir.
+
+Sizing ``PER_WORKER_MB`` and node types used to mean guessing from container
+dashboards. Each run now records, for every action it runs:
+
+* wall time and user/system CPU, for this process and for its children (the
+  shared pool's workers and anything else it spawned);
+* peak RSS of this process and of each worker, and the cgroup's
+  ``memory.peak``;
+* bytes read from AORC, bytes uploaded, and storms processed per minute;
+* AORC chunk cache hits, misses and bytes served from disk (``aorc_cache``).
+
+The report is rewritten after every action, so a failed run still leaves one
+in the preserved cache dir, and upload-outputs uploads it last.
+
+The schema is versioned (``SCHEMA_VERSION``): every key is always present and
+``null`` when the platform can't provide it (no ``/proc``, cgroup v1, ...), so
+reports can be stacked into one table across the fleet. Add keys rather than
+rename them; bump the version if a meaning changes.
+
+How each number is taken (Linux):
+
+* Peak RSS is ``VmHWM`` from ``/proc/<pid>/status``, reset at the start of each
+  action via ``/proc/<pid>/clear_refs`` so it is per action, and sampled every
+  ``METRICS_SAMPLE_SECONDS`` so a worker that dies mid-action is not lost.
+* Pool workers live across actions and are only reaped at the end of the run,
+  so ``RUSAGE_CHILDREN`` alone would book all their CPU to the last action.
+  Children CPU is the per-action delta of each live worker's
+  ``/proc/<pid>/stat`` times plus the ``RUSAGE_CHILDREN`` delta (children
+  reaped during the action), minus the CPU reaped workers had before it began.
+* AORC bytes are counted in the workers by wrapping ``s3fs``'s
+  ``_cat_file``, through which zarr fetches every chunk; pool workers read
+  nothing else from S3. The count is summed in a shared counter.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+log = logging.getLogger(__name__)
+
+METRICS_FILE = "metrics.json"
+SCHEMA_VERSION = 1
+METRICS_SAMPLE_SECONDS = float(os.environ.get("METRICS_SAMPLE_SECONDS", "2"))
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+# Counters actions report through ``RunMetrics.add``.
+COUNTERS = ("bytes_uploaded", "storms_processed")
+# Keys of ``aorc_cache.ChunkCache.stats``; null when the cache is off.
+CACHE_KEYS = ("aorc_cache_hits", "aorc_cache_misses", "aorc_cache_bytes_served")
+
+
+def new_read_counter() -> Any:
+    """Shared byte counter for ``install_read_counter`` in pool workers."""
+    return multiprocessing.get_context("spawn").Value("Q", 0)
+
+
+def install_read_counter(counter: Any) -> None:
+    """Count every byte this process reads through s3fs into ``counter``."""
+    try:
+        from s3fs import S3FileSystem
+    except ImportError:
+        return
+    original = S3FileSystem._cat_file
+    if getattr(original, "_counts_reads", False):
+        return
+
+    async def _cat_file(self: Any, *args: Any, **kwargs: Any) -> Any:
+        data = await original(self, *args, **kwargs)
+        with counter.get_lock():
+            counter.value += len(data)
+        return data
+
+    _cat_file._counts_reads = True
+    S3FileSystem._cat_file = _cat_file
+
+
+def _read_proc(pid: int, name: str) -> str | None:
+    try:
+        return Path(f"/proc/{pid}/{name}").read_text()
+    except OSError:
+        return None
+
+
+def _peak_rss_bytes(pid: int) -> int | None:
+    status = _read_proc(pid, "status")
+    if status is None:
+        return None
+    for line in status.splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1]) * 1024
+    return None
+
+
+def _reset_peak_rss(pid: int) -> None:
+    # "5" resets VmHWM to the current RSS (Linux >= 4.0). Best effort.
+    try:
+        Path(f"/proc/{pid}/clear_refs").write_text("5")
+    except OSError:
+        pass
+
+
+def _cpu_seconds(pid: int) -> tuple[float, float] | None:
+    stat = _read_proc(pid, "stat")
+    if stat is None:
+        return None
+    # Fields after the parenthesised command name; utime/stime are 14 and 15.
+    fields = stat.rsplit(")", 1)[1].split()
+    return int(fields[11]) / _CLK_TCK, int(fields[12]) / _CLK_TCK
+
+
+def _cgroup_bytes(name: str) -> int | None:
+    try:
+        value = (CGROUP_ROOT / name).read_text().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class _ActionRecord:
+    """Measurements for one running action."""
+
+    def __init__(
+        self,
+        name: str,
+        worker_pids: Iterable[int],
+        aorc_bytes: int,
+        cache_stats: dict[str, int] | None,
+    ) -> None:
+        self.name = name
+        self.started_at = _now()
+        self.t0 = time.monotonic()
+        self.self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        self.children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.aorc_bytes = aorc_bytes
+        self.cache_stats = cache_stats
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.worker_cpu_start: dict[int, tuple[float, float]] = {}
+        self.worker_cpu_last: dict[int, tuple[float, float]] = {}
+        self.worker_peak: dict[int, int] = {}
+        self.parent_peak: int | None = None
+
+        _reset_peak_rss(os.getpid())
+        for pid in worker_pids:
+            _reset_peak_rss(pid)
+            cpu = _cpu_seconds(pid)
+            if cpu is not None:
+                self.worker_cpu_start[pid] = cpu
+
+    def sample(self, worker_pids: Iterable[int]) -> None:
+        peak = _peak_rss_bytes(os.getpid())
+        if peak is not None:
+            self.parent_peak = max(self.parent_peak or 0, peak)
+        for pid in worker_pids:
+            peak = _peak_rss_bytes(pid)
+            if peak is not None:
+                self.worker_peak[pid] = max(self.worker_peak.get(pid, 0), peak)
+            cpu = _cpu_seconds(pid)
+            if cpu is not None:
+                self.worker_cpu_last[pid] = cpu
+                self.worker_cpu_start.setdefault(pid, (0.0, 0.0))
+
+    def report(
+        self,
+        status: str,
+        worker_pids: list[int],
+        aorc_bytes: int,
+        cache_stats: dict[str, int] | None,
+    ) -> dict:
+        self.sample(worker_pids)
+        wall = time.monotonic() - self.t0
+        now_self = resource.getrusage(resource.RUSAGE_SELF)
+        now_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        alive = set(worker_pids)
+        child_user = now_children.ru_utime - self.children_usage.ru_utime
+        child_sys = now_children.ru_stime - self.children_usage.ru_stime
+        for pid, (user0, sys0) in self.worker_cpu_start.items():
+            if pid in alive and pid in self.worker_cpu_last:
+                user1, sys1 = self.worker_cpu_last[pid]
+                child_user += user1 - user0
+                child_sys += sys1 - sys0
+            else:
+                # Reaped: its lifetime CPU is in RUSAGE_CHILDREN.
+                child_user -= user0
+                child_sys -= sys0
+
+        storms = self.counters["storms_processed"]
+        cache = dict.fromkeys(CACHE_KEYS)
+        if cache_stats is not None and self.cache_stats is not None:
+            cache = {k: cache_stats[k] - self.cache_stats[k] for k in CACHE_KEYS}
+        return {
+            "name": self.name,
+            "status": status,
+            "started_at": self.started_at,
+            "wall_seconds": round(wall, 3),
+            "cpu_user_seconds": round(now_self.ru_utime - self.self_usage.ru_utime, 3),
+            "cpu_system_seconds": round(
+                now_self.ru_stime - self.self_usage.ru_stime, 3
+            ),
+            "children_cpu_user_seconds": round(max(child_user, 0.0), 3),
+            "children_cpu_system_seconds": round(max(child_sys, 0.0), 3),
+            "parent_peak_rss_bytes": self.parent_peak,
+            "worker_peak_rss_bytes": sorted(self.worker_peak.values(), reverse=True),
+            "cgroup_memory_peak_bytes": _cgroup_bytes("memory.peak"),
+            "aorc_bytes_read": aorc_bytes - self.aorc_bytes,
+            "bytes_uploaded": self.counters["bytes_uploaded"],
+            "storms_processed": storms,
+            "storms_per_minute": round(storms / (wall / 60), 3) if wall > 0 else None,
+            **cache,
+        }
+
+
+class RunMetrics:
+    """Collect per-action metrics for one run and write ``metrics.json``."""
+
+    def __init__(self, path: Path, run_info: dict[str, Any]) -> None:
+        self.path = path
+        self.aorc_bytes_counter = new_read_counter()
+        self._run = {
+            **run_info,
+            "started_at": _now(),
+            "cgroup_memory_max_bytes": _cgroup_bytes("memory.max"),
+            "cpu_count": os.cpu_count(),
+        }
+        self._actions: list[dict] = []
+        self._current: _ActionRecord | None = None
+        self._worker_pids: Callable[[], list[int]] = list
+        self._cache_stats: Callable[[], dict[str, int]] | None = None
+
+    def watch_workers(self, worker_pids: Callable[[], list[int]]) -> None:
+        """Sample the processes ``worker_pids()`` returns as workers."""
+        self._worker_pids = worker_pids
+
+    def watch_cache(self, cache_stats: Callable[[], dict[str, int]]) -> None:
+        """Report the deltas of ``cache_stats()`` (``CACHE_KEYS``) per action."""
+        self._cache_stats = cache_stats
+
+    def add(self, counter: str, value: int) -> None:
+        """Add to a counter (see ``COUNTERS``) of the running action."""
+        if self._current is not None:
+            self._current.counters[counter] += value
+
+    @contextlib.contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        record = _ActionRecord(
+            name, self._worker_pids(), self._aorc_bytes(), self._cache()
+        )
+        self._current = record
+        stop = threading.Event()
+
+        def _sampler() -> None:
+            while not stop.wait(METRICS_SAMPLE_SECONDS):
+                record.sample(self._worker_pids())
+
+        sampler = threading.Thread(target=_sampler, name="metrics", daemon=True)
+        sampler.start()
+        status = "failed"
+        try:
+            yield
+            status = "completed"
+        finally:
+            stop.set()
+            sampler.join()
+            self._current = None
+            report = record.report(
+                status, self._worker_pids(), self._aorc_bytes(), self._cache()
+            )
+            self._actions.append(report)
+            self.write()
+            if report["aorc_cache_hits"] is not None:
+                log.info(
+                    "AORC chunk cache for %s: %d hit(s), %d miss(es), "
+                    "%.1f MB served from disk",
+                    name,
+                    report["aorc_cache_hits"],
+                    report["aorc_cache_misses"],
+                    report["aorc_cache_bytes_served"] / 2**20,
+                )
+
+    def write(self) -> Path:
+        """Write the report; an action still running is included as such."""
+        actions = list(self._actions)
+        if self._current is not None:
+            actions.append(
+                self._current.report(
+                    "running", self._worker_pids(), self._aorc_bytes(), self._cache()
+                )
+            )
+        report = {
+            "schema_version": SCHEMA_VERSION,
+            "run": {**self._run, "written_at": _now()},
+            "actions": actions,
+        }
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps(report, indent=2), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.warning("Could not write %s: %s", self.path, e)
+        return self.path
+
+    def _aorc_bytes(self) -> int:
+        return self.aorc_bytes_counter.value
+
+    def _cache(self) -> dict[str, int] | None:
+        return None if self._cache_stats is None else self._cache_stats()
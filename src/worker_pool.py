@@ -0,0 +1,431 @@
+"""One long-lived spawn worker pool for every heavy action.
+
+process-storms (inside stormhub's ``new_collection``) and convert-to-dss used
+to build their own spawn ``ProcessPoolExecutor``. Every spawned child imports
+stormhub, xarray, zarr, s3fs, rasterio and pyproj before doing any work, so
+each stage paid several seconds per worker of pure import and S3 session
+setup, and a resumed run paid it again.
+
+``plugin.run_actions`` now creates a single ``SharedPool`` sized by
+``worker_sizing.WorkerMemoryModel`` and starts it warming while
+download-inputs runs. The
+workers outlive each task and each action, so anything a worker caches at
+module level — imported libraries, fsspec's per-process filesystem instances
+and their S3 sessions, opened datasets — carries over to its next task.
+
+* Code in this repo submits to ``SharedPool`` directly (``submit`` /
+  ``run_bounded``).
+* stormhub constructs its executors itself, by the ``ProcessPoolExecutor``
+  name in ``stormhub.met.storm_catalog``. ``lend_to_stormhub`` points that
+  name at a ``BorrowedPool`` view of the shared pool for the duration of a
+  call; leaving stormhub's ``with`` block waits for the view's own tasks but
+  never shuts the shared pool down.
+
+A worker killed mid-task (usually the OOM killer) breaks a
+``ProcessPoolExecutor`` for good. The pool replaces the broken executor and
+resubmits the tasks that were running on it — every task in this plugin is
+idempotent — while ``memory_watchdog`` lowers the concurrency that caused it.
+Only a task that keeps killing its worker surfaces ``BrokenProcessPool``.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import functools
+import importlib
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    CancelledError,
+    Future,
+    ProcessPoolExecutor,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Iterable, Iterator
+
+from worker_sizing import thread_env
+
+log = logging.getLogger(__name__)
+
+# How often one task is resubmitted after its worker died (usually an OOM kill)
+# before the BrokenProcessPool reaches the caller.
+MAX_TASK_RETRIES = int(os.environ.get("POOL_MAX_TASK_RETRIES", "3"))
+
+# Imported by each worker as it starts, so the cost lands during warm-up
+# instead of in the first task. The plugin entry module (which spawn re-imports
+# in each child as __mp_main__) deliberately imports none of them.
+WARM_MODULES = (
+    "stormhub.met.storm_catalog",
+    "stormhub.met.zarr_to_dss",
+    "xarray",
+    "zarr",
+    "s3fs",
+    "rasterio",
+    "pyproj",
+)
+
+
+def _init_worker(
+    read_counter: Any,
+    env: dict[str, str],
+    chunk_cache: Any,
+    started: Any,
+    generation: int,
+) -> None:
+    """Pool initializer: pay the import cost once per worker process.
+
+    The worker first reports its PID on ``started``, tagged with its
+    executor's ``generation``. ``env`` (``worker_sizing.thread_env``) is
+    applied next: the numeric libraries size their thread pools from it when
+    imported. The AORC dataset cache goes in before stormhub is imported, so
+    a ``from xarray import open_zarr`` there picks it up too.
+    """
+    started.put((generation, os.getpid()))
+    os.environ.update(env)
+    import aorc_store
+
+    aorc_store.install_dataset_cache()
+    for name in WARM_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass  # the task that needs it will report the real error
+    _hook_reads(read_counter, chunk_cache)
+
+
+def _hook_reads(read_counter: Any, chunk_cache: Any) -> None:
+    """Count this process's S3 reads and serve its AORC chunks from the cache."""
+    if read_counter is not None:
+        from run_metrics import install_read_counter
+
+        install_read_counter(read_counter)
+    if chunk_cache is not None:
+        from aorc_cache import install_chunk_cache
+
+        # After the read counter: a cache hit reads nothing from S3.
+        install_chunk_cache(chunk_cache)
+
+
+def _ready() -> None:
+    pass
+
+
+class SharedPool:
+    """A spawn ``ProcessPoolExecutor`` shared by every action of one run.
+
+    Every task goes through ``submit``, which queues it while ``limit``
+    tasks are already running (``memory_watchdog`` lowers and raises the
+    limit with cgroup memory pressure) and resubmits it if a worker died
+    under it (``BrokenProcessPool``), up to ``MAX_TASK_RETRIES`` times.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        read_counter: Any = None,
+        limit: int | None = None,
+        threads_per_worker: int = 1,
+        chunk_cache: Any = None,
+    ) -> None:
+        self.max_workers = max_workers
+        self.threads_per_worker = threads_per_worker
+        # Shared counter the workers add their S3 read bytes to (run_metrics).
+        self._read_counter = read_counter
+        # aorc_cache.ChunkCache the workers read AORC chunks through.
+        self._chunk_cache = chunk_cache
+        self._lock = threading.Lock()
+        # Workers report (executor generation, PID) here as they start.
+        self._started = multiprocessing.get_context("spawn").SimpleQueue()
+        self._pids: dict[int, set[int]] = {}
+        self._pids_lock = threading.Lock()
+        self._generations: dict[ProcessPoolExecutor, int] = {}
+        self._executor = self._new_executor()
+        # Executors retired by ``retire_idle``, still finishing their tasks.
+        self._retired: list[ProcessPoolExecutor] = []
+        self._slots = threading.Lock()
+        # Submitted tasks waiting for a slot: (future, attempt, fn, args, kwargs).
+        self._queue: deque[tuple] = deque()
+        self._closed = False
+        self._limit = max(1, min(max_workers, limit or max_workers))
+        self._in_flight = 0
+        self._completed = 0
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # Explicit spawn context: a forked worker deadlocks on its first
+        # fsspec/s3fs read (fork doesn't duplicate fsspec's event-loop thread).
+        generation = len(self._generations)
+        executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(
+                self._read_counter,
+                thread_env(self.threads_per_worker),
+                self._chunk_cache,
+                self._started,
+                generation,
+            ),
+        )
+        self._generations[executor] = generation
+        return executor
+
+    def _workers(self, executor: ProcessPoolExecutor) -> set[int]:
+        """PIDs of ``executor``'s workers that are still alive."""
+        with self._pids_lock:
+            while not self._started.empty():
+                generation, pid = self._started.get()
+                self._pids.setdefault(generation, set()).add(pid)
+            alive = {p.pid for p in multiprocessing.active_children()}
+            return self._pids.get(self._generations[executor], set()) & alive
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if getattr(self._executor, "_broken", False):
+                log.warning("Worker pool is broken (worker died); starting a new one")
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._new_executor()
+            return self._executor
+
+    def hook_reads(self) -> None:
+        """Count and cache this process's own AORC reads as the workers' are.
+
+        The initializer hooks only the workers; call this before the plugin
+        process loads AORC itself (``shared_cube.build``), so its S3 bytes
+        reach metrics.json and its chunks go through the cache.
+        """
+        _hook_reads(self._read_counter, self._chunk_cache)
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def completed(self) -> int:
+        """Tasks that finished successfully since the pool started."""
+        return self._completed
+
+    def set_limit(self, limit: int) -> None:
+        """Allow at most ``limit`` (1..max_workers) tasks to run at once."""
+        with self._slots:
+            self._limit = max(1, min(self.max_workers, limit))
+        self._dispatch()
+
+    def retire_idle(self) -> None:
+        """Let workers without a task exit, returning their memory.
+
+        A ProcessPoolExecutor can't shrink, so new tasks go to a fresh one and
+        the current one is shut down without waiting: its running tasks finish
+        (their futures resolve as usual) and then all of its workers exit,
+        including the idle ones holding on to a previous task's heap.
+        """
+        with self._lock:
+            old = self._executor
+            if len(self._workers(old)) <= self._in_flight:
+                return  # every worker is busy; nothing idle to retire
+            self._executor = self._new_executor()
+            self._retired = [e for e in self._retired if self._workers(e)]
+            self._retired.append(old)
+        old.shutdown(wait=False)
+        log.info("Retired idle pool workers; new workers spawn on demand")
+
+    def warm(self) -> None:
+        """Start ``limit`` workers now; returns without waiting for the imports.
+
+        One trivial task per worker makes the executor spawn them (it only
+        spawns on submit), and each runs ``_init_worker`` on start. Workers
+        beyond the limit spawn when the limit grows.
+        """
+        log.info("Warming %d pool worker(s) in the background", self._limit)
+        for _ in range(self._limit):
+            self.executor.submit(_ready)
+
+    def worker_pids(self) -> list[int]:
+        pids = list(self._workers(self._executor))
+        for retired in self._retired:
+            pids += list(self._workers(retired))
+        return pids
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        """Queue ``fn`` to run once fewer than ``limit`` tasks are running.
+
+        The future stays pending, and can be cancelled, until the task is
+        dispatched to a worker.
+        """
+        outer: Future = Future()
+        with self._slots:
+            self._queue.append((outer, 0, fn, args, kwargs))
+        self._dispatch()
+        return outer
+
+    def _dispatch(self) -> None:
+        """Hand queued tasks to the executor while slots are free."""
+        while True:
+            with self._slots:
+                if not self._queue or self._in_flight >= self._limit:
+                    return
+                outer, attempt, fn, args, kwargs = self._queue.popleft()
+                # A retry is already running; a new task may have been
+                # cancelled while it waited.
+                if attempt == 0 and not outer.set_running_or_notify_cancel():
+                    continue
+                self._in_flight += 1
+            try:
+                inner = self.executor.submit(fn, *args, **kwargs)
+            except BaseException as e:  # e.g. the pool was shut down
+                self._release()
+                outer.set_exception(e)
+                continue
+            inner.add_done_callback(
+                functools.partial(self._settle, outer, attempt, fn, args, kwargs)
+            )
+
+    def _settle(
+        self,
+        outer: Future,
+        attempt: int,
+        fn: Callable[..., Any],
+        args: tuple,
+        kwargs: dict,
+        done: Future,
+    ) -> None:
+        self._release()
+        if done.cancelled():  # the executor was shut down under it
+            outer.set_exception(CancelledError())
+            return
+        error = done.exception()
+        with self._slots:
+            retry = (
+                isinstance(error, BrokenProcessPool)
+                and attempt < MAX_TASK_RETRIES
+                and not self._closed  # shutdown kills the workers itself
+            )
+            if retry:
+                self._queue.appendleft((outer, attempt + 1, fn, args, kwargs))
+        if retry:
+            log.warning(
+                "Pool worker died under %s (likely OOM); resubmitting (retry %d/%d)",
+                getattr(fn, "__name__", fn),
+                attempt + 1,
+                MAX_TASK_RETRIES,
+            )
+        elif error is not None:
+            outer.set_exception(error)
+        else:
+            with self._slots:
+                self._completed += 1
+            outer.set_result(done.result())
+        # Not from this callback: it runs on an executor's management thread.
+        threading.Thread(target=self._dispatch, daemon=True).start()
+
+    def _release(self) -> None:
+        with self._slots:
+            self._in_flight -= 1
+
+    def run_bounded(
+        self,
+        fn: Callable[..., Any],
+        calls: Iterable[tuple[Any, ...]],
+        limit: int,
+    ) -> Iterator[tuple[tuple[Any, ...], Any]]:
+        """Run ``fn(*args)`` for each of ``calls``, at most ``limit`` at a time.
+
+        Yields ``(args, result)`` as tasks finish, so the caller can record
+        each one before the rest are done. Submitting lazily keeps this
+        caller's backlog from queueing ahead of other users of the pool.
+        """
+        pending = iter(calls)
+        running: dict[Future, tuple[Any, ...]] = {}
+        limit = max(1, limit)
+        while True:
+            for args in pending:
+                running[self.submit(fn, *args)] = args
+                if len(running) >= limit:
+                    break
+            if not running:
+                return
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield running.pop(future), future.result()
+
+    def borrow(self) -> BorrowedPool:
+        return BorrowedPool(self)
+
+    @contextlib.contextmanager
+    def lend_to_stormhub(self) -> Iterator[None]:
+        """Make stormhub's own executors run on this pool inside the block."""
+        from stormhub.met import storm_catalog
+
+        def _borrowed(*args: Any, **kwargs: Any) -> BorrowedPool:
+            return self.borrow()
+
+        original = storm_catalog.ProcessPoolExecutor
+        storm_catalog.ProcessPoolExecutor = _borrowed
+        try:
+            yield
+        finally:
+            storm_catalog.ProcessPoolExecutor = original
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the pool; ``wait=False`` kills the workers mid-task.
+
+        A failed or interrupted run has nothing worth finishing — every action
+        resumes from its checkpoint — and waiting out a multi-minute task
+        would run into the SIGKILL after SIGTERM.
+        """
+        with self._slots:
+            self._closed = True
+            queued, self._queue = self._queue, deque()
+        for outer, attempt, *_ in queued:
+            if attempt:  # a retry: its future is already running
+                outer.set_exception(CancelledError())
+            else:
+                outer.cancel()
+        with self._lock:
+            executors = [*self._retired, self._executor]
+            if not wait:
+                for executor in executors:
+                    for pid in self._workers(executor):
+                        with contextlib.suppress(ProcessLookupError):
+                            os.kill(pid, signal.SIGTERM)
+            for executor in executors:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+
+class BorrowedPool:
+    """Executor view whose ``shutdown`` waits for its own tasks only."""
+
+    def __init__(self, pool: SharedPool) -> None:
+        self._pool = pool
+        self._futures: list[Future] = []
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        future = self._pool.submit(fn, *args, **kwargs)
+        self._futures.append(future)
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        if cancel_futures:
+            for future in self._futures:
+                future.cancel()
+        if wait:
+            for future in self._futures:
+                if not future.cancelled():
+                    future.exception()  # blocks until done; errors stay on it
+        self._futures.clear()
+
+    def __enter__(self) -> BorrowedPool:
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.shutdown(wait=True)
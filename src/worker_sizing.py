@@ -5,17 +5,48 @@ which inside a container reads the *host* CPU count and can exceed the
 cgroup memory ceiling — causing OOM-driven ``BrokenProcessPool``. This
 module picks a safe count from the cgroup limit, with operator overrides.
 
-Assumes each worker runs single-threaded: dask's synchronous scheduler
-and ``*_NUM_THREADS=1`` are set in the image (see Dockerfile). Without
-those, per-worker RSS would also scale with visible vCPU count and this
-heuristic would under-count memory pressure.
+``read_resources`` models what the container may use: memory from
+``memory.max`` and the ``memory.high`` soft limit (cgroup v2) or
+``memory.limit_in_bytes`` (v1), CPUs from the ``cpu.max`` /
+``cpu.cfs_quota_us`` quota and the affinity mask, and swap for the log. Swap
+does not count toward the budget: a worker paging its arrays is slower than
+one worker fewer.
+
+Memory decides the process count; the CPUs left over become each worker's
+thread budget (``threads_per_worker``), capped at ``MAX_THREADS_PER_WORKER``
+because dask's threaded scheduler and BLAS also multiply a worker's RSS.
+``thread_env`` sets ``OMP_NUM_THREADS`` and friends and the dask scheduler in
+each worker before it imports anything, so the image's ``*_NUM_THREADS=1``
+only applies to the plugin process itself.
+
+A fixed ``PER_WORKER_MB`` wastes cores on small watersheds and OOMs on large
+transposition domains, so an auto-sized pool is steered by a
+``WorkerMemoryModel`` instead:
+
+1. Until the geometries are downloaded, ``PER_WORKER_MB`` is the prior.
+2. ``predict`` then estimates a worker's peak from the transposition bbox in
+   AORC cells x ``storm_duration`` x variables x dtype size — or, for the
+   cumulative-sum engine, the block of hours and windows one of its tasks
+   holds, if larger — plus the measured RSS of an idle warm worker. With a
+   shared AORC cube (``shared_cube``) a block's hours are mapped from the
+   page cache, not copied, so only what the task computes from them counts.
+3. ``observe`` replaces the estimate with the peak RSS measured once the
+   first ``CALIBRATION_TASKS`` tasks have completed (``memory_watchdog``
+   calls it), and logs prediction against measurement.
+
+The pool is created with room to grow (``max_workers``) and runs ``workers()``
+tasks at a time. An explicit ``num_workers`` / ``CC_NUM_WORKERS`` pins the
+pool; the model then only logs.
 """
 
 from __future__ import annotations
 
+import json
 import logging
+import math
 import os
 from pathlib import Path
+from typing import Any, Iterable, NamedTuple
 
 log = logging.getLogger(__name__)
 
@@ -24,14 +55,290 @@ log = logging.getLogger(__name__)
 # for larger domains.
 PER_WORKER_MB = 3072
 
+# AORC grid: 30 arc-second cells, hourly steps, float32 values. stormhub's
+# storm search reads precipitation (APCP_surface) only.
+AORC_CELL_DEG = 1 / 120
+AORC_DTYPE_BYTES = 4
+AORC_VARIABLES = int(os.environ.get("AORC_VARIABLES", "1"))
+# Copies of the storm window a worker holds at its peak: the chunk-aligned
+# read, the masked and transposed arrays and their sums. Calibrated so the
+# ~1.5 GB observed on the 72 hr Duwamish slice (~100 MB window) comes out.
+WINDOW_COPIES = float(os.environ.get("WORKER_WINDOW_COPIES", "10"))
+# The cumulative-sum engine (cumsum_search) holds a whole search block per
+# task, per AORC cell: the loaded float32 hours (read and materialized; not
+# held by the worker when it attaches a shared cube instead), then
+# per hour the float64 cumulative sums and int32 finite counts, and per
+# window the float64 totals, row prefix sums and their np.where temporary,
+# int32 hole counts and a finite mask. For 168 hourly 72 h windows on a
+# 300 x 300 domain, 624 MB of engine arrays were measured; the per-hour and
+# per-window terms give 637 MB.
+BLOCK_INPUT_COPIES = 2
+CUMSUM_BYTES_PER_HOUR = 12
+CUMSUM_BYTES_PER_WINDOW = 25
+# Idle warm worker RSS (interpreter + stormhub's imports), used until it can
+# be measured on the pool's own workers.
+BASELINE_MB = 500
+# Margin added to a predicted or measured peak for transient spikes.
+WORKER_HEADROOM = float(os.environ.get("WORKER_HEADROOM", "1.25"))
+# Completed pool tasks before the model switches to the measured peak.
+CALIBRATION_TASKS = int(os.environ.get("WORKER_CALIBRATION_TASKS", "2"))
+# Smallest per-worker budget an auto-sized pool may grow down to; bounds
+# ``max_workers`` together with the CPU count.
+MIN_WORKER_MB = 1024
+
 CGROUP_MEM_MAX = "/sys/fs/cgroup/memory.max"
+CGROUP_MEM_HIGH = "/sys/fs/cgroup/memory.high"
+CGROUP_SWAP_MAX = "/sys/fs/cgroup/memory.swap.max"
+CGROUP_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_MEM_LIMIT = "/sys/fs/cgroup/memory/memory.limit_in_bytes"
+CGROUP_V1_MEMSW_LIMIT = "/sys/fs/cgroup/memory/memory.memsw.limit_in_bytes"
+CGROUP_V1_CPU_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_CPU_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+AUTO_SOURCE = "auto-sized from cgroup"
+
+# Threads one worker may fan out to (dask threaded scheduler, BLAS, numexpr)
+# when the memory budget leaves CPUs idle. Each thread also holds chunks in
+# flight, so more would trade the memory model's accuracy for little speed.
+MAX_THREADS_PER_WORKER = int(os.environ.get("MAX_THREADS_PER_WORKER", "4"))
+
+# Thread-count variables of the numeric libraries a worker loads.
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+)
+
+# Share of the worker budget handed to DSS conversion when process-storms
+# streams finished storms straight into convert-to-dss (``pipeline_dss``).
+# Search and conversion workers peak at similar RSS, so the split is by count.
+PIPELINE_CONVERT_SHARE = float(os.environ.get("PIPELINE_CONVERT_SHARE", "0.5"))
+
+
+class ContainerResources(NamedTuple):
+    """What the container may use; ``None`` means no limit was found."""
+
+    memory_mb: int | None
+    swap_mb: int | None
+    cpus: int
+
+
+def read_resources() -> ContainerResources:
+    return ContainerResources(_cgroup_mem_limit_mb(), _cgroup_swap_mb(), _cgroup_cpus())
+
+
+def threads_per_worker(cpus: int, processes: int) -> int:
+    """CPUs each of ``processes`` workers may use; ``CC_THREADS_PER_WORKER`` wins."""
+    if os.environ.get("CC_THREADS_PER_WORKER"):
+        return max(1, int(os.environ["CC_THREADS_PER_WORKER"]))
+    return max(1, min(MAX_THREADS_PER_WORKER, cpus // max(1, processes)))
+
+
+def thread_env(threads: int) -> dict[str, str]:
+    """Environment that holds a worker to ``threads`` threads.
+
+    Read by the libraries when they are imported, so it must be applied
+    before the worker imports numpy or dask (``worker_pool._init_worker``).
+    """
+    env = dict.fromkeys(THREAD_ENV_VARS, str(threads))
+    env["DASK_SCHEDULER"] = "synchronous" if threads == 1 else "threads"
+    env["DASK_NUM_WORKERS"] = str(threads)
+    return env
+
+
+def split_workers(
+    total: int, convert_share: float = PIPELINE_CONVERT_SHARE
+) -> tuple[int, int]:
+    """Split one worker budget into concurrent (search, convert) pool sizes.
+
+    Both pools run at the same time in pipelined mode, so together they must
+    stay within the single ``WorkerMemoryModel`` budget. A budget of one
+    worker cannot be split; the caller gets ``(total, 0)`` and should fall back
+    to running the stages back to back.
+    """
+    if total < 2:
+        return total, 0
+    convert = min(total - 1, max(1, round(total * convert_share)))
+    return total - convert, convert
+
+
+class WorkerMemoryModel:
+    """Per-worker memory estimate that sizes an auto-sized pool.
+
+    ``workers()`` is how many tasks the container can afford at once under
+    the current estimate, clamped to ``1..max_workers``. ``pinned`` (an
+    operator override or no cgroup limit) fixes it at the resolved count.
+    """
+
+    def __init__(self, attrs: dict) -> None:
+        source, n = _resolve(attrs)
+        resources = read_resources()
+        self.mem_mb = resources.memory_mb
+        self.pinned = source != AUTO_SOURCE or self.mem_mb is None
+        self.per_worker_mb = PER_WORKER_MB
+        self.predicted_mb: int | None = None
+        self.measured_mb: int | None = None
+        # Fixed for the pool's lifetime: a worker's thread pools are sized
+        # when it imports its libraries.
+        self.threads = threads_per_worker(resources.cpus, n)
+        if self.pinned:
+            self.max_workers = n
+        else:
+            # Room to grow if workers turn out lighter than the prior, but
+            # never more processes x threads than there are CPUs.
+            self.max_workers = max(
+                n,
+                min(resources.cpus // self.threads, self.mem_mb // MIN_WORKER_MB),
+            )
+        self._fixed = n
+        log.info(
+            "num_workers=%d x %d thread(s) (%s; memory %s MB, swap %s MB, %d CPU(s))",
+            n,
+            self.threads,
+            source,
+            resources.memory_mb if resources.memory_mb is not None else "unlimited",
+            resources.swap_mb if resources.swap_mb is not None else "unlimited",
+            resources.cpus,
+        )
+
+    @property
+    def calibrated(self) -> bool:
+        return self.measured_mb is not None
+
+    def workers(self) -> int:
+        if self.pinned:
+            return self._fixed
+        return max(1, min(self.max_workers, self.mem_mb // self.per_worker_mb))
 
+    def predict(
+        self,
+        transposition_file: str | Path,
+        storm_duration: int,
+        baseline_mb: int | None,
+        block_hours: int = 0,
+        block_windows: int = 0,
+        shared_input: bool = False,
+    ) -> int | None:
+        """Estimate a worker's peak MB from the domain and the storm window,
+        or the ``block_hours`` loaded to score ``block_windows`` windows in a
+        cumulative-sum search task when that is larger. ``shared_input``
+        leaves out the block's input copies: the task reads a shared cube.
 
-def resolve_num_workers(attrs: dict) -> int:
-    """Payload attribute > CC_NUM_WORKERS env > cgroup-derived > 1."""
-    source, n = _resolve(attrs)
-    log.info("num_workers=%d (%s)", n, source)
-    return n
+        The storm window is counted either way: stormhub still loads its own
+        for item creation."""
+        bbox = geometry_bbox(transposition_file)
+        if bbox is None:
+            log.warning(
+                "Cannot read a lon/lat bbox from %s; keeping %d MB per worker",
+                transposition_file,
+                self.per_worker_mb,
+            )
+            return None
+        west, south, east, north = bbox
+        cells = math.ceil((east - west) / AORC_CELL_DEG) * math.ceil(
+            (north - south) / AORC_CELL_DEG
+        )
+        window_bytes = cells * storm_duration * AORC_VARIABLES * AORC_DTYPE_BYTES
+        input_copies = 0 if shared_input else BLOCK_INPUT_COPIES
+        block_bytes = cells * (
+            block_hours * (input_copies * AORC_DTYPE_BYTES + CUMSUM_BYTES_PER_HOUR)
+            + block_windows * CUMSUM_BYTES_PER_WINDOW
+        )
+        peak_bytes = max(WINDOW_COPIES * window_bytes, block_bytes)
+        baseline = baseline_mb or BASELINE_MB
+        self.predicted_mb = round((baseline + peak_bytes / 2**20) * WORKER_HEADROOM)
+        if not self.calibrated:
+            self.per_worker_mb = self.predicted_mb
+        log.info(
+            "Worker memory model: predicted %d MB per worker (%d AORC cells x "
+            "%d h, search block %d h / %d window(s), baseline %d MB) -> "
+            "%d worker(s)",
+            self.predicted_mb,
+            cells,
+            storm_duration,
+            block_hours,
+            block_windows,
+            baseline,
+            self.workers(),
+        )
+        return self.predicted_mb
+
+    def observe(self, peak_mb: int) -> int:
+        """Switch to the peak RSS measured on a worker; returns ``workers()``."""
+        self.measured_mb = peak_mb
+        self.per_worker_mb = max(1, round(peak_mb * WORKER_HEADROOM))
+        n = self.workers()
+        if self.predicted_mb is None:
+            log.info(
+                "Worker memory model: measured peak %d MB per worker -> %d worker(s)",
+                peak_mb,
+                n,
+            )
+        else:
+            log.info(
+                "Worker memory model: predicted %d MB, measured peak %d MB "
+                "(x%.2f with headroom %.2f) -> %d worker(s)",
+                self.predicted_mb,
+                peak_mb,
+                peak_mb * WORKER_HEADROOM / self.predicted_mb,
+                WORKER_HEADROOM,
+                n,
+            )
+        return n
+
+
+def geometry_bbox(path: str | Path) -> tuple[float, float, float, float] | None:
+    """``(west, south, east, north)`` of a lon/lat GeoJSON file, or None."""
+    try:
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    xs: list[float] = []
+    ys: list[float] = []
+    for x, y in _positions(data):
+        xs.append(x)
+        ys.append(y)
+    if not xs:
+        return None
+    bbox = min(xs), min(ys), max(xs), max(ys)
+    if not (-180 <= bbox[0] and bbox[2] <= 180 and -90 <= bbox[1] and bbox[3] <= 90):
+        return None  # projected coordinates; not worth a pyproj import here
+    return bbox
+
+
+def _positions(obj: Any) -> Iterable[tuple[float, float]]:
+    if isinstance(obj, dict):
+        if obj.get("type") == "FeatureCollection":
+            for feature in obj.get("features", []):
+                yield from _positions(feature)
+        elif obj.get("type") == "Feature":
+            yield from _positions(obj.get("geometry") or {})
+        elif obj.get("type") == "GeometryCollection":
+            for geometry in obj.get("geometries", []):
+                yield from _positions(geometry)
+        else:
+            yield from _positions(obj.get("coordinates", []))
+    elif isinstance(obj, list) and obj:
+        if isinstance(obj[0], (int, float)):
+            yield obj[0], obj[1]
+        else:
+            for item in obj:
+                yield from _positions(item)
+
+
+def worker_rss_mb(pids: Iterable[int], field: str = "VmRSS") -> int | None:
+    """Largest ``/proc/<pid>/status`` ``field`` (kB) among ``pids``, in MB."""
+    largest = None
+    for pid in pids:
+        try:
+            status = Path(f"/proc/{pid}/status").read_text()
+        except OSError:
+            continue
+        for line in status.splitlines():
+            if line.startswith(f"{field}:"):
+                mb = int(line.split()[1]) // 1024
+                largest = mb if largest is None else max(largest, mb)
+    return largest
 
 
 def _resolve(attrs: dict) -> tuple[str, int]:
@@ -42,22 +349,88 @@ def _resolve(attrs: dict) -> tuple[str, int]:
     mem_mb = _cgroup_mem_limit_mb()
     if mem_mb is None:
         return "cgroup unset — fallback", 1
-    return "auto-sized from cgroup", max(1, mem_mb // PER_WORKER_MB)
+    return AUTO_SOURCE, max(1, min(_cgroup_cpus(), mem_mb // PER_WORKER_MB))
 
 
 def _cgroup_mem_limit_mb() -> int | None:
-    """Read cgroup v2 ``memory.max`` in MiB, or None if unlimited/absent."""
+    """Memory the container may use in MiB, or None if unlimited/absent.
+
+    The lowest of cgroup v2 ``memory.max`` and ``memory.high`` (above which
+    the kernel throttles and reclaims) and cgroup v1 ``memory.limit_in_bytes``.
+    """
+    limits = [
+        _read_limit_bytes(path)
+        for path in (CGROUP_MEM_MAX, CGROUP_MEM_HIGH, CGROUP_V1_MEM_LIMIT)
+    ]
+    limits = [b for b in limits if b is not None]
+    if not limits:
+        return None
+    return min(limits) // (1024 * 1024)
+
+
+def _cgroup_swap_mb() -> int | None:
+    """Swap the container may use in MiB (0 = none), or None if unlimited."""
+    if _read_text(CGROUP_SWAP_MAX) == "0":
+        return 0
+    swap = _read_limit_bytes(CGROUP_SWAP_MAX)
+    if swap is not None:
+        return swap // (1024 * 1024)
+    # v1 limits memory + swap together.
+    memsw = _read_limit_bytes(CGROUP_V1_MEMSW_LIMIT)
+    memory = _read_limit_bytes(CGROUP_V1_MEM_LIMIT)
+    if memsw is None or memory is None:
+        return None
+    return max(0, memsw - memory) // (1024 * 1024)
+
+
+def _cgroup_cpus() -> int:
+    """Whole CPUs this process may run on: affinity mask, then CPU quota."""
+    cpus = (
+        len(os.sched_getaffinity(0))
+        if hasattr(os, "sched_getaffinity")
+        else os.cpu_count() or 1
+    )
+    quota = _cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.floor(quota)))
+    return cpus
+
+
+def _cpu_quota() -> float | None:
+    """CFS quota in CPUs from cgroup v2 ``cpu.max`` or v1, None if unlimited."""
+    raw = _read_text(CGROUP_CPU_MAX)
+    if raw is not None:
+        quota, _, period = raw.partition(" ")
+    else:
+        quota = _read_text(CGROUP_V1_CPU_QUOTA) or ""
+        period = _read_text(CGROUP_V1_CPU_PERIOD) or ""
     try:
-        raw = Path(CGROUP_MEM_MAX).read_text(encoding="utf-8").strip()
+        quota_us, period_us = int(quota), int(period or "100000")
+    except ValueError:
+        return None  # "max", or v1's -1 fails the check below
+    if quota_us <= 0 or period_us <= 0:
+        return None
+    return quota_us / period_us
+
+
+def _read_text(path: str) -> str | None:
+    try:
+        return Path(path).read_text(encoding="utf-8").strip()
     except (FileNotFoundError, OSError):
         return None
-    if raw == "max":
+
+
+def _read_limit_bytes(path: str) -> int | None:
+    """A cgroup byte limit, or None if unlimited, absent or malformed."""
+    raw = _read_text(path)
+    if raw is None or raw == "max":
         return None
     try:
         bytes_ = int(raw)
     except ValueError:
         return None
-    # Kernel sentinels for "no limit" are huge.
+    # Kernel sentinels for "no limit" are huge (v1 reports ~2**63 rounded
+    # down to the page size).
     if bytes_ <= 0 or bytes_ >= (1 << 62):
         return None
-    return bytes_ // (1024 * 1024)
+    return bytes_
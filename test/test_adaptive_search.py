@@ -0,0 +1,116 @@
+"""Unit tests for adaptive_search — coarse-to-fine search, hourly results.
+
+The engine is replaced by a one-cell precipitation series, scored the way
+storm-stats rows are (window sum, 2 decimals). Whatever the adaptive search
+leaves out, ranking what it scored must give the hourly scan's top-N.
+"""
+
+from __future__ import annotations
+
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from actions import adaptive_search, cumsum_search, stats_index  # noqa: E402
+from actions.scan_progress import STATS_HEADER  # noqa: E402
+from actions.storm_stream import StormStat, TopNSelector, format_stats_row  # noqa: E402
+
+START = datetime(2001, 1, 1)
+HOUR = timedelta(hours=1)
+
+
+def _series(seed: int, hours: int) -> list[float]:
+    """Mostly dry hours with a few bursts."""
+    rng = random.Random(seed)
+    rain = [0.0] * hours
+    for _ in range(hours // 60):
+        t = rng.randrange(hours)
+        for k in range(rng.randrange(2, 30)):
+            if t + k < hours:
+                rain[t + k] += rng.expovariate(2.0)
+    return rain
+
+
+def _window(rain: list[float], start: datetime, duration: int) -> StormStat:
+    h = int((start - START) / HOUR)
+    total = round(sum(rain[h + 1 : h + 1 + duration]), 2)
+    return StormStat(start, 0.0, total, total, 0.0, 0.0)
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    calls = []
+
+    def search(catalog, dates, stats_csvs, pool, workers, cube_root=None):
+        for duration, starts in dates.items():
+            calls.append(len(starts))
+            path = stats_csvs[duration]
+            if not path.exists():
+                path.write_text(STATS_HEADER + "\n")
+            with open(path, "a") as f:
+                f.writelines(
+                    format_stats_row(_window(catalog, start, duration))
+                    for start in starts
+                )
+
+    monkeypatch.setattr(cumsum_search, "search", search)
+    return calls
+
+
+def _top(rows, duration, top_n, threshold):
+    selector = TopNSelector(duration, top_n, threshold)
+    for row in rows:
+        selector.add(row)
+    return selector.ranked()
+
+
+@pytest.mark.parametrize("seed", range(4))
+@pytest.mark.parametrize("threshold", [0.0, 1.5])
+def test_matches_an_hourly_scan(tmp_path, engine, seed, threshold):
+    duration, top_n = 24, 5
+    plan = [START + h * HOUR for h in range(24 * 120)]
+    rain = _series(seed, len(plan) + 24 * 3)
+    csv = tmp_path / "storm-stats.csv"
+
+    scored = adaptive_search.search(
+        rain, plan, {duration: csv}, tmp_path, 24, top_n, threshold, None, 1
+    )
+
+    rows = stats_index.csv_rows(csv)
+    assert scored[duration] == sorted(rows)
+    assert len(rows) < len(plan) / 2
+    hourly = [_window(rain, start, duration) for start in plan]
+    assert _top(rows.values(), duration, top_n, threshold) == _top(
+        hourly, duration, top_n, threshold
+    )
+
+
+def test_bounds_are_reused_on_resume(tmp_path, engine):
+    plan = [START + h * HOUR for h in range(24 * 30)]
+    rain = _series(9, len(plan) + 24 * 3)
+    args = (rain, plan, {24: tmp_path / "storm-stats.csv"}, tmp_path, 24, 3, 0.0)
+    adaptive_search.search(*args, None, 1)
+    engine.clear()
+    adaptive_search.search(*args, None, 1)
+    assert engine == []
+    assert (tmp_path / "bounds-47hr.csv").exists()
+
+
+def test_strides_end_on_the_last_start_time():
+    plan = list(range(10))
+    assert adaptive_search.strides(plan, 4) == [[0, 1], [2, 3, 4, 5], [6, 7, 8, 9]]
+
+
+def test_cutoff_needs_top_n_windows_far_apart():
+    rows = [
+        StormStat(START + timedelta(days=d), 0, mean, 0, 0, 0)
+        for d, mean in [(0, 5.0), (1, 4.0), (10, 3.0), (20, 2.0), (40, 0.1)]
+    ]
+    # Day 1 is within 2h (h = 48 h) of day 0; days 0, 10 and 20 are not.
+    assert adaptive_search.cutoff(rows, 24, 3, 0.0) == 2.0
+    assert adaptive_search.cutoff(rows, 24, 4, 0.5) == 0.5
@@ -0,0 +1,142 @@
+"""Unit tests for aorc_cache — the shared on-disk AORC chunk cache."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import aorc_cache  # noqa: E402
+from aorc_cache import ChunkCache, aorc_prefixes  # noqa: E402
+
+CHUNK = "noaa-nws-aorc-v1-1-1km/2022.zarr/APCP_surface/100.0.0"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ChunkCache(tmp_path / "chunks", 1000, aorc_prefixes(None))
+
+
+def test_miss_then_hit(cache):
+    assert cache.get(CHUNK) is None
+    cache.put(CHUNK, None, None, b"x" * 10)
+    assert cache.get(CHUNK) == b"x" * 10
+    cache.put(CHUNK, 2, 4, b"yy")
+    assert cache.get(CHUNK, 2, 4) == b"yy"  # byte ranges have their own entries
+    assert cache.get(f"{CHUNK}.1") is None
+    assert cache.stats() == {
+        "aorc_cache_hits": 2,
+        "aorc_cache_misses": 2,
+        "aorc_cache_bytes_served": 12,
+    }
+
+
+def test_covers_aorc_chunks_only():
+    cache_prefixes = aorc_prefixes("s3://mirror/aorc/")
+    assert cache_prefixes == ("noaa-nws-aorc-v1-1-1km/", "mirror/aorc/")
+    cache = ChunkCache.__new__(ChunkCache)
+    cache.prefixes = cache_prefixes
+    assert cache.covers("s3://" + CHUNK)
+    assert cache.covers("mirror/aorc/2022.zarr/TMP_2maboveground/1.2.3")
+    assert not cache.covers("noaa-nws-aorc-v1-1-1km/2022.zarr/.zmetadata")
+    assert not cache.covers("mirror/aorc/2022.zarr/APCP_surface/.zarray")
+    assert not cache.covers("other-bucket/2022.zarr/APCP_surface/0.0.0")
+
+
+def test_evicts_least_recently_used(cache):
+    for i in range(3):
+        cache.put(f"{CHUNK}.{i}", None, None, b"x" * 300)
+        # Distinct mtimes without sleeping.
+        os.utime(cache._file(f"{CHUNK}.{i}", None, None), (i, i))
+    cache.get(f"{CHUNK}.0")  # 0 is now the most recently used
+    cache.put(f"{CHUNK}.3", None, None, b"x" * 300)  # 1200 > 1000: evict
+
+    assert cache.get(f"{CHUNK}.1") is None
+    assert cache.get(f"{CHUNK}.0") is not None
+    assert cache.get(f"{CHUNK}.3") is not None
+    assert cache.counters[aorc_cache._USED] <= 900
+
+
+def test_usage_survives_restart(cache):
+    cache.put(CHUNK, None, None, b"x" * 100)
+    again = ChunkCache(cache.root, 1000, cache.prefixes)
+    assert again.counters[aorc_cache._USED] == 100
+    assert again.get(CHUNK) == b"x" * 100
+
+
+def test_whole_object_reads_share_one_entry(cache):
+    cache.put(CHUNK, 0, None, b"0123456789")
+    assert cache.contains(CHUNK)
+    assert cache.get(CHUNK) == b"0123456789"
+    assert cache.get(CHUNK, 2, 5) == b"234"  # a range of the cached object
+
+
+ZMETADATA = {
+    "metadata": {
+        "APCP_surface/.zarray": {
+            "shape": [8784, 4201, 8401],
+            "chunks": [144, 128, 256],
+        },
+        "APCP_surface/.zattrs": {
+            "_ARRAY_DIMENSIONS": ["time", "latitude", "longitude"]
+        },
+        "time/.zarray": {"shape": [8784], "chunks": [8784]},
+        "TMP_2maboveground/.zarray": {
+            "shape": [8784, 4201, 8401],
+            "chunks": [144, 128, 256],
+            "dimension_separator": "/",
+        },
+    }
+}
+
+
+def test_only_chunks_before_the_last_time_chunk_are_settled():
+    limits = aorc_cache.time_chunk_limits(ZMETADATA["metadata"])
+    assert limits["APCP_surface"] == (0, ".", 60)  # 8784 h in 61 chunks
+    assert aorc_cache.settled("APCP_surface/59.3.4", limits)
+    assert not aorc_cache.settled("APCP_surface/60.3.4", limits)
+    assert aorc_cache.settled("TMP_2maboveground/59/3/4", limits)
+    assert not aorc_cache.settled("TMP_2maboveground/60/3/4", limits)
+    assert not aorc_cache.settled("time/0", limits)  # one chunk: the last
+    assert not aorc_cache.settled("APCP_surface/1.0.0", None)
+    assert aorc_cache.split_chunk("s3://" + CHUNK) == (
+        "noaa-nws-aorc-v1-1-1km/2022.zarr",
+        "APCP_surface/100.0.0",
+    )
+
+
+def test_install_serves_hits_from_disk(cache, monkeypatch):
+    s3fs = pytest.importorskip("s3fs")
+    fetched = []
+    settled = "noaa-nws-aorc-v1-1-1km/2022.zarr/APCP_surface/5.0.0"
+    last = "noaa-nws-aorc-v1-1-1km/2022.zarr/APCP_surface/60.0.0"
+
+    async def fake_cat_file(self, path, start=None, end=None, **kwargs):
+        fetched.append(path)
+        if path.endswith(".zmetadata"):
+            return json.dumps(ZMETADATA).encode()
+        return b"chunk"
+
+    monkeypatch.setattr(s3fs.S3FileSystem, "_cat_file", fake_cat_file)
+    monkeypatch.setattr(aorc_cache, "_store_limits", {})
+    aorc_cache.install_chunk_cache(cache)
+    aorc_cache.install_chunk_cache(cache)  # idempotent
+
+    for path in [settled, last] * 3:
+        assert asyncio.run(s3fs.S3FileSystem._cat_file(None, path)) == b"chunk"
+    asyncio.run(s3fs.S3FileSystem._cat_file(None, "other/key"))
+    # The store's last time chunk can be rewritten, so it is never cached.
+    assert fetched == [
+        "noaa-nws-aorc-v1-1-1km/2022.zarr/.zmetadata",
+        settled,
+        last,
+        last,
+        last,
+        "other/key",
+    ]
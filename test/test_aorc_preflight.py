@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 import sys
+from datetime import datetime
 from pathlib import Path
 
 import pytest
@@ -25,6 +26,11 @@ def test_required_years_crosses_boundary_with_duration():
     assert aorc_preflight.required_years("2020-12-31", "2020-12-31", 72) == [2020, 2021]
 
 
+def test_window_years_skip_the_years_between_dates():
+    starts = [datetime(1980, 6, 1), datetime(2020, 12, 31, 12)]
+    assert aorc_preflight.window_years(starts, 24) == [1980, 2020, 2021]
+
+
 def test_assert_skips_when_no_base_url(monkeypatch):
     monkeypatch.delenv("AORC_S3_BASE_URL", raising=False)
     # No base URL -> not probeable -> must not raise.
@@ -0,0 +1,106 @@
+"""Unit tests for aorc_store — per-process cache of opened AORC stores."""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import aorc_store  # noqa: E402
+
+
+class FakeDataset:
+    def __init__(self, store: str) -> None:
+        self.store = store
+        self.copies = 0
+
+    def copy(self, deep: bool = True) -> tuple[FakeDataset, bool]:
+        self.copies += 1
+        return self, deep
+
+
+class Opener:
+    def __init__(self) -> None:
+        self.opened: list[str] = []
+
+    def __call__(self, store: str, **kwargs: object) -> FakeDataset:
+        self.opened.append(store)
+        return FakeDataset(store)
+
+
+@pytest.fixture(autouse=True)
+def empty_caches(monkeypatch):
+    monkeypatch.setenv("AORC_S3_BASE_URL", "s3://mirror/aorc/")
+    aorc_store.invalidate()
+    yield
+    aorc_store.invalidate()
+
+
+def test_store_key_only_for_aorc_stores():
+    assert aorc_store._store_key("s3://mirror/aorc/2020.zarr/") == "mirror/aorc/2020.zarr"
+    assert aorc_store._store_key(
+        f"s3://{aorc_store.AORC_PUBLIC_BUCKET}/2020.zarr"
+    ) == f"{aorc_store.AORC_PUBLIC_BUCKET}/2020.zarr"
+    assert aorc_store._store_key("s3://other/2020.zarr") is None
+    assert aorc_store._store_key(object()) is None
+
+
+def test_cached_open_reuses_dataset_and_returns_shallow_copies():
+    opener = Opener()
+    first, deep = aorc_store._cached_open(opener, "s3://mirror/aorc/2020.zarr", {})
+    second, _ = aorc_store._cached_open(opener, "s3://mirror/aorc/2020.zarr", {})
+    assert opener.opened == ["s3://mirror/aorc/2020.zarr"]
+    assert first is second and first.copies == 2 and deep is False
+
+
+def test_cached_open_passes_through_other_stores():
+    opener = Opener()
+    aorc_store._cached_open(opener, "/tmp/local.zarr", {})
+    aorc_store._cached_open(opener, "/tmp/local.zarr", {})
+    assert len(opener.opened) == 2
+    assert not aorc_store._datasets
+
+
+def test_dataset_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(aorc_store._datasets, "maxsize", 2)
+    opener = Opener()
+    for year in (2018, 2019, 2020, 2018):
+        aorc_store._cached_open(opener, f"s3://mirror/aorc/{year}.zarr", {})
+    assert len(aorc_store._datasets) == 2
+    # 2018 was evicted by 2020 and opened again.
+    assert opener.opened[-1].endswith("2018.zarr") and len(opener.opened) == 4
+
+
+def test_invalidate_one_year():
+    opener = Opener()
+    for year in (2019, 2020):
+        aorc_store._cached_open(opener, f"s3://mirror/aorc/{year}.zarr", {})
+    aorc_store._metadata.add(aorc_store.store_url(2020), {"k": 1})
+    aorc_store.invalidate(2020)
+    assert [k.split("|")[0] for k in aorc_store._datasets] == ["mirror/aorc/2019.zarr"]
+    assert not aorc_store._metadata
+
+
+def test_consolidated_metadata_caches_hits_not_misses(monkeypatch):
+    calls: list[str] = []
+
+    class FS:
+        def cat(self, path: str) -> bytes:
+            calls.append(path)
+            if "2025" in path:
+                raise FileNotFoundError(path)
+            return b'{"metadata": {".zgroup": {}}}'
+
+    monkeypatch.setattr(aorc_store, "filesystem", FS)
+    assert aorc_store.consolidated_metadata(2020) == {".zgroup": {}}
+    assert aorc_store.consolidated_metadata(2020) == {".zgroup": {}}
+    assert aorc_store.consolidated_metadata(2025) is None
+    assert aorc_store.consolidated_metadata(2025) is None
+    assert calls == [
+        "s3://mirror/aorc/2020.zarr/.zmetadata",
+        "s3://mirror/aorc/2025.zarr/.zmetadata",
+        "s3://mirror/aorc/2025.zarr/.zmetadata",
+    ]
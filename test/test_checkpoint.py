@@ -0,0 +1,82 @@
+"""Unit tests for checkpoint — resume manifest and per-storm DSS state."""
+
+from __future__ import annotations
+
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from checkpoint import (  # noqa: E402
+    CHECKPOINT_FILE,
+    LEGACY_CHECKPOINT_FILE,
+    Checkpoint,
+    file_sha256,
+)
+
+
+def test_fresh_cache_dir_has_empty_checkpoint(tmp_path):
+    checkpoint = Checkpoint.load(tmp_path)
+    assert checkpoint.actions == set()
+    assert checkpoint.storms == {}
+    assert not (tmp_path / CHECKPOINT_FILE).exists()
+
+
+def test_legacy_checkpoint_is_migrated(tmp_path):
+    (tmp_path / LEGACY_CHECKPOINT_FILE).write_text("download-inputs\nprocess-storms")
+    checkpoint = Checkpoint.load(tmp_path)
+    assert checkpoint.actions == {"download-inputs", "process-storms"}
+
+
+def test_actions_round_trip(tmp_path):
+    Checkpoint.load(tmp_path).mark_action("download-inputs")
+    assert Checkpoint.load(tmp_path).actions == {"download-inputs"}
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_unreadable_checkpoint_starts_fresh(tmp_path):
+    (tmp_path / CHECKPOINT_FILE).write_text('{"actions": ["download-')
+    assert Checkpoint.load(tmp_path).actions == set()
+
+
+def test_storm_done_records_size_and_hash(tmp_path):
+    dss = tmp_path / "19820607_72hr_st1_r003.dss"
+    dss.write_bytes(b"x" * 100)
+    Checkpoint.load(tmp_path).mark_storm_done("3", dss)
+
+    entry = json.loads((tmp_path / CHECKPOINT_FILE).read_text())["storms"]["3"]
+    assert entry["size"] == 100
+    assert entry["sha256"] == file_sha256(dss)
+    assert Checkpoint.load(tmp_path).storm_done("3", dss)
+
+
+def test_truncated_file_is_not_done(tmp_path):
+    dss = tmp_path / "19820607_72hr_st1_r003.dss"
+    dss.write_bytes(b"x" * 100)
+    checkpoint = Checkpoint.load(tmp_path)
+    checkpoint.mark_storm_done("3", dss)
+    dss.write_bytes(b"x" * 10)
+    assert not checkpoint.storm_done("3", dss)
+    dss.unlink()
+    assert not checkpoint.storm_done("3", dss)
+
+
+def test_rank_reassigned_to_another_storm_is_not_done(tmp_path):
+    old = tmp_path / "19820607_72hr_st1_r003.dss"
+    new = tmp_path / "19900101_72hr_st1_r003.dss"
+    old.write_bytes(b"x")
+    new.write_bytes(b"x")
+    checkpoint = Checkpoint.load(tmp_path)
+    checkpoint.mark_storm_done("3", old)
+    assert not checkpoint.storm_done("3", new)
+
+
+def test_file_without_checkpoint_entry_is_not_done(tmp_path):
+    # A DSS file left behind by a killed writer must be redone, not trusted.
+    dss = tmp_path / "19820607_72hr_st1_r003.dss"
+    dss.write_bytes(b"x")
+    checkpoint = Checkpoint.load(tmp_path)
+    assert not checkpoint.storm_done("3", dss)
+    checkpoint.mark_storm_failed("3", dss.name, "boom")
+    assert not Checkpoint.load(tmp_path).storm_done("3", dss)
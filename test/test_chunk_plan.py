@@ -0,0 +1,51 @@
+"""Unit tests for chunk_plan — tasks aligned to AORC's time chunks."""
+
+from __future__ import annotations
+
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from actions.chunk_plan import ChunkGrid, YearChunks, group_by_chunks, search_blocks  # noqa: E402
+
+HOUR = timedelta(hours=1)
+GRID = ChunkGrid(
+    {
+        2020: YearChunks(datetime(2020, 1, 1), 24),
+        2021: YearChunks(datetime(2021, 1, 1), 24),
+    }
+)
+
+
+def test_chunk_counts_from_the_store_origin():
+    assert GRID.chunk(datetime(2020, 1, 1)) == (2020, 0)
+    assert GRID.chunk(datetime(2020, 1, 1, 23)) == (2020, 0)
+    assert GRID.chunk(datetime(2020, 1, 2)) == (2020, 1)
+    assert GRID.chunk(datetime(2021, 1, 1)) == (2021, 0)
+    assert GRID.run(datetime(2020, 1, 5), 72) == (2020, 1)
+
+
+def test_search_blocks_break_on_chunk_runs():
+    dates = [datetime(2020, 1, 1) + h * HOUR for h in range(24 * 7)]
+    blocks = search_blocks(dates, GRID, 48)
+    # A window's first hour is its start + 1 h: block 0 ends on 2020-01-02T22.
+    assert [len(b) for b in blocks] == [47, 48, 48, 25]
+    assert blocks[1][0] == datetime(2020, 1, 2, 23)
+    assert sorted(d for b in blocks for d in b) == dates
+
+
+def test_groups_share_chunks_in_time_order():
+    starts = [
+        datetime(2020, 3, 1, 1),
+        datetime(2020, 1, 1, 6),
+        datetime(2020, 1, 1, 18),
+        datetime(2020, 1, 2, 12),
+        datetime(2020, 12, 31, 12),
+        datetime(2021, 1, 1, 2),
+    ]
+    spans = [(s + HOUR, s + 24 * HOUR) for s in starts]
+    # The year-end storm reads the first 2021 chunk, as the next one does.
+    assert group_by_chunks(spans, GRID, 8) == [[1, 2, 3], [0], [4, 5]]
+    assert group_by_chunks(spans, GRID, 2) == [[1, 2], [3], [0], [4, 5]]
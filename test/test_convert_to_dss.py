@@ -0,0 +1,45 @@
+"""Unit tests for convert_to_dss — batching storms and building DSS files."""
+
+from __future__ import annotations
+
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from actions import convert_to_dss  # noqa: E402
+
+START = datetime(2005, 8, 20)
+
+
+def _call(hours_after: int, duration: int = 24) -> tuple[str, str, str, str, int]:
+    start = START + timedelta(hours=hours_after)
+    return (f"{hours_after}.dss", "t.gpkg", "cat", start.isoformat(), duration)
+
+
+def test_batches_bound_the_union_time_range():
+    calls = [_call(0), _call(6), _call(20), _call(30), _call(200)]
+    # 2 x 24 h: the first three end by 44 h, the storm at 30 h at 54 h.
+    assert convert_to_dss._batches(calls) == [calls[:3], calls[3:4], calls[4:]]
+
+
+def test_batches_span_the_longest_storm():
+    # 0..88 h: over 2 x 24 h, within 2 x 48 h.
+    calls = [_call(0, 24), _call(40, 48)]
+    assert convert_to_dss._batches(calls) == [calls]
+
+
+def test_build_dss_moves_only_complete_files(tmp_path):
+    target = tmp_path / "storm.dss"
+
+    def fail(path):
+        Path(path).write_text("half")
+        raise RuntimeError("no data")
+
+    assert convert_to_dss._build_dss(str(target), fail) == "no data"
+    assert not target.exists()
+    assert list((tmp_path / convert_to_dss.PARTIAL_DIRNAME).iterdir()) == []
+
+    assert convert_to_dss._build_dss(str(target), Path.touch) is None
+    assert target.exists()
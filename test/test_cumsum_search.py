@@ -0,0 +1,293 @@
+"""Unit tests for cumsum_search — the cumulative-sum storm search engine.
+
+The oracle is stormhub itself, one window at a time as ``storm_search`` does
+it: the float32 window sum (``sum(skipna=True, min_count=1)``), then
+``Transpose.max_transpose`` with ``AORCItem``'s statistics. The engine ranks
+near-ties on the same float32 means, takes its statistics from the same
+float32 sums and its centroid from the same polygon, so rows are compared
+exactly.
+"""
+
+from __future__ import annotations
+
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from actions import cumsum_search  # noqa: E402
+from actions.storm_stream import (  # noqa: E402
+    RANK_BUFFER_HOURS,
+    StormStat,
+    greedy_top_n,
+    parse_stats_row,
+)
+
+DURATION = 24
+START = datetime(2020, 12, 20)
+
+
+def _synthetic(seed: int, hours: int = 24 * 16):
+    """A float32 (time, lat, lon) cube, as AORC stores it, with a NaN corner
+    outside the domain, a few NaN hours, and a watershed blob."""
+    rng = np.random.default_rng(seed)
+    ny, nx = 30, 40
+    cube = rng.gamma(0.3, 2.0, size=(hours, ny, nx)).astype(np.float32)
+    cube[:, :6, :9] = np.nan  # outside the transposition domain
+    cube[rng.random(cube.shape) < 0.01] = np.nan  # missing cell-hours
+    cube[50:53, 20:25, 20:25] = np.nan  # a gap under some shifts
+    times = np.array(
+        [START + timedelta(hours=h + 1) for h in range(hours)], dtype="datetime64[ns]"
+    )
+    x = -100.0 + 0.01 * np.arange(nx)
+    y = 40.0 - 0.01 * np.arange(ny)  # north-up: latitude descends
+    yy, xx = np.mgrid[:ny, :nx]
+    mask = (yy - 15) ** 2 / 16 + (xx - 18) ** 2 / 36 <= 1
+    return cube, times, x, y, mask
+
+
+class _Stormhub:
+    """stormhub's per-window search over a synthetic cube."""
+
+    def __init__(self, cube, times, x, y):
+        xr = pytest.importorskip("xarray")
+        pytest.importorskip("rioxarray")
+        transpose = pytest.importorskip("stormhub.met.transpose")
+        from shapely.affinity import scale
+        from shapely.geometry import Point
+
+        self.cube = xr.DataArray(
+            cube,
+            coords={"time": times, "latitude": y, "longitude": x},
+            dims=("time", "latitude", "longitude"),
+        ).rio.write_crs("EPSG:4326")
+        self.watershed = scale(Point(x[18], y[15]).buffer(1.0), 0.055, 0.035)
+        self._transpose = transpose.Transpose
+        self.mask = self._transpose(
+            self.cube.isel(time=0), self.watershed, "longitude", "latitude"
+        ).watershed_mask
+        self.centroid = cumsum_search.transposed_centroids(
+            self.mask, self.cube.rio.transform()
+        )
+
+    def search(self, starts, duration):
+        from stormhub.met.aorc.aorc import AORCItem
+
+        out = []
+        for start in starts:
+            window = self.cube.sel(
+                time=slice(
+                    np.datetime64(start + timedelta(hours=1)),
+                    np.datetime64(start + timedelta(hours=duration)),
+                )
+            )
+            total = window.sum(dim="time", skipna=True, min_count=1)
+            transpose = self._transpose(total, self.watershed, "longitude", "latitude")
+            if not transpose.valid_shifts:
+                continue  # storm_search fails the window
+            poly, _, stats = transpose.max_transpose(AORCItem._create_stats)
+            centroid = poly.centroid
+            out.append(
+                StormStat(
+                    start,
+                    stats["min"],
+                    stats["mean"],
+                    stats["max"],
+                    centroid.x,
+                    centroid.y,
+                )
+            )
+        return out
+
+
+def _shift(dx, dy):
+    """A stand-in centroid for tests that don't compare with stormhub."""
+    return float(dx), float(dy)
+
+
+def _score(cube, times, mask, starts, centroid=_shift, duration=DURATION):
+    windows = {duration: starts}
+    return cumsum_search.score_windows(cube, times, mask, centroid, windows)[duration]
+
+
+def _starts(every_n_hours: int, days: int = 14) -> list[datetime]:
+    return [START + timedelta(hours=h) for h in range(0, days * 24, every_n_hours)]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_matches_per_window_search(seed):
+    cube, times, x, y, _ = _synthetic(seed)
+    stormhub = _Stormhub(cube, times, x, y)
+    starts = _starts(6)
+    got = _score(cube, times, stormhub.mask, starts, stormhub.centroid)
+    assert got == stormhub.search(starts, DURATION)
+
+
+@pytest.mark.parametrize("seed", [3, 4])
+def test_same_top_n_as_per_window_search(seed):
+    cube, times, x, y, _ = _synthetic(seed)
+    stormhub = _Stormhub(cube, times, x, y)
+    starts = _starts(12)
+    h = timedelta(hours=DURATION + RANK_BUFFER_HOURS)
+
+    def top(rows):
+        ranked = sorted(
+            ((r.mean, r.storm_date) for r in rows), key=lambda md: (-md[0], md[1])
+        )
+        return [d for _, d in greedy_top_n(ranked, h, 3)]
+
+    got = _score(cube, times, stormhub.mask, starts, stormhub.centroid)
+    assert top(got) == top(stormhub.search(starts, DURATION))
+
+
+def test_blocks_do_not_change_results():
+    cube, times, _, _, mask = _synthetic(5)
+    starts = _starts(6)
+    whole = _score(cube, times, mask, starts)
+    blocked = []
+    for block in cumsum_search.plan_blocks(starts, block_hours=48):
+        lo = np.searchsorted(times, np.datetime64(block[0]), side="right")
+        hi = np.searchsorted(
+            times, np.datetime64(block[-1] + timedelta(hours=DURATION)), side="right"
+        )
+        blocked += _score(cube[lo:hi], times[lo:hi], mask, block)
+    assert blocked == whole
+
+
+def test_durations_share_one_cumulative_sum():
+    cube, times, x, y, _ = _synthetic(8)
+    stormhub = _Stormhub(cube, times, x, y)
+    windows = {24: _starts(6), 48: _starts(12, days=12), 96: _starts(24, days=10)}
+    got = cumsum_search.score_windows(
+        cube, times, stormhub.mask, stormhub.centroid, windows
+    )
+    assert list(got) == [24, 48, 96]
+    for duration, starts in windows.items():
+        assert got[duration] == stormhub.search(starts, duration)
+
+
+def test_window_without_finite_hours_is_nan():
+    cube = np.full((4, 1, 2), np.nan)
+    cube[:, 0, 1] = 1.0
+    times = np.array(
+        [START + timedelta(hours=h + 1) for h in range(4)], dtype="datetime64[ns]"
+    )
+    totals = cumsum_search.window_totals(
+        cumsum_search.cumulate(cube, times), [START], 3
+    )
+    assert np.isnan(totals[0, 0, 0]) and totals[0, 0, 1] == 3.0
+
+
+def test_plan_blocks_bounds_the_span():
+    dates = _starts(24, days=10) + [START + timedelta(days=100)]
+    blocks = cumsum_search.plan_blocks(dates, block_hours=72)
+    assert [len(b) for b in blocks] == [3, 3, 3, 1, 1]
+    assert all(b[-1] - b[0] < timedelta(hours=72) for b in blocks)
+
+
+def test_rows_round_trip_through_stats_csv():
+    cube, times, _, _, mask = _synthetic(6)
+    rows = _score(cube, times, mask, _starts(24))
+    for row in rows:
+        line = cumsum_search.format_stats_row(row)
+        assert line.endswith("\n")
+        assert parse_stats_row(line.rstrip("\n")) == row
+
+
+def test_shift_means_match_direct_slicing():
+    rng = np.random.default_rng(7)
+    totals = rng.gamma(1.0, 3.0, size=(5, 24, 28))
+    totals[2, 10:12, 3:6] = np.nan
+    mask = np.zeros((24, 28), dtype=bool)
+    mask[8:15, 9:17] = True
+    mask[10:12, 11:14] = False  # a hole: two runs on some rows
+    fp = cumsum_search.footprint(mask)
+    height, width = fp.mask.shape
+
+    means = cumsum_search.shift_means(totals, fp)
+    for k, (dx, dy) in enumerate(fp.shifts):
+        r, c = fp.row_off + dy, fp.col_off + dx
+        direct = totals[:, r : r + height, c : c + width][:, fp.mask].mean(axis=1)
+        np.testing.assert_allclose(means[:, k], direct, rtol=1e-12)
+
+
+def _max_transpose_shift(hours, fp):
+    """The shift ``max_transpose`` picks: the first with the strictly highest
+    float32 ``nanmean``, trying every valid shift."""
+    best, best_mean = -1, None
+    for k, shift in enumerate(fp.shifts):
+        total = cumsum_search.shifted_total(hours, fp, shift)
+        if np.isnan(total.filled(np.nan)[fp.mask]).any():
+            continue
+        mean = np.nanmean(total)
+        if best_mean is None or mean > best_mean:
+            best, best_mean = k, mean
+    return best
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2, 3])
+def test_near_ties_rank_on_float32_means(seed):
+    # Tile one 4x4 patch with its cells reordered, so that many shifts hold
+    # the same values summed in a different order: their float64 means are
+    # (nearly) equal and only float32 rounding tells them apart.
+    rng = np.random.default_rng(seed)
+    patch = rng.gamma(0.5, 7.0, size=(6, 4, 4)).astype(np.float32)
+    hours = np.empty((6, 24, 24), dtype=np.float32)
+    for i in range(0, 24, 4):
+        for j in range(0, 24, 4):
+            order = rng.permutation(16)
+            hours[:, i : i + 4, j : j + 4] = patch.reshape(6, 16)[:, order].reshape(
+                6, 4, 4
+            )
+    mask = np.zeros((24, 24), dtype=bool)
+    mask[8:12, 8:12] = True
+    fp = cumsum_search.footprint(mask)
+
+    times = np.array(
+        [START + timedelta(hours=h + 1) for h in range(6)], dtype="datetime64[ns]"
+    )
+    totals = cumsum_search.window_totals(
+        cumsum_search.cumulate(hours, times), [START], 6
+    )
+    means = cumsum_search.shift_means(totals, fp)[0]
+    best = cumsum_search.best_shift(hours, means, fp)
+    assert best == _max_transpose_shift(hours, fp)
+
+
+def test_dry_window_takes_the_first_valid_shift():
+    hours = np.zeros((1, 20, 20))
+    hours[0, :, :2] = np.nan  # the first shifts are invalid
+    mask = np.zeros((20, 20), dtype=bool)
+    mask[8:11, 8:11] = True
+    fp = cumsum_search.footprint(mask)
+
+    means = cumsum_search.shift_means(hours, fp)[0]
+    best = cumsum_search.best_shift(hours, means, fp)
+    first_valid = next(
+        k for k, (dx, dy) in enumerate(fp.shifts) if fp.col_off + dx >= 2
+    )
+    assert best == first_valid
+
+
+def test_no_valid_shift_is_minus_one():
+    hours = np.full((1, 10, 10), np.nan)
+    mask = np.zeros((10, 10), dtype=bool)
+    mask[4:6, 4:6] = True
+    fp = cumsum_search.footprint(mask)
+    means = cumsum_search.shift_means(hours, fp)[0]
+    assert cumsum_search.best_shift(hours, means, fp) == -1
+
+
+def test_windows_without_a_valid_shift_are_counted_once(caplog):
+    cube, times, _, _, mask = _synthetic(9)
+    cube[:] = np.nan
+    windows = {24: _starts(6), 48: _starts(12, days=12)}
+    with caplog.at_level("WARNING", logger=cumsum_search.__name__):
+        got = cumsum_search.score_windows(cube, times, mask, _shift, windows)
+    assert got == {24: [], 48: []}
+    (record,) = caplog.records
+    assert record.getMessage().startswith(f"{len(_starts(6)) + len(_starts(12, 12))} ")
@@ -0,0 +1,147 @@
+"""Unit tests for memory_watchdog — throttling the pool on cgroup pressure."""
+
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import worker_sizing  # noqa: E402
+from memory_watchdog import MemoryWatchdog  # noqa: E402
+
+GB = 1024**3
+
+
+class FakePool:
+    def __init__(self, max_workers: int, in_flight: int) -> None:
+        self.max_workers = max_workers
+        self.limit = max_workers
+        self.in_flight = in_flight
+        self.retired = 0
+        self.completed = 0
+
+    def worker_pids(self) -> list[int]:
+        return [os.getpid()]
+
+    def set_limit(self, limit: int) -> None:
+        self.limit = max(1, min(self.max_workers, limit))
+
+    def retire_idle(self) -> None:
+        self.retired += 1
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Cgroup:
+    """A fake cgroup v2 directory with a 10 GB ``memory.max``."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        (root / "memory.max").write_text(f"{10 * GB}\n")
+        self.write(1.0)
+
+    def write(
+        self, current_gb: float, inactive_file_gb: float = 0.0, oom_kill: int = 0
+    ) -> None:
+        (self.root / "memory.current").write_text(f"{int(current_gb * GB)}\n")
+        (self.root / "memory.stat").write_text(
+            f"anon 1\ninactive_file {int(inactive_file_gb * GB)}\n"
+        )
+        (self.root / "memory.events").write_text(f"oom 0\noom_kill {oom_kill}\n")
+
+
+@pytest.fixture
+def cgroup(tmp_path):
+    return Cgroup(tmp_path)
+
+
+def test_disabled_without_memory_limit(tmp_path):
+    (tmp_path / "memory.max").write_text("max\n")
+    pool = FakePool(4, 4)
+    watchdog = MemoryWatchdog(pool, cgroup_root=tmp_path)
+    assert not watchdog.enabled
+    watchdog.step()
+    assert pool.limit == 4
+
+
+def test_throttles_near_limit_with_cooldown(cgroup):
+    pool, clock = FakePool(4, 4), Clock()
+    watchdog = MemoryWatchdog(pool, cgroup_root=cgroup.root, clock=clock)
+    cgroup.write(8.8)
+    watchdog.step()
+    assert pool.limit == 3
+    clock.now += 1
+    watchdog.step()
+    assert pool.limit == 3  # cooling down: let a finishing task free memory
+    clock.now += 10
+    watchdog.step()
+    assert pool.limit == 2
+    assert pool.retired == 0
+
+
+def test_page_cache_is_not_pressure(cgroup):
+    pool = FakePool(4, 4)
+    watchdog = MemoryWatchdog(pool, cgroup_root=cgroup.root, clock=Clock())
+    cgroup.write(9.5, inactive_file_gb=3.0)
+    watchdog.step()
+    assert pool.limit == 4
+
+
+def test_retires_idle_workers_when_critical(cgroup):
+    pool = FakePool(4, 2)
+    watchdog = MemoryWatchdog(pool, cgroup_root=cgroup.root, clock=Clock())
+    cgroup.write(9.6)
+    watchdog.step()
+    assert pool.limit == 1
+    assert pool.retired == 1
+
+
+def test_oom_kill_halves_limit(cgroup):
+    pool = FakePool(8, 8)
+    watchdog = MemoryWatchdog(pool, cgroup_root=cgroup.root, clock=Clock())
+    cgroup.write(5.0, oom_kill=1)
+    watchdog.step()
+    assert pool.limit == 4
+
+
+def test_grows_back_when_a_task_fits(cgroup):
+    pool, clock = FakePool(4, 4), Clock()
+    watchdog = MemoryWatchdog(pool, cgroup_root=cgroup.root, clock=clock)
+    cgroup.write(8.8)  # 2.2 GB per running task
+    watchdog.step()
+    assert pool.limit == 3
+
+    pool.in_flight = 3
+    cgroup.write(6.6)  # 6.6 + 2.2 = 8.8 GB: one more would cross 8.5 GB
+    clock.now += 60
+    watchdog.step()
+    assert pool.limit == 3
+
+    pool.in_flight = 2
+    cgroup.write(4.4)
+    watchdog.step()
+    assert pool.limit == 4
+
+
+def test_calibrates_model_from_worker_peak_rss(cgroup, monkeypatch):
+    monkeypatch.setattr(worker_sizing, "_cgroup_mem_limit_mb", lambda: 10240)
+    model = worker_sizing.WorkerMemoryModel({})
+    pool = FakePool(model.max_workers, 1)
+    watchdog = MemoryWatchdog(pool, cgroup_root=cgroup.root, clock=Clock(), model=model)
+    watchdog.step()
+    assert not model.calibrated  # no task has finished yet
+
+    pool.completed = worker_sizing.CALIBRATION_TASKS
+    watchdog.step()
+    assert model.calibrated
+    assert pool.limit == model.workers()
@@ -0,0 +1,73 @@
+"""Startup cost of the plugin entry point.
+
+Upload-only and re-run jobs are short, so importing ``plugin`` must not drag
+in stormhub's scientific stack — action modules load when their action runs.
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+# Cumulative ``-X importtime`` budget for ``import plugin``, in milliseconds.
+# Lazy imports put it at tens of ms; the eager version took seconds.
+IMPORT_BUDGET_MS = float(os.environ.get("PLUGIN_IMPORT_BUDGET_MS", "500"))
+
+HEAVY_MODULES = (
+    "actions.prefetch_aorc",
+    "actions.cumsum_search",
+    "actions.process_storms",
+    "actions.merge_storms",
+    "actions.convert_to_dss",
+    "actions.create_grid_file",
+    "cc",
+    "stormhub.met",
+    "xarray",
+    "zarr",
+    "s3fs",
+    "rasterio",
+    "pyproj",
+)
+
+
+def _python(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=SRC,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def test_import_does_not_load_action_dependencies():
+    out = _python("-c", "import sys, plugin; print('\\n'.join(sys.modules))").stdout
+    loaded = set(out.split())
+    assert not [m for m in HEAVY_MODULES if m in loaded]
+
+
+def test_import_time_within_budget():
+    stderr = _python("-X", "importtime", "-c", "import plugin").stderr
+    # "import time: self [us] | cumulative | imported package"
+    cumulative_us = next(
+        int(line.split("|")[1])
+        for line in stderr.splitlines()
+        if line.split("|")[-1].strip() == "plugin"
+    )
+    assert cumulative_us / 1000 <= IMPORT_BUDGET_MS
+
+
+def test_dispatch_names_resolve():
+    out = _python(
+        "-c",
+        "import plugin; print('\\n'.join("
+        "spec for spec in plugin.ACTION_DISPATCH.values()))",
+    ).stdout
+    for spec in out.split():
+        module, _, func = spec.partition(":")
+        path = SRC / (module.replace(".", "/") + ".py")
+        assert f"def {func}(" in path.read_text(encoding="utf-8")
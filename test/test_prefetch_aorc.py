@@ -0,0 +1,26 @@
+"""Unit tests for prefetch_aorc — which AORC chunks the run can read."""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from actions.prefetch_aorc import chunk_keys, index_range  # noqa: E402
+
+
+def test_index_range_ascending_and_descending():
+    assert index_range([1, 2, 3, 4, 5], 2, 4) == (1, 3)
+    assert index_range([50, 49, 48, 47], 47.5, 49) == (1, 2)
+    assert index_range([1, 2, 3], 5, 6) is None
+
+
+def test_chunk_keys_cover_overlapping_chunks():
+    ranges = [(140, 150), (0, 10), (300, 300)]
+    keys = list(chunk_keys("APCP_surface", (144, 128, 256), ranges))
+    assert keys == ["APCP_surface/0.0.1", "APCP_surface/1.0.1"]
+
+
+def test_chunk_keys_separator():
+    assert list(chunk_keys("TMP", (10, 10), [(0, 0), (25, 25)], "/")) == ["TMP/0/2"]
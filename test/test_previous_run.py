@@ -0,0 +1,111 @@
+"""Unit tests for reusing a previous run's DSS files under new ranks."""
+
+from __future__ import annotations
+
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from actions import convert_to_dss, previous_run  # noqa: E402
+from checkpoint import Checkpoint  # noqa: E402
+
+STARTS = [datetime(2023, 7, 1, 6), datetime(2024, 9, 2), datetime(2023, 1, 5, 12)]
+HEADER = {"catalog_id": "trinity", "resolution_km": 4, "geometry": "a" * 64}
+
+
+def _payload(**attrs):
+    return SimpleNamespace(attributes={"output_path": "runs/2024", **attrs})
+
+
+def test_base_path_prefers_extend_from():
+    assert previous_run.base_path(_payload()) == "runs/2024"
+    assert previous_run.base_path(_payload(extend_from="runs/2023/")) == "runs/2023"
+
+
+def _fetch_from(remote, fetched):
+    def fetch(pm, payload, rel_path, local_path):
+        fetched.append(rel_path)
+        if rel_path not in remote:
+            return False
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        local_path.write_text(remote[rel_path])
+        return True
+
+    return fetch
+
+
+def _remote(header):
+    storms = {
+        convert_to_dss.manifest_key(STARTS[0], 72): "old_r001.dss",
+        convert_to_dss.manifest_key(STARTS[2], 24): "other_duration.dss",
+    }
+    return {
+        "dss-manifest.json": json.dumps({**header, "storms": storms}),
+        "data/old_r001.dss": "dss bytes",
+    }
+
+
+def test_renumbered_storms_reuse_their_old_files(tmp_path, monkeypatch):
+    """2023-07-01 was r001 and is r002 now that a bigger 2024 storm ranks
+    first; its file is fetched under the new name, the new storm converted."""
+    fetched = []
+    monkeypatch.setattr(previous_run, "fetch", _fetch_from(_remote(HEADER), fetched))
+    data = tmp_path / "data"
+    data.mkdir()
+    work = [
+        ("2", "2", str(data / "r002.dss"), STARTS[0].isoformat(), 72),
+        ("1", "1", str(data / "r001.dss"), STARTS[1].isoformat(), 72),
+        ("3", "3", str(data / "r003.dss"), STARTS[2].isoformat(), 72),
+    ]
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json")
+    ctx = {"pm": object(), "payload": _payload(), "checkpoint": checkpoint}
+
+    left = convert_to_dss._reuse_previous_dss(ctx, work, tmp_path, HEADER)
+
+    assert left == work[1:]
+    assert (data / "r002.dss").read_text() == "dss bytes"
+    assert checkpoint.storm_done("2", data / "r002.dss")
+    assert "data/other_duration.dss" not in fetched
+
+
+def test_files_of_another_domain_or_resolution_are_not_reused(tmp_path, monkeypatch):
+    data = tmp_path / "data"
+    work = [("2", "2", str(data / "r002.dss"), STARTS[0].isoformat(), 72)]
+    ctx = {
+        "pm": object(),
+        "payload": _payload(),
+        "checkpoint": Checkpoint(tmp_path / "checkpoint.json"),
+    }
+    for previous in (
+        {**HEADER, "geometry": "b" * 64},
+        {**HEADER, "resolution_km": 2},
+        {**HEADER, "catalog_id": "brazos"},
+        {},  # a manifest from before the header was recorded
+    ):
+        fetched = []
+        monkeypatch.setattr(
+            previous_run, "fetch", _fetch_from(_remote(previous), fetched)
+        )
+        assert convert_to_dss._reuse_previous_dss(ctx, work, tmp_path, HEADER) == work
+        assert fetched == [convert_to_dss.DSS_MANIFEST]
+
+
+def test_manifest_lists_only_finished_storms(tmp_path):
+    checkpoint = Checkpoint(tmp_path / "checkpoint.json")
+    done = tmp_path / "r001.dss"
+    done.write_text("x")
+    checkpoint.mark_storm_done("1", done)
+    outputs = [
+        (convert_to_dss.manifest_key(STARTS[0], 72), "1", done),
+        (convert_to_dss.manifest_key(STARTS[1], 72), "2", tmp_path / "r002.dss"),
+    ]
+    path = tmp_path / convert_to_dss.DSS_MANIFEST
+    convert_to_dss._write_manifest(path, HEADER, outputs, checkpoint)
+    assert json.loads(path.read_text()) == {
+        **HEADER,
+        "storms": {"72hr/2023-07-01T06": "r001.dss"},
+    }
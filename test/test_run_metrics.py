@@ -0,0 +1,137 @@
+"""Unit tests for run_metrics — the per-action metrics.json report."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import run_metrics  # noqa: E402
+from run_metrics import RunMetrics, install_read_counter, new_read_counter  # noqa: E402
+
+ACTION_KEYS = {
+    "name",
+    "status",
+    "started_at",
+    "wall_seconds",
+    "cpu_user_seconds",
+    "cpu_system_seconds",
+    "children_cpu_user_seconds",
+    "children_cpu_system_seconds",
+    "parent_peak_rss_bytes",
+    "worker_peak_rss_bytes",
+    "cgroup_memory_peak_bytes",
+    "aorc_bytes_read",
+    "bytes_uploaded",
+    "storms_processed",
+    "storms_per_minute",
+    "aorc_cache_hits",
+    "aorc_cache_misses",
+    "aorc_cache_bytes_served",
+}
+
+
+def _report(path: Path) -> dict:
+    return json.loads(path.read_text())
+
+
+def test_measure_writes_stable_schema(tmp_path):
+    metrics = RunMetrics(tmp_path / "out" / "metrics.json", {"catalog_id": "c"})
+    with metrics.measure("convert-to-dss"):
+        metrics.add("storms_processed", 3)
+    with metrics.measure("upload-outputs"):
+        metrics.add("bytes_uploaded", 1024)
+
+    report = _report(metrics.path)
+    assert report["schema_version"] == run_metrics.SCHEMA_VERSION
+    assert report["run"]["catalog_id"] == "c"
+    convert, upload = report["actions"]
+    assert set(convert) == set(upload) == ACTION_KEYS
+    assert convert["status"] == "completed"
+    assert convert["storms_processed"] == 3
+    assert convert["storms_per_minute"] > 0
+    assert upload["bytes_uploaded"] == 1024
+    assert upload["storms_processed"] == 0
+
+
+def test_cache_counters_are_per_action(tmp_path):
+    stats = dict.fromkeys(run_metrics.CACHE_KEYS, 0)
+    metrics = RunMetrics(tmp_path / "metrics.json", {})
+    with metrics.measure("process-storms"):
+        pass
+    metrics.watch_cache(lambda: dict(stats))
+    stats.update(aorc_cache_hits=5, aorc_cache_misses=2, aorc_cache_bytes_served=50)
+    with metrics.measure("convert-to-dss"):
+        stats.update(aorc_cache_hits=9, aorc_cache_misses=3)
+
+    search, convert = _report(metrics.path)["actions"]
+    assert search["aorc_cache_hits"] is None
+    assert convert["aorc_cache_hits"] == 4
+    assert convert["aorc_cache_misses"] == 1
+    assert convert["aorc_cache_bytes_served"] == 0
+
+
+def test_failed_action_is_recorded(tmp_path):
+    metrics = RunMetrics(tmp_path / "metrics.json", {})
+    with pytest.raises(RuntimeError):
+        with metrics.measure("process-storms"):
+            raise RuntimeError("boom")
+    assert _report(metrics.path)["actions"][0]["status"] == "failed"
+
+
+def test_running_action_is_reported_as_running(tmp_path):
+    metrics = RunMetrics(tmp_path / "metrics.json", {})
+    with metrics.measure("upload-outputs"):
+        metrics.add("bytes_uploaded", 10)
+        (action,) = _report(metrics.write())["actions"]
+        assert action["status"] == "running"
+        assert action["bytes_uploaded"] == 10
+
+
+@pytest.mark.skipif(not Path("/proc/self/stat").exists(), reason="needs /proc")
+def test_worker_cpu_and_peak_rss(tmp_path, monkeypatch):
+    monkeypatch.setattr(run_metrics, "METRICS_SAMPLE_SECONDS", 0.05)
+    worker = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import time\nt = time.time()\nwhile time.time() - t < 0.5: pass\n"
+            "time.sleep(5)",
+        ]
+    )
+    try:
+        metrics = RunMetrics(tmp_path / "metrics.json", {})
+        metrics.watch_workers(lambda: [worker.pid])
+        with metrics.measure("process-storms"):
+            subprocess.run([sys.executable, "-c", "import time; time.sleep(0.7)"])
+    finally:
+        worker.kill()
+        worker.wait()
+
+    (action,) = _report(metrics.path)["actions"]
+    assert action["children_cpu_user_seconds"] > 0.2
+    assert len(action["worker_peak_rss_bytes"]) == 1
+    assert action["worker_peak_rss_bytes"][0] > 0
+    assert action["parent_peak_rss_bytes"] > 0
+
+
+def test_read_counter_counts_s3_bytes(monkeypatch):
+    from s3fs import S3FileSystem
+
+    async def fake_cat_file(self, path, **kwargs):
+        return b"x" * 100
+
+    monkeypatch.setattr(S3FileSystem, "_cat_file", fake_cat_file)
+    counter = new_read_counter()
+    install_read_counter(counter)
+    install_read_counter(counter)  # idempotent: no double counting
+
+    asyncio.run(S3FileSystem._cat_file(None, "bucket/key"))
+    asyncio.run(S3FileSystem._cat_file(None, "bucket/key"))
+    assert counter.value == 200
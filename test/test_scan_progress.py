@@ -0,0 +1,106 @@
+"""Unit tests for scan_progress — resuming an interrupted storm search."""
+
+from __future__ import annotations
+
+import json
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from actions.scan_progress import (  # noqa: E402
+    SCAN_PROGRESS_FILE,
+    STATS_HEADER,
+    ScanProgress,
+    compact,
+    prepare_resume,
+)
+
+START = datetime(2020, 1, 1)
+PARAMS = {"storm_duration": 72, "min_precip_threshold": 0.0, "top_n_events": 2}
+
+
+def _plan(n: int) -> list[datetime]:
+    return [START + timedelta(days=i) for i in range(n)]
+
+
+def _row(d: datetime, mean: float) -> str:
+    return f"{d:%Y-%m-%dT%H},0.1,{mean},9.9,-90.5,35.25\n"
+
+
+def test_no_previous_scan_searches_everything(tmp_path):
+    plan = _plan(5)
+    assert prepare_resume(tmp_path / "storm-stats.csv", plan) == plan
+
+
+def test_resume_skips_scanned_dates(tmp_path):
+    plan = _plan(6)
+    csv = tmp_path / "storm-stats.csv"
+    csv.write_text(STATS_HEADER + "\n" + _row(plan[2], 1.0) + _row(plan[0], 2.0))
+    assert prepare_resume(csv, plan) == [plan[1], *plan[3:]]
+
+
+def test_resume_drops_torn_duplicate_and_foreign_rows(tmp_path):
+    plan = _plan(4)
+    csv = tmp_path / "storm-stats.csv"
+    csv.write_text(
+        STATS_HEADER
+        + "\n"
+        + _row(plan[0], 2.0)
+        + _row(plan[0], 2.0)  # same window written twice
+        + _row(datetime(1999, 1, 1), 5.0)  # not part of this scan
+        + _row(plan[1], 3.0)[:12]  # killed mid-write
+    )
+    assert prepare_resume(csv, plan) == plan[1:]
+    assert csv.read_text() == STATS_HEADER + "\n" + _row(plan[0], 2.0)
+
+
+def test_finished_scan_reruns_only_the_last_date(tmp_path):
+    plan = _plan(3)
+    csv = tmp_path / "storm-stats.csv"
+    csv.write_text(STATS_HEADER + "\n" + "".join(_row(d, 1.0) for d in plan))
+    assert prepare_resume(csv, plan) == [plan[-1]]
+    assert _row(plan[-1], 1.0) not in csv.read_text()
+
+
+def test_compact_keeps_every_scanned_date(tmp_path):
+    plan = _plan(3)
+    csv = tmp_path / "storm-stats.csv"
+    csv.write_text(
+        STATS_HEADER
+        + "\n"
+        + "".join(_row(d, 1.0) for d in plan)
+        + _row(datetime(1999, 1, 1), 5.0)
+    )
+    assert compact(csv, plan) == []
+    assert csv.read_text() == STATS_HEADER + "\n" + "".join(
+        _row(d, 1.0) for d in plan
+    )
+    assert compact(csv, _plan(4)) == _plan(4)[3:]
+
+
+def test_progress_snapshot_reports_running_top_n(tmp_path):
+    plan = _plan(10)
+    csv = tmp_path / "storm-stats.csv"
+    # plan[1] would be declustered by plan[0]; plan[5] is the runner-up.
+    csv.write_text(
+        STATS_HEADER
+        + "\n"
+        + _row(plan[0], 3.0)
+        + _row(plan[1], 2.5)
+        + _row(plan[5], 1.5)
+        + _row(plan[6], 0.5)
+    )
+    with ScanProgress(tmp_path, csv, plan, PARAMS, interval=3600):
+        pass
+
+    snapshot = json.loads((tmp_path / SCAN_PROGRESS_FILE).read_text())
+    assert snapshot["candidates"] == 10
+    assert snapshot["scanned"] == 4
+    assert snapshot["next_start"] == plan[2].isoformat()
+    assert [s["storm_date"] for s in snapshot["top_n"]] == [
+        plan[0].isoformat(),
+        plan[5].isoformat(),
+    ]
+    assert snapshot["top_n"][0]["max"] == 9.9
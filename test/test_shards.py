@@ -0,0 +1,56 @@
+"""Unit tests for shards — splitting the storm search over several jobs."""
+
+from __future__ import annotations
+
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from actions import shards  # noqa: E402
+
+PLAN = [datetime(1979, 2, 1) + timedelta(hours=6 * i) for i in range(1001)]
+
+
+@pytest.mark.parametrize("count", [1, 3, 7, 1001])
+def test_slices_cover_the_plan_once_in_order(count):
+    specs = [shards.parse(f"{k}/{count}") for k in range(1, count + 1)]
+    parts = [shards.select(shard, PLAN) for shard in specs]
+    assert [d for part in parts for d in part] == PLAN
+    assert max(map(len, parts)) - min(map(len, parts)) <= 1
+
+
+def test_range_includes_its_last_day():
+    shard = shards.parse("1979-02-03/1979-02-04")
+    dates = shards.select(shard, PLAN)
+    assert dates[0] == datetime(1979, 2, 3) and dates[-1] == datetime(1979, 2, 4, 18)
+    assert shard.name == "shard-19790203-19790204"
+
+
+@pytest.mark.parametrize("spec", ["0/3", "4/3", "3", "1979-02-04/1979-02-03", "x/y"])
+def test_invalid_specs(spec):
+    assert not shards.is_valid(spec)
+
+
+def test_merge_specs_from_count_or_list():
+    assert [s.name for s in shards.merge_specs("3")] == [
+        "shard-001-of-003",
+        "shard-002-of-003",
+        "shard-003-of-003",
+    ]
+    specs = shards.merge_specs('["1979-01-01/1999-12-31", "2000-01-01/2024-12-31"]')
+    assert [s.first.year for s in specs] == [1979, 2000]
+    assert not shards.merge_specs_valid("0")
+    assert not shards.merge_specs_valid("[]")
+    assert not shards.merge_specs_valid('["1/2", "oops"]')
+
+
+def test_shard_files_live_under_the_collection():
+    shard = shards.parse("2/8")
+    assert (
+        shards.rel_path("72hr-events", shard)
+        == "shards/72hr-events/shard-002-of-008.npz"
+    )
@@ -0,0 +1,82 @@
+"""Unit tests for shared_cube — one decoded AORC cube shared by the workers."""
+
+from __future__ import annotations
+
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from actions import shared_cube  # noqa: E402
+
+HOUR = timedelta(hours=1)
+START = datetime(2020, 6, 1)
+
+
+def _span(first: int, last: int) -> tuple[datetime, datetime]:
+    return START + first * HOUR, START + last * HOUR
+
+
+def test_spans_merge_when_they_overlap_or_touch():
+    spans = [_span(30, 40), _span(1, 10), _span(11, 20), _span(5, 8)]
+    assert shared_cube.merge_spans(spans) == [_span(1, 20), _span(30, 40)]
+
+
+def test_segments_bound_the_hours_of_a_cube():
+    spans = [_span(1, 240), _span(169, 408), _span(337, 576), _span(505, 744)]
+    assert shared_cube.segments(spans, 500) == [[0, 1], [2, 3]]
+    assert shared_cube.segments(spans, 100) == [[0], [1], [2], [3]]
+
+
+def test_failed_build_leaves_nothing_behind(tmp_path):
+    def load(first, last):
+        raise OSError("no such year")
+
+    with pytest.raises(OSError):
+        shared_cube.build(tmp_path, [_span(1, 24)], load)
+    assert list((tmp_path / shared_cube.SHARED_CUBE_DIRNAME).iterdir()) == []
+
+
+def test_workers_see_the_hours_their_own_load_returns(tmp_path, monkeypatch):
+    pytest.importorskip("rioxarray")
+    xr = pytest.importorskip("xarray")
+    monkeypatch.setattr(shared_cube, "SHARED_CUBE_FILL_HOURS", 7)
+
+    hours = np.arange(200)
+    rng = np.random.default_rng(0)
+    apcp = rng.gamma(1.5, 1.0, (len(hours), 6, 5)).astype(np.float32)
+    apcp[:, 0, 0] = np.nan  # outside the transposition domain
+    times = np.datetime64(START, "ns") + hours.astype("timedelta64[h]")
+    source = xr.Dataset(
+        {"APCP_surface": (("time", "latitude", "longitude"), apcp, {"units": "mm"})},
+        coords={
+            "time": times,
+            "latitude": 30 + np.arange(6) / 120,
+            "longitude": -95 + np.arange(5) / 120,
+        },
+    ).rio.write_crs("EPSG:4326")
+
+    def load(first, last):
+        return source.sel(time=slice(first, last))
+
+    spans = [_span(1, 24), _span(100, 130), _span(120, 150)]
+    path = shared_cube.build(tmp_path, spans, load)
+    cube = shared_cube.attach(str(path))
+    assert not cube.variables["APCP_surface"].flags.writeable
+
+    for first, last in (_span(1, 24), _span(100, 150), _span(110, 115)):
+        got = shared_cube.dataset(cube, first, last)["APCP_surface"]
+        want = source["APCP_surface"].sel(time=slice(first, last))
+        np.testing.assert_array_equal(got["time"].values, want["time"].values)
+        np.testing.assert_array_equal(got.values, want.values)
+        assert got.attrs["units"] == "mm"
+        assert got.rio.transform() == want.rio.transform()
+    # Hours between the spans were never loaded.
+    assert len(cube.times) == 24 + 51
+
+    shared_cube.remove(path)
+    assert not path.exists()
@@ -0,0 +1,93 @@
+"""Unit tests for shg_regrid — SHG regridding from a cached index map."""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from actions import shg_regrid  # noqa: E402
+
+SOURCE = (2, 3, 0.01, 0.0, -80.0, 0.0, 0.01, 35.0)
+IMAP = shg_regrid.IndexMap(
+    np.array([[5, 4], [-1, 0], [2, 2]], dtype=np.int32), 10, 20, SOURCE
+)
+
+
+def test_regrid_gathers_every_hour_at_once():
+    values = np.arange(2 * 2 * 3, dtype=np.float32).reshape(2, 2, 3)
+    values[1, 0, 2] = np.nan  # masked outside the transposition domain
+    out = shg_regrid.regrid(values, IMAP)
+
+    assert out.shape == (2, 3, 2) and out.dtype == np.float32
+    np.testing.assert_array_equal(out[0], [[5, 4], [np.nan, 0], [2, 2]])
+    np.testing.assert_array_equal(out[1], [[11, 10], [np.nan, 6], [np.nan, np.nan]])
+
+
+def test_index_map_round_trips_for_its_source_grid(tmp_path):
+    path = shg_regrid.cached_path(tmp_path, "ab" * 32, 4)
+    shg_regrid.write(path, IMAP)
+
+    assert path.parent.name == shg_regrid.SHG_REGRID_DIRNAME
+    stored = shg_regrid.read(path, SOURCE)
+    np.testing.assert_array_equal(stored.index, IMAP.index)
+    assert (stored.lower_x, stored.lower_y) == (10, 20)
+    # A differently clipped AORC grid needs a map of its own.
+    assert shg_regrid.read(path, (3, *SOURCE[1:])) is None
+
+
+def test_unreadable_index_map_is_ignored(tmp_path):
+    path = tmp_path / "broken.npz"
+    path.write_bytes(b"not an archive")
+    assert shg_regrid.read(path, SOURCE) is None
+
+
+def _aorc_stack(hours: int = 6):
+    """A clipped AORC-like stack: float32, 1/120 degree cells, latitude
+    ascending as in the zarr store, NaN outside an ellipse."""
+    pytest.importorskip("rioxarray")
+    xr = pytest.importorskip("xarray")
+
+    lon = -95.0 + (np.arange(40) + 0.5) / 120
+    lat = 30.0 + (np.arange(30) + 0.5) / 120
+    rng = np.random.default_rng(0)
+    values = rng.gamma(1.5, 1.0, (hours, lat.size, lon.size)).astype(np.float32)
+    yy, xx = np.meshgrid(np.linspace(-1, 1, lat.size), np.linspace(-1, 1, lon.size))
+    values[:, (xx.T**2 + yy.T**2) > 1] = np.nan
+    times = np.datetime64("2020-06-01T01") + np.arange(hours).astype("timedelta64[h]")
+    data = xr.DataArray(
+        values,
+        coords={"time": times, "latitude": lat, "longitude": lon},
+        dims=("time", "latitude", "longitude"),
+    )
+    data = data.rio.set_spatial_dims(x_dim="longitude", y_dim="latitude")
+    return data.rio.write_crs("EPSG:4326")
+
+
+@pytest.mark.parametrize("resolution_km", [1, 2, 4])
+def test_index_map_matches_write_to_dss_reprojection(resolution_km):
+    """The gather reproduces stormhub's nearest-neighbour rio.reproject."""
+    data = _aorc_stack()
+    rasterio = pytest.importorskip("rasterio")
+    pytest.importorskip("stormhub.met.consts")
+    from stormhub.met.consts import KM_TO_M_CONVERSION_FACTOR
+    from stormhub.utils import get_shg_reprojection_kwargs
+
+    kwargs, lower_x, lower_y = get_shg_reprojection_kwargs(
+        data,
+        resolution_km * KM_TO_M_CONVERSION_FACTOR,
+        rasterio.enums.Resampling.nearest,
+    )
+    expected = data.rio.reproject(**kwargs)
+
+    imap = shg_regrid.build(data, resolution_km)
+    values = data.transpose("time", data.rio.y_dim, data.rio.x_dim).values
+    out = shg_regrid.regrid(values, imap)
+
+    assert (imap.lower_x, imap.lower_y) == (lower_x, lower_y)
+    assert out.shape == expected.shape
+    assert np.array_equal(out, expected.values, equal_nan=True)
@@ -0,0 +1,59 @@
+"""Unit tests for specific_dates — collections built from given start times."""
+
+from __future__ import annotations
+
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from actions import specific_dates  # noqa: E402
+from actions.storm_stream import StormStat  # noqa: E402
+
+
+def _row(date: datetime, mean: float) -> StormStat:
+    return StormStat(date, 0.5, mean, 9.0, -90.5, 35.25)
+
+
+def test_from_attrs_accepts_both_date_forms():
+    attrs = {"specific_dates": '["2005-08-28T00:00:00", "2017-08-26T12"]'}
+    assert specific_dates.from_attrs(attrs) == [
+        datetime(2005, 8, 28),
+        datetime(2017, 8, 26, 12),
+    ]
+    assert specific_dates.from_attrs({}) == []
+
+
+def test_every_date_is_ranked_even_when_they_overlap():
+    # A day apart and under any threshold: stormhub would drop all but one.
+    rows = [
+        _row(datetime(2017, 8, 26), 0.1),
+        _row(datetime(2017, 8, 27), 0.3),
+        _row(datetime(2005, 8, 28), 0.2),
+    ]
+    records = specific_dates.rank(rows)
+    assert [r["storm_date"] for r in records] == [
+        datetime(2017, 8, 27),
+        datetime(2005, 8, 28),
+        datetime(2017, 8, 26),
+    ]
+    assert [r["por_rank"] for r in records] == [1, 2, 3]
+    assert [r["annual_rank"] for r in records] == [1, 1, 2]
+
+
+def test_ranked_storms_csv_matches_stormhub_columns(tmp_path):
+    path = tmp_path / "72hr-events" / specific_dates.RANKED_STORMS_FILE
+    specific_dates.write_ranked(
+        path, specific_dates.rank([_row(datetime(2005, 8, 28), 2.5)])
+    )
+    assert path.read_text().splitlines() == [
+        "storm_date,mean,min,max,por_rank,annual_rank",
+        "2005-08-28T00,2.5,0.5,9.0,1,1",
+    ]
+
+
+def test_windows_cover_the_hours_each_storm_reads():
+    assert specific_dates.windows([datetime(2020, 12, 31, 12)], 24) == [
+        (datetime(2020, 12, 31, 13), datetime(2021, 1, 1, 12))
+    ]
@@ -0,0 +1,79 @@
+"""Unit tests for stats_index — reusing a previous scan's storm statistics."""
+
+from __future__ import annotations
+
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from actions import stats_index  # noqa: E402
+from actions.scan_progress import STATS_HEADER, prepare_resume  # noqa: E402
+from actions.storm_stream import StormStat, parse_stats_row  # noqa: E402
+
+START = datetime(2020, 1, 1)
+GEOMETRY = "a" * 64
+
+
+def _plan(n: int) -> list[datetime]:
+    return [START + timedelta(days=i) for i in range(n)]
+
+
+def _rows(plan: list[datetime]) -> list[StormStat]:
+    return [
+        StormStat(d, 0.1 * i, 1.0 + i / 3, 9.87, -90.123456789, 35.25)
+        for i, d in enumerate(plan)
+    ]
+
+
+def test_round_trip(tmp_path):
+    rows = _rows(_plan(5))
+    path = tmp_path / stats_index.INDEX_FILE
+    assert stats_index.write(path, reversed(rows), GEOMETRY, 72) == 5
+    assert stats_index.read(path, GEOMETRY, 72) == rows
+
+
+def test_other_geometry_or_duration_is_not_reused(tmp_path):
+    path = tmp_path / stats_index.INDEX_FILE
+    stats_index.write(path, _rows(_plan(2)), GEOMETRY, 72)
+    assert stats_index.read(path, "b" * 64, 72) is None
+    assert stats_index.read(path, GEOMETRY, 24) is None
+    assert stats_index.read(tmp_path / "missing.npz", GEOMETRY, 72) is None
+
+
+def test_unreadable_index_is_ignored(tmp_path):
+    path = tmp_path / stats_index.INDEX_FILE
+    path.write_bytes(b"not an archive")
+    assert stats_index.read(path, GEOMETRY, 72) is None
+
+
+def test_save_indexes_the_csv_and_keeps_a_cached_copy(tmp_path):
+    plan = _plan(3)
+    csv = tmp_path / "catalog" / "72hr-events" / "storm-stats.csv"
+    stats_index.seed(csv, _rows(plan), plan)
+    stats_index.save(csv, tmp_path, "72hr-events", GEOMETRY, 72)
+
+    cached = stats_index.cached_path(tmp_path, "72hr-events")
+    assert cached.parent.name == stats_index.STATS_INDEX_DIRNAME
+    for path in (csv.with_name(stats_index.INDEX_FILE), cached):
+        assert stats_index.read(path, GEOMETRY, 72) == _rows(plan)
+
+
+def test_full_index_leaves_one_window_to_scan(tmp_path):
+    """A new N or threshold over the same range only re-ranks: prepare_resume
+    finds every start time scanned and leaves new_collection the last one."""
+    plan = _plan(6)
+    csv = tmp_path / "storm-stats.csv"
+    assert stats_index.seed(csv, _rows(_plan(10)), plan) == 6
+    assert prepare_resume(csv, plan) == plan[-1:]
+    lines = csv.read_text().splitlines()
+    assert lines[0] == STATS_HEADER
+    assert [parse_stats_row(line) for line in lines[1:]] == _rows(plan)[:-1]
+
+
+def test_partial_index_scans_only_what_it_lacks(tmp_path):
+    plan = _plan(6)
+    csv = tmp_path / "storm-stats.csv"
+    stats_index.seed(csv, _rows(plan[:4]), plan)
+    assert prepare_resume(csv, plan) == plan[4:]
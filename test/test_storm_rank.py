@@ -16,7 +16,13 @@ from pathlib import Path
 SRC = Path(__file__).resolve().parent.parent / "src"
 sys.path.insert(0, str(SRC))
 
-from actions import dss_filename, parse_storm_datetime, storm_rank  # noqa: E402
+from actions import (  # noqa: E402
+    dss_filename,
+    parse_storm_datetime,
+    storm_durations,
+    storm_key,
+    storm_rank,
+)
 
 
 class _Item:
@@ -103,3 +109,17 @@ def test_neither_producer_reinlines_the_format():
     for name in ("convert_to_dss.py", "create_grid_file.py"):
         source = (SRC / "actions" / name).read_text()
         assert "hr_st1_r" not in source, f"{name} re-inlines the DSS format; call dss_filename()"
+
+
+def test_storm_durations_parse_one_or_a_list():
+    assert storm_durations({}) == [72]
+    assert storm_durations({"storm_duration": "48"}) == [48]
+    assert storm_durations({"storm_duration": "96, 24,48,24"}) == [24, 48, 96]
+
+
+def test_storm_key_qualifies_rank_only_with_several_durations():
+    """Each duration's collection ranks from 1; rank 3 of the 24 h and of the
+    72 h collection are different storms and must not share a checkpoint entry.
+    """
+    assert storm_key(3, 72, [72]) == "3"
+    assert storm_key(3, 24, [24, 72]) != storm_key(3, 72, [24, 72])
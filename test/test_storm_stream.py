@@ -0,0 +1,143 @@
+"""Unit tests for storm_stream — mid-scan finality of ranked storms.
+
+The oracle is stormhub's own StormAnalyzer: whatever the tracker calls final
+must be in the top-N stormhub ranks once the whole scan is in.
+"""
+
+from __future__ import annotations
+
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from actions.storm_stream import FinalityTracker, StatsTail  # noqa: E402
+
+DURATION = 72
+START = datetime(2020, 1, 1)
+
+
+def _plan(days: int, every_n_hours: int = 24) -> list[datetime]:
+    return [START + timedelta(hours=h) for h in range(0, days * 24, every_n_hours)]
+
+
+def _stormhub_top_n(tmp_path, means: dict[datetime, float], top_n: int) -> list[datetime]:
+    from stormhub.met.analysis import StormAnalyzer
+
+    csv = tmp_path / "storm-stats.csv"
+    lines = ["storm_date,min,mean,max,x,y"]
+    lines += [f"{d:%Y-%m-%dT%H},0,{m},0,0,0" for d, m in means.items()]
+    csv.write_text("\n".join(lines) + "\n")
+    ranked = StormAnalyzer(str(csv), 0.0, DURATION).rank_and_filter_storms()
+    top = ranked[ranked["por_rank"] <= top_n]
+    return [d.to_pydatetime() for d in top["storm_date"].astype("datetime64[ns]")]
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_completed_scan_matches_stormhub_ranking(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    plan = _plan(120)
+    means = {d: float(rng.gamma(2.0, 1.0)) for d in plan}
+    tracker = FinalityTracker(plan, DURATION, 5, 0.0, speculation=0)
+    for d in rng.permutation(len(plan)):
+        tracker.observe(plan[d], means[plan[d]])
+    assert tracker.newly_final() == _stormhub_top_n(tmp_path, means, 5)
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_exact_finality_is_never_wrong(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    plan = _plan(90, every_n_hours=12)
+    means = {d: float(rng.gamma(1.5, 1.0)) for d in plan}
+    tracker = FinalityTracker(plan, DURATION, 4, 0.0, speculation=0)
+
+    emitted_mid_scan: list[datetime] = []
+    for d in plan[:-1]:
+        tracker.observe(d, means[d])
+        emitted_mid_scan += tracker.newly_final()
+
+    final = set(_stormhub_top_n(tmp_path, means, 4))
+    assert set(emitted_mid_scan) <= final
+    tracker.observe(plan[-1], means[plan[-1]])
+    assert set(emitted_mid_scan + tracker.newly_final()) == final
+
+
+def test_specific_dates_are_final_as_soon_as_settled():
+    # Three far-apart forced dates can never push each other out of a top-5.
+    plan = [datetime(2001, 5, 1), datetime(2005, 7, 9), datetime(2010, 3, 3)]
+    tracker = FinalityTracker(plan, DURATION, 5, 0.0, speculation=0)
+    tracker.observe(plan[0], 3.0)
+    tracker.observe(plan[1], 1.0)
+    assert tracker.newly_final() == [plan[0]]
+
+
+def test_unscanned_neighbour_blocks_finality():
+    # A bigger storm one step later could still block the current leader.
+    plan = _plan(30)
+    tracker = FinalityTracker(plan, DURATION, 1, 0.0, speculation=0)
+    for d in plan[:10]:
+        tracker.observe(d, 1.0 if d != plan[8] else 5.0)
+    assert plan[8] not in tracker.newly_final()
+
+
+def test_tied_neighbours_are_not_final():
+    # stormhub may accept either of two tied neighbours, and only the earlier
+    # one leaves room for the storm after them.
+    plan = _plan(30)
+    means = dict.fromkeys(plan, 0.5)
+    means[plan[10]] = means[plan[13]] = 3.0
+    means[plan[17]] = 2.0
+    means[plan[2]] = 4.0
+    tracker = FinalityTracker(plan, DURATION, 3, 0.0, speculation=0)
+    for d in plan:
+        tracker.observe(d, means[d])
+    assert tracker.done
+    assert tracker.newly_final() == [plan[2]]
+
+
+def test_results_out_of_order_wait_for_the_gap():
+    plan = _plan(10)
+    tracker = FinalityTracker(plan, DURATION, 3, 0.0, speculation=0)
+    for d in plan[1:]:
+        tracker.observe(d, 2.0)
+    assert not tracker.done
+    assert tracker.newly_final() == []  # cursor is stuck on plan[0]
+
+
+def test_threshold_excludes_candidates():
+    plan = _plan(20)
+    tracker = FinalityTracker(plan, DURATION, 5, 1.0, speculation=0)
+    for d in plan:
+        tracker.observe(d, 0.5)
+    assert tracker.done
+    assert tracker.newly_final() == []
+
+
+def test_memory_is_bounded_by_top_n():
+    rng = np.random.default_rng(3)
+    plan = _plan(365, every_n_hours=1)
+    tracker = FinalityTracker(plan, DURATION, 3, 0.0, speculation=0)
+    for d in plan[:-1]:
+        tracker.observe(d, float(rng.gamma(1.5, 1.0)))
+        tracker.newly_final()
+    kept = len(tracker._settled.rows()) + len(tracker._pending)
+    assert kept <= tracker._settled.capacity + 2 * (DURATION + 24) < len(plan) // 10
+
+
+def test_stats_tail_reads_complete_lines_only(tmp_path):
+    csv = tmp_path / "storm-stats.csv"
+    csv.write_text("storm_date,min,mean,max,x,y\n2020-01-01T00,0,1.5,2,0,0\n2020-01-02T00,0,")
+    tail = StatsTail(csv)
+    assert tail.read_new() == [(datetime(2020, 1, 1), 1.5)]
+    with open(csv, "a") as f:
+        f.write("2.5,3,0,0\n")
+    assert tail.read_new() == [(datetime(2020, 1, 2), 2.5)]
+    assert tail.read_new() == []
+
+
+def test_stats_tail_missing_file(tmp_path):
+    assert StatsTail(tmp_path / "absent.csv").read_new() == []
@@ -0,0 +1,95 @@
+"""Unit tests for TopNSelector — bounded-memory streaming storm ranking.
+
+The oracle replays stormhub's StormAnalyzer.rank_and_filter_storms over every
+candidate: sort by mean, then try_block_period on an hourly mask spanning the
+candidates over the threshold.
+"""
+
+from __future__ import annotations
+
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from actions.storm_stream import RANK_BUFFER_HOURS, StormStat, TopNSelector  # noqa: E402
+
+DURATION = 24
+START = datetime(2020, 1, 1)
+HOUR = timedelta(hours=1)
+
+
+def _rows(rng: random.Random, hours: int, every_n_hours: int = 1) -> list[StormStat]:
+    return [
+        StormStat(START + h * HOUR, 0.0, round(rng.gammavariate(2.0, 1.0), 1), 0, 0, 0)
+        for h in range(0, hours, every_n_hours)
+    ]
+
+
+def _stormhub_ranking(rows: list[StormStat], threshold: float) -> list[StormStat]:
+    rows = [row for row in rows if row.mean >= threshold]
+    first = min(row.storm_date for row in rows)
+    last = max(row.storm_date for row in rows)
+    available = set()
+    d = first
+    while d < last:
+        available.add(d)
+        d += HOUR
+    h = timedelta(hours=DURATION + RANK_BUFFER_HOURS)
+    ranked = []
+    for row in sorted(rows, key=lambda r: (-r.mean, r.storm_date)):
+        start, end = row.storm_date, row.storm_date + h
+        if start in available and end in available:
+            d = start
+            while d < end:
+                available.discard(d)
+                d += HOUR
+            ranked.append(row)
+    return ranked
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_any_arrival_order_matches_stormhub(seed):
+    rng = random.Random(seed)
+    rows = _rows(rng, 24 * 60)
+    expected = _stormhub_ranking(rows, 1.0)[:5]
+
+    selector = TopNSelector(DURATION, 5, 1.0)
+    rng.shuffle(rows)
+    for row in rows:
+        selector.add(row)
+    assert selector.ranked() == expected
+
+
+def test_memory_is_bounded_by_top_n():
+    rows = _rows(random.Random(7), 24 * 365)
+    selector = TopNSelector(DURATION, 3, 0.0)
+    for row in rows:
+        selector.add(row)
+    assert len(selector._heap) == selector.capacity < len(rows) // 10
+    assert selector.ranked() == _stormhub_ranking(rows, 0.0)[:3]
+
+
+def test_tail_is_kept_only_in_a_provisional_ranking():
+    # The biggest window ends after the latest candidate: stormhub drops it.
+    rows = [
+        StormStat(START, 0, 1.0, 0, 0, 0),
+        StormStat(START + 100 * HOUR, 0, 5.0, 0, 0, 0),
+        StormStat(START + 110 * HOUR, 0, 0.5, 0, 0, 0),
+    ]
+    selector = TopNSelector(DURATION, 2, 0.0)
+    for row in rows:
+        selector.add(row)
+    assert selector.ranked() == [rows[0]]
+    assert selector.ranked(drop_tail=False) == [rows[1], rows[0]]
+
+
+def test_repeated_start_time_keeps_the_first_row():
+    selector = TopNSelector(DURATION, 2, 0.0)
+    selector.add(StormStat(START, 0, 1.0, 0, 0, 0))
+    selector.add(StormStat(START, 0, 2.0, 0, 0, 0))
+    assert [row.mean for row in selector.ranked(drop_tail=False)] == [1.0]
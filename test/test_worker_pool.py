@@ -0,0 +1,129 @@
+"""Unit tests for worker_pool — the run-wide warm spawn pool."""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from worker_pool import SharedPool  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def pool():
+    shared = SharedPool(2)
+    shared.warm()
+    yield shared
+    shared.shutdown()
+
+
+def test_workers_survive_between_tasks(pool):
+    first = {pool.submit(os.getpid).result() for _ in range(6)}
+    second = {pool.submit(os.getpid).result() for _ in range(6)}
+    assert os.getpid() not in first
+    assert len(first | second) <= pool.max_workers
+
+
+def test_run_bounded_yields_every_result(pool):
+    calls = [(2, n) for n in range(10)]
+    results = dict(pool.run_bounded(pow, calls, limit=1))
+    assert results == {(2, n): 2**n for n in range(10)}
+
+
+def test_borrowed_pool_exit_leaves_shared_pool_running(pool):
+    with pool.borrow() as borrowed:
+        future = borrowed.submit(pow, 3, 2)
+    assert future.result() == 9
+    assert pool.submit(pow, 2, 3).result() == 8
+
+
+def test_borrowed_shutdown_cancels_tasks_waiting_for_a_slot(pool):
+    pool.set_limit(1)
+    try:
+        borrowed = pool.borrow()
+        running = borrowed.submit(time.sleep, 0.3)
+        queued = borrowed.submit(pow, 2, 5)
+        borrowed.shutdown(wait=True, cancel_futures=True)
+        assert queued.cancelled()
+        assert running.done() and not running.cancelled()
+        assert pool.submit(pow, 2, 2).result() == 4
+    finally:
+        pool.set_limit(pool.max_workers)
+
+
+def test_worker_pids_are_the_workers_running_tasks(pool):
+    ran = {pool.submit(os.getpid).result() for _ in range(6)}
+    pids = set(pool.worker_pids())
+    assert ran <= pids
+    assert len(pids) <= pool.max_workers and os.getpid() not in pids
+
+
+def test_lend_to_stormhub_patches_and_restores(pool):
+    from stormhub.met import storm_catalog
+
+    original = storm_catalog.ProcessPoolExecutor
+    with pool.lend_to_stormhub():
+        with storm_catalog.ProcessPoolExecutor(max_workers=8) as executor:
+            assert executor.submit(pow, 5, 2).result() == 25
+    assert storm_catalog.ProcessPoolExecutor is original
+    assert pool.submit(pow, 1, 1).result() == 1
+
+
+def _die_once(marker: str) -> int:
+    # Kill the worker the first time, as the OOM killer would.
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(9)
+    return 42
+
+
+def test_task_is_resubmitted_after_its_worker_dies(pool, tmp_path):
+    assert pool.submit(_die_once, str(tmp_path / "died")).result(timeout=60) == 42
+    assert pool.submit(pow, 2, 2).result() == 4
+
+
+def test_task_that_keeps_killing_workers_fails(pool, monkeypatch):
+    import worker_pool
+
+    monkeypatch.setattr(worker_pool, "MAX_TASK_RETRIES", 1)
+    with pytest.raises(BrokenProcessPool):
+        pool.submit(os._exit, 9).result(timeout=60)
+
+
+def test_limit_serializes_tasks(pool):
+    pool.set_limit(1)
+    try:
+        t0 = time.monotonic()
+        futures = [pool.submit(time.sleep, 0.3) for _ in range(3)]
+        for future in futures:
+            future.result()
+        assert time.monotonic() - t0 >= 0.85
+        assert pool.in_flight == 0
+    finally:
+        pool.set_limit(pool.max_workers)
+
+
+def test_hook_reads_installs_the_workers_hooks_here(monkeypatch):
+    import aorc_cache
+    import run_metrics
+
+    installed = []
+    monkeypatch.setattr(
+        run_metrics, "install_read_counter", lambda c: installed.append(("count", c))
+    )
+    monkeypatch.setattr(
+        aorc_cache, "install_chunk_cache", lambda c: installed.append(("cache", c))
+    )
+    shared = SharedPool(1, read_counter="counter", chunk_cache="cache")
+    try:
+        shared.hook_reads()
+    finally:
+        shared.shutdown()
+    # The counter first: a cache hit reads nothing from S3.
+    assert installed == [("count", "counter"), ("cache", "cache")]
@@ -1,4 +1,4 @@
-"""Unit tests for worker_sizing.resolve_num_workers."""
+"""Unit tests for worker_sizing — the pool size from the payload and cgroup."""
 
 from __future__ import annotations
 
@@ -15,6 +15,13 @@ import worker_sizing  # noqa: E402
 @pytest.fixture(autouse=True)
 def _clean_env(monkeypatch):
     monkeypatch.delenv("CC_NUM_WORKERS", raising=False)
+    monkeypatch.delenv("CC_THREADS_PER_WORKER", raising=False)
+    monkeypatch.setattr(worker_sizing, "_cgroup_cpus", lambda: 16)
+
+
+def _num_workers(attrs: dict) -> int:
+    """The pool size ``WorkerMemoryModel`` starts from."""
+    return worker_sizing.WorkerMemoryModel(attrs).workers()
 
 
 @pytest.fixture
@@ -24,36 +31,36 @@ def no_cgroup(monkeypatch):
 
 def test_payload_attribute_wins(monkeypatch, no_cgroup):
     monkeypatch.setenv("CC_NUM_WORKERS", "7")
-    assert worker_sizing.resolve_num_workers({"num_workers": "3"}) == 3
+    assert _num_workers({"num_workers": "3"}) == 3
 
 
 def test_payload_attribute_floors_at_one(no_cgroup):
-    assert worker_sizing.resolve_num_workers({"num_workers": "0"}) == 1
+    assert _num_workers({"num_workers": "0"}) == 1
 
 
 def test_env_used_when_no_attribute(monkeypatch, no_cgroup):
     monkeypatch.setenv("CC_NUM_WORKERS", "5")
-    assert worker_sizing.resolve_num_workers({}) == 5
+    assert _num_workers({}) == 5
 
 
 def test_empty_attribute_falls_through(no_cgroup):
-    assert worker_sizing.resolve_num_workers({"num_workers": ""}) == 1
+    assert _num_workers({"num_workers": ""}) == 1
 
 
 def test_auto_sizes_from_cgroup(monkeypatch):
     monkeypatch.setattr(worker_sizing, "_cgroup_mem_limit_mb", lambda: 15000)
     # 15000 // 3072 == 4 — with thread caps in the image, workers fit
     # memory only, independent of visible CPU count.
-    assert worker_sizing.resolve_num_workers({}) == 4
+    assert _num_workers({}) == 4
 
 
 def test_auto_floors_at_one_when_budget_below_per_worker(monkeypatch):
     monkeypatch.setattr(worker_sizing, "_cgroup_mem_limit_mb", lambda: 2048)
-    assert worker_sizing.resolve_num_workers({}) == 1
+    assert _num_workers({}) == 1
 
 
 def test_fallback_to_one_when_cgroup_unset(no_cgroup):
-    assert worker_sizing.resolve_num_workers({}) == 1
+    assert _num_workers({}) == 1
 
 
 def _patch_cgroup_read(monkeypatch, contents):
@@ -89,3 +96,188 @@ def test_cgroup_missing_returns_none(monkeypatch):
 def test_cgroup_malformed_returns_none(monkeypatch):
     _patch_cgroup_read(monkeypatch, "garbage")
     assert worker_sizing._cgroup_mem_limit_mb() is None
+
+
+def test_split_workers_shares_one_budget():
+    assert worker_sizing.split_workers(6, 0.5) == (3, 3)
+    assert worker_sizing.split_workers(5, 0.5) == (3, 2)
+    assert sum(worker_sizing.split_workers(9, 0.3)) == 9
+
+
+def test_split_workers_keeps_one_search_worker():
+    assert worker_sizing.split_workers(2, 0.9) == (1, 1)
+
+
+def test_split_workers_cannot_split_one():
+    assert worker_sizing.split_workers(1) == (1, 0)
+
+
+@pytest.fixture
+def cgroup_15g(monkeypatch):
+    monkeypatch.setattr(worker_sizing, "_cgroup_mem_limit_mb", lambda: 15000)
+    monkeypatch.setattr(worker_sizing, "_cgroup_cpus", lambda: 8)
+
+
+TRANSPOSITION = Path(__file__).resolve().parent / "transposition-domain.geojson"
+
+
+def test_geometry_bbox_reads_lon_lat_extent():
+    west, south, east, north = worker_sizing.geometry_bbox(TRANSPOSITION)
+    assert -125 < west < east < -119
+    assert 42 < south < north < 50
+
+
+def test_geometry_bbox_rejects_projected_coordinates(tmp_path):
+    path = tmp_path / "shg.geojson"
+    path.write_text('{"type": "Polygon", "coordinates": [[[-2e6, 2e6], [0, 0]]]}')
+    assert worker_sizing.geometry_bbox(path) is None
+
+
+def test_model_starts_from_static_prior(cgroup_15g):
+    model = worker_sizing.WorkerMemoryModel({})
+    assert not model.pinned
+    assert model.workers() == 4  # 15000 // PER_WORKER_MB
+    assert model.threads == 2  # 8 CPUs over 4 workers
+    assert model.max_workers == 4  # no more than 8 CPUs // 2 threads
+
+
+def test_model_predicts_from_domain_and_duration(cgroup_15g):
+    model = worker_sizing.WorkerMemoryModel({})
+    small = model.predict(TRANSPOSITION, 24, baseline_mb=500)
+    large = model.predict(TRANSPOSITION, 240, baseline_mb=500)
+    assert 500 < small < large
+    assert model.per_worker_mb == large
+    assert model.workers() == max(1, 15000 // large)
+
+
+def test_model_counts_the_cumsum_search_block(cgroup_15g, tmp_path):
+    # 300 x 300 AORC cells; one task scores 168 hourly 72 h windows.
+    domain = tmp_path / "domain.geojson"
+    domain.write_text(
+        '{"type": "Polygon", "coordinates": [[[-100, 40], [-97.5, 42.5]]]}'
+    )
+    model = worker_sizing.WorkerMemoryModel({})
+    window = model.predict(domain, 72, baseline_mb=500)
+    block = model.predict(
+        domain, 72, baseline_mb=500, block_hours=168 + 72, block_windows=168
+    )
+    assert window < block
+    engine_mb = 624 + 300 * 300 * 240 * 4 / 2**20  # measured arrays + input
+    assert block >= (500 + engine_mb) * worker_sizing.WORKER_HEADROOM
+
+    # Attached to a shared cube, the block's hours are not the worker's own.
+    shared = model.predict(
+        domain,
+        72,
+        baseline_mb=500,
+        block_hours=168 + 72,
+        block_windows=168,
+        shared_input=True,
+    )
+    input_mb = 300 * 300 * 240 * worker_sizing.BLOCK_INPUT_COPIES * 4 / 2**20
+    assert abs(shared - (block - input_mb * worker_sizing.WORKER_HEADROOM)) <= 1
+
+
+def test_model_measurement_replaces_prediction(cgroup_15g, monkeypatch):
+    monkeypatch.setenv("CC_THREADS_PER_WORKER", "1")
+    model = worker_sizing.WorkerMemoryModel({})
+    model.predict(TRANSPOSITION, 72, baseline_mb=500)
+    assert model.observe(2400) == 15000 // round(2400 * worker_sizing.WORKER_HEADROOM)
+    assert model.calibrated
+    # A later prediction no longer overrides what was measured.
+    model.predict(TRANSPOSITION, 240, baseline_mb=500)
+    assert model.per_worker_mb == round(2400 * worker_sizing.WORKER_HEADROOM)
+
+
+def test_model_measurement_clamped_to_max_workers(cgroup_15g, monkeypatch):
+    monkeypatch.setenv("CC_THREADS_PER_WORKER", "1")
+    model = worker_sizing.WorkerMemoryModel({})
+    assert model.observe(100) == model.max_workers
+
+
+def test_model_pinned_by_operator_override(cgroup_15g):
+    model = worker_sizing.WorkerMemoryModel({"num_workers": "3"})
+    assert model.pinned
+    assert model.max_workers == 3
+    model.predict(TRANSPOSITION, 72, baseline_mb=500)
+    assert model.observe(100) == 3
+
+
+@pytest.fixture
+def cgroup_files(monkeypatch, tmp_path):
+    """Point every cgroup path at ``tmp_path``; returns a writer for them."""
+    names = [
+        "CGROUP_MEM_MAX",
+        "CGROUP_MEM_HIGH",
+        "CGROUP_SWAP_MAX",
+        "CGROUP_CPU_MAX",
+        "CGROUP_V1_MEM_LIMIT",
+        "CGROUP_V1_MEMSW_LIMIT",
+        "CGROUP_V1_CPU_QUOTA",
+        "CGROUP_V1_CPU_PERIOD",
+    ]
+    for name in names:
+        monkeypatch.setattr(worker_sizing, name, str(tmp_path / name))
+
+    def write(name: str, value: str) -> None:
+        (tmp_path / name).write_text(value + "\n")
+
+    return write
+
+
+def test_memory_high_lowers_the_budget(cgroup_files):
+    cgroup_files("CGROUP_MEM_MAX", str(16 * 1024**3))
+    cgroup_files("CGROUP_MEM_HIGH", str(12 * 1024**3))
+    assert worker_sizing._cgroup_mem_limit_mb() == 12 * 1024
+
+
+def test_cgroup_v1_memory_and_swap(cgroup_files):
+    cgroup_files("CGROUP_V1_MEM_LIMIT", str(8 * 1024**3))
+    cgroup_files("CGROUP_V1_MEMSW_LIMIT", str(10 * 1024**3))
+    assert worker_sizing._cgroup_mem_limit_mb() == 8 * 1024
+    assert worker_sizing._cgroup_swap_mb() == 2 * 1024
+
+
+def test_cgroup_v2_swap(cgroup_files):
+    cgroup_files("CGROUP_SWAP_MAX", "0")
+    assert worker_sizing._cgroup_swap_mb() == 0
+    cgroup_files("CGROUP_SWAP_MAX", "max")
+    assert worker_sizing._cgroup_swap_mb() is None
+
+
+@pytest.mark.parametrize(
+    "files, quota",
+    [
+        ({"CGROUP_CPU_MAX": "400000 100000"}, 4.0),
+        ({"CGROUP_CPU_MAX": "max 100000"}, None),
+        ({"CGROUP_V1_CPU_QUOTA": "250000", "CGROUP_V1_CPU_PERIOD": "100000"}, 2.5),
+        ({"CGROUP_V1_CPU_QUOTA": "-1", "CGROUP_V1_CPU_PERIOD": "100000"}, None),
+        ({}, None),
+    ],
+)
+def test_cpu_quota(cgroup_files, files, quota):
+    for name, value in files.items():
+        cgroup_files(name, value)
+    assert worker_sizing._cpu_quota() == quota
+
+
+def test_auto_size_bounded_by_cpus(monkeypatch):
+    monkeypatch.setattr(worker_sizing, "_cgroup_mem_limit_mb", lambda: 64000)
+    monkeypatch.setattr(worker_sizing, "_cgroup_cpus", lambda: 16)
+    assert _num_workers({}) == 16
+
+
+def test_threads_fill_cpus_memory_leaves_idle(monkeypatch):
+    assert worker_sizing.threads_per_worker(16, 4) == 4
+    assert worker_sizing.threads_per_worker(16, 1) == worker_sizing.MAX_THREADS_PER_WORKER
+    assert worker_sizing.threads_per_worker(16, 16) == 1
+    monkeypatch.setenv("CC_THREADS_PER_WORKER", "3")
+    assert worker_sizing.threads_per_worker(16, 16) == 3
+
+
+def test_thread_env():
+    assert worker_sizing.thread_env(1)["DASK_SCHEDULER"] == "synchronous"
+    env = worker_sizing.thread_env(4)
+    assert env["OMP_NUM_THREADS"] == "4"
+    assert env["DASK_SCHEDULER"] == "threads"
+    assert env["DASK_NUM_WORKERS"] == "4"